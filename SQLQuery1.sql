@@ -23,6 +23,9 @@ IF OBJECT_ID('dbo.Users', 'U') IS NOT NULL
 
 IF OBJECT_ID('dbo.Inventory', 'U') IS NOT NULL
     DROP TABLE dbo.Inventory;
+
+IF OBJECT_ID('dbo.DailyPatientStats', 'U') IS NOT NULL
+    DROP TABLE dbo.DailyPatientStats;
 GO
 
 -- ========================================
@@ -158,6 +161,22 @@ CREATE TABLE Inventory (
 );
 GO
 
+-- ========================================
+-- Create DailyPatientStats Table (Per-day Patient Counters)
+-- Kept in step with Patients by the app in the same transaction;
+-- verify with: python -m models.daily_stats [--fix]
+-- ========================================
+CREATE TABLE DailyPatientStats (
+    StatDate DATE NOT NULL PRIMARY KEY,
+    Patients INT NOT NULL DEFAULT 0,
+    Revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    MalePatients INT NOT NULL DEFAULT 0,
+    FemalePatients INT NOT NULL DEFAULT 0,
+    OtherPatients INT NOT NULL DEFAULT 0,
+    Tests INT NOT NULL DEFAULT 0
+);
+GO
+
 -- ========================================
 -- INSERT SAMPLE DATA
 -- ========================================
@@ -650,6 +669,17 @@ INSERT INTO Patients (RegDate, ReportingDate, Name, Gender, Age, Phone, Doctor,
 VALUES ('2024-01-20', '2024-01-21', 'Aliha Tariq', 'Female', 24, '0300-1234567', 'Dr. Ahmed Khan', 'CBC, Blood Sugar Fasting', 1000.00);
 GO
 
+-- Daily counters for the sample patient
+INSERT INTO DailyPatientStats (StatDate, Patients, Revenue, MalePatients, FemalePatients, OtherPatients, Tests)
+SELECT RegDate, COUNT(*), SUM(Amount),
+    SUM(CASE WHEN Gender = 'Male' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN Gender = 'Female' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN Gender NOT IN ('Male', 'Female') THEN 1 ELSE 0 END),
+    SUM(CASE WHEN Tests IS NULL OR Tests = '' THEN 0 ELSE DATALENGTH(Tests) - DATALENGTH(REPLACE(Tests, ',', '')) + 1 END)
+FROM Patients
+GROUP BY RegDate;
+GO
+
 -- Insert Sample Receipt
 INSERT INTO Receipts (PatientMrNo, TotalAmount, NetAmount, PaymentStatus, ReportDueTime)
 VALUES (1001, 1000.00, 1000.00, 'Paid', DATEADD(day, 1, GETDATE()));
@@ -674,8 +704,11 @@ GO
 CREATE INDEX IX_Patients_Name ON Patients(Name);
 CREATE INDEX IX_Patients_Phone ON Patients(Phone);
 CREATE INDEX IX_Patients_RegDate ON Patients(RegDate);
+CREATE INDEX IX_Patients_Doctor ON Patients(Doctor);
 CREATE INDEX IX_Receipts_PatientMrNo ON Receipts(PatientMrNo);
 CREATE INDEX IX_Receipts_CreatedAt ON Receipts(CreatedAt);
+CREATE INDEX IX_Receipt_Tests_TestId ON Receipt_Tests(TestId, ReceiptId);
+CREATE INDEX IX_Receipt_Tests_ReceiptId ON Receipt_Tests(ReceiptId);
 CREATE INDEX IX_Tests_Category ON Tests(Category);
 CREATE INDEX IX_Tests_TestName ON Tests(TestName);
 GO
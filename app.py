@@ -1,12 +1,14 @@
+import multiprocessing
 import os
 from flask import Flask, jsonify, session
-from db import get_connection
+from db import get_db, init_app
 from routes.auth import auth_bp
 from routes.dashboard import dashboard_bp
 from routes.patients import patients_bp
 from routes.receipts import receipts_bp
 from routes.reports import reports_bp
-from routes.admin import admin_bp
+from routes.admin import ANALYTICS_CUBE, admin_bp
+from models.analytics_cube import warm_cube
 
 
 app = Flask(__name__)
@@ -22,12 +24,11 @@ app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-change-me")
 def debug_users():
     """Debug route to check users in database"""
     try:
-        conn = get_connection()
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute("SELECT UserId, Username, Password, Role, FullName FROM Users")
         users = cursor.fetchall()
         cursor.close()
-        conn.close()
         
         users_list = []
         for user in users:
@@ -63,6 +64,14 @@ def favicon():
 # connection = get_connection()
 # app.config["DB_CONNECTION"] = connection
 
+# One pooled connection per request, released on teardown
+init_app(app)
+
+# Load the analytics cube in the background so the first dashboard doesn't wait for it
+# (not in the PDF worker processes, which import this module when they start)
+if ANALYTICS_CUBE and multiprocessing.parent_process() is None:
+    warm_cube()
+
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(dashboard_bp, url_prefix="/dashboard")
@@ -0,0 +1,83 @@
+import os
+import threading
+
+from db.backends import CONNECTION_STRING, create_backend
+from db.instrumentation import instrument_cursor, query_stats
+from db.pool import ConnectionPool, PooledConnection, PoolTimeoutError
+from db.streaming import STREAM_BATCH_SIZE, stream_query
+from db.unit_of_work import get_db, init_app, on_commit, unit_of_work
+
+# Pool settings - override through environment variables
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+POOL_IDLE_TIMEOUT = float(os.environ.get("DB_POOL_IDLE_TIMEOUT", 300))        # seconds
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", 15))  # seconds
+POOL_LEAK_TIMEOUT = float(os.environ.get("DB_POOL_LEAK_TIMEOUT", 120))        # seconds, 0 disables
+POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") not in ("0", "false", "False")
+
+# Time every statement (see db/instrumentation.py) - set DB_INSTRUMENTATION=0 to disable
+INSTRUMENTATION = os.environ.get("DB_INSTRUMENTATION", "1") not in ("0", "false", "False")
+
+_pool = None
+_pool_lock = threading.Lock()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the backend chosen by DB_BACKEND (mssql by default, sqlite for local runs)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def _connect():
+    """Open a brand new driver connection (used by the pool)"""
+    return get_backend().connect()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    idle_timeout=POOL_IDLE_TIMEOUT,
+                    checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                    leak_timeout=POOL_LEAK_TIMEOUT,
+                    pre_ping=POOL_PRE_PING,
+                    ping_query=get_backend().ping_query,
+                    cursor_wrapper=instrument_cursor if INSTRUMENTATION else None,
+                )
+    return _pool
+
+
+def dispose_pool():
+    """Close all pooled connections (next get_connection() builds a fresh pool)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.dispose()
+
+
+def get_connection():
+    """
+    Check out a pooled connection.
+
+    Call conn.close() (or use `with get_connection() as conn:`) when done -
+    that returns the connection to the pool instead of closing it.
+    """
+    try:
+        return get_pool().acquire()
+    except Exception as e:
+        print("❌ Database connection failed:", e)
+        raise
+
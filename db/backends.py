@@ -0,0 +1,104 @@
+# db/backends.py - Database backends selectable through DB_BACKEND
+import itertools
+import os
+import threading
+from abc import ABC, abstractmethod
+
+# Default SQL Server connection (override with DB_CONNECTION_STRING)
+CONNECTION_STRING = (
+    "Driver={SQL Server};"
+    "Server=DESKTOP-ONOJF0L;"          # replace localhost with your server name if needed
+    "Database=Lmss;"     # replace with your actual database name
+    "Trusted_Connection=yes;"    # yes for Windows Auth, no for SQL login
+)
+
+SCHEMA_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SQLQuery1.sql")
+
+
+class DatabaseBackend(ABC):
+    """Knows how to open driver connections for one kind of database"""
+
+    name = None
+    ping_query = "SELECT 1"
+
+    @abstractmethod
+    def connect(self):
+        """Open a new DB-API connection"""
+
+
+class SQLServerBackend(DatabaseBackend):
+    """Production backend - SQL Server through pyodbc"""
+
+    name = "mssql"
+
+    def __init__(self, connection_string=None):
+        self.connection_string = connection_string or os.environ.get("DB_CONNECTION_STRING", CONNECTION_STRING)
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    Local stand-in for SQL Server.
+
+    Loads the tables and seed data from SQLQuery1.sql on first use and
+    translates the T-SQL the app sends (OUTPUT INSERTED, ISNULL, TOP n,
+    CONVERT(date, ...), GETDATE(), ...) so routes and models run unchanged
+    on Linux / a laptop. DB_SQLITE_PATH selects a database file; the default
+    is a process-wide in-memory database.
+    """
+
+    name = "sqlite"
+
+    _instances = itertools.count(1)
+
+    def __init__(self, path=None, schema_script=SCHEMA_SCRIPT):
+        self.path = path or os.environ.get("DB_SQLITE_PATH", ":memory:")
+        self.schema_script = schema_script
+        self._number = next(self._instances)
+        self._lock = threading.Lock()
+        self._anchor = None
+        self._initialized = False
+
+    def _uri(self):
+        if self.path == ":memory:":
+            # Named shared-cache database so every pooled connection sees the same data.
+            # Numbered rather than id(self): a reused id could reopen a previous
+            # backend's database while a leftover connection still holds it open.
+            return f"file:lmss_{self._number}?mode=memory&cache=shared", True
+        return self.path, False
+
+    def connect(self):
+        from db.sqlite_backend import connect, load_schema
+
+        target, uri = self._uri()
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    anchor = connect(target, uri=uri)
+                    if not anchor.has_table("Patients"):
+                        load_schema(anchor, self.schema_script)
+                    if self.path == ":memory:":
+                        # Keep one connection open so the in-memory database survives
+                        self._anchor = anchor
+                    else:
+                        anchor.close()
+                    self._initialized = True
+        return connect(target, uri=uri)
+
+
+BACKENDS = {
+    SQLServerBackend.name: SQLServerBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+
+def create_backend(name=None):
+    """Factory - build the backend named by `name` or the DB_BACKEND env variable"""
+    name = (name or os.environ.get("DB_BACKEND", SQLServerBackend.name)).lower()
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown DB_BACKEND '{name}'. Choose one of: {', '.join(BACKENDS)}")
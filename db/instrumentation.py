@@ -0,0 +1,219 @@
+# db/instrumentation.py - Per-statement latency histograms and slow-query log
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+from flask import has_request_context, request
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("db.slow_query")
+
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 500))
+SLOW_QUERY_HISTORY = int(os.environ.get("DB_SLOW_QUERY_HISTORY", 100))
+
+# Histogram bucket upper bounds in milliseconds (roughly 25% apart, 0.05ms .. ~2min)
+_BUCKET_BOUNDS = []
+_bound = 0.05
+while _bound < 120000:
+    _BUCKET_BOUNDS.append(round(_bound, 4))
+    _bound *= 1.25
+del _bound
+
+
+# ---------------------------------------
+# Statement fingerprints
+# ---------------------------------------
+_STRING_RE = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """
+    Normalize a statement so every execution of the same query shape shares
+    one key: literals become ?, IN lists collapse and whitespace is squeezed.
+    """
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    sql = _IN_LIST_RE.sub("IN (?)", sql)
+    return sql
+
+
+# ---------------------------------------
+# Aggregation
+# ---------------------------------------
+class LatencyHistogram:
+    """Fixed log-scale buckets - constant memory however many samples arrive"""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(_BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile sample"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index >= len(_BUCKET_BOUNDS):
+                    return self.max_ms
+                return min(_BUCKET_BOUNDS[index], self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class QueryStats:
+    """Thread-safe registry of latency histograms keyed by statement fingerprint"""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, history=SLOW_QUERY_HISTORY):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._slow_queries = deque(maxlen=history)
+        self._listeners = []
+
+    def record(self, sql, params, elapsed_ms, error=None):
+        key = fingerprint(sql)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.add(elapsed_ms)
+            listeners = list(self._listeners)
+
+        if elapsed_ms >= self.slow_query_ms:
+            self._log_slow_query(key, elapsed_ms, error)
+
+        for listener in listeners:
+            try:
+                listener(sql, params, elapsed_ms)
+            except Exception as e:
+                logger.error(f"Statement listener failed: {str(e)}")
+
+    def _log_slow_query(self, key, elapsed_ms, error):
+        route = None
+        if has_request_context():
+            route = f"{request.method} {request.path}"
+        entry = {
+            "fingerprint": key,
+            "duration_ms": round(elapsed_ms, 3),
+            "route": route,
+            "error": str(error) if error else None,
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        slow_query_logger.warning(
+            "Slow query (%.1f ms) on %s: %s", elapsed_ms, route or "<no request>", key
+        )
+
+    def add_listener(self, listener):
+        """Call listener(sql, params, elapsed_ms) after every statement"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def snapshot(self):
+        """Per-fingerprint histograms, most total time first, plus recent slow queries"""
+        with self._lock:
+            queries = [
+                dict(fingerprint=key, **histogram.to_dict())
+                for key, histogram in self._histograms.items()
+            ]
+            slow_queries = list(self._slow_queries)
+        queries.sort(key=lambda q: q["total_ms"], reverse=True)
+        return {
+            "slow_query_threshold_ms": self.slow_query_ms,
+            "queries": queries,
+            "slow_queries": slow_queries,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._slow_queries.clear()
+
+
+query_stats = QueryStats()
+
+
+# ---------------------------------------
+# Cursor wrapper
+# ---------------------------------------
+class InstrumentedCursor:
+    """Driver cursor proxy that times execute()/executemany()"""
+
+    __slots__ = ("_cursor", "_stats")
+
+    def __init__(self, cursor, stats=None):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_stats", stats or query_stats)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. cursor.fast_executemany = True
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, method, sql, params):
+        start = time.perf_counter()
+        error = None
+        try:
+            result = method(sql, *params)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._stats.record(sql, params, (time.perf_counter() - start) * 1000.0, error)
+        # pyodbc returns the cursor itself - keep chained calls on the wrapper
+        return self if result is self._cursor else result
+
+    def execute(self, sql, *params):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, *params):
+        return self._timed(self._cursor.executemany, sql, params)
+
+
+def instrument_cursor(cursor):
+    return InstrumentedCursor(cursor)
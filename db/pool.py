@@ -0,0 +1,402 @@
+# db/pool.py - Thread-safe connection pool used behind db.get_connection()
+import logging
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the timeout"""
+
+
+class _Checkout:
+    """Bookkeeping for a connection that is currently checked out"""
+
+    __slots__ = ("raw", "checked_out_at", "stack", "leak_reported")
+
+    def __init__(self, raw, stack=None):
+        self.raw = raw
+        self.checked_out_at = time.monotonic()
+        self.stack = stack
+        self.leak_reported = False
+
+
+class PooledConnection:
+    """
+    Proxy handed out by the pool.
+
+    Behaves like the driver connection (cursor, commit, rollback, ...) but
+    close() hands the connection back to the pool instead of tearing it down.
+    Used as a context manager it commits on success, rolls back on error and
+    then releases the connection, so `with get_connection() as conn:` blocks
+    no longer leave connections open.
+    """
+
+    def __init__(self, pool, checkout):
+        self._pool = pool
+        self._checkout = checkout
+        self._raw = checkout.raw
+        # Reclaims the connection if the proxy is dropped without close()
+        self._finalizer = weakref.finalize(self, pool._reclaim_leaked, checkout)
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise AttributeError(f"Connection already returned to pool ({name})")
+        return getattr(raw, name)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise RuntimeError("Cannot open a cursor on a released connection")
+        cursor = self._raw.cursor(*args, **kwargs)
+        wrapper = self._pool.cursor_wrapper
+        return wrapper(cursor) if wrapper else cursor
+
+    def close(self):
+        """Release the connection back to the pool"""
+        if self._raw is None:
+            return
+        self._finalizer.detach()
+        checkout = self._checkout
+        self._raw = None
+        self._checkout = None
+        self._pool._release(checkout)
+
+    def invalidate(self):
+        """Discard the underlying connection instead of returning it to the pool"""
+        if self._raw is None:
+            return
+        self._finalizer.detach()
+        checkout = self._checkout
+        self._raw = None
+        self._checkout = None
+        self._pool._release(checkout, discard=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._raw is not None:
+                if exc_type is None:
+                    self._raw.commit()
+                else:
+                    self._raw.rollback()
+        finally:
+            self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+
+    - keeps at least `min_size` idle connections warm
+    - never opens more than `max_size` connections at once
+    - closes idle connections (above min_size) after `idle_timeout` seconds
+    - validates connections idle for more than `ping_interval` seconds with
+      `ping_query` before handing them out
+    - waits at most `checkout_timeout` seconds for a free connection
+    - logs connections held longer than `leak_timeout` seconds, with the
+      stack that checked them out
+    - wraps every cursor handed out with `cursor_wrapper` (if given)
+    """
+
+    def __init__(self, creator, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=30, leak_timeout=120, pre_ping=True,
+                 ping_query="SELECT 1", ping_interval=10, reap_interval=30,
+                 cursor_wrapper=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+
+        self._creator = creator
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.leak_timeout = leak_timeout
+        self.pre_ping = pre_ping
+        self.ping_query = ping_query
+        self.ping_interval = ping_interval
+        self.reap_interval = reap_interval
+        self.cursor_wrapper = cursor_wrapper
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()          # (raw, returned_at) - most recent on the right
+        self._checked_out = {}        # id(checkout) -> _Checkout
+        self._size = 0                # idle + checked out + being opened
+        self._closed = False
+        self._reaper = None
+        # Checkouts whose proxy was garbage collected. The GC finalizer may run
+        # while this thread already holds self._cond, so it only queues them
+        # here; acquire() / stats() / _reap() release them outside the lock.
+        self._leaked = deque()
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "ping_failures": 0,
+            "timeouts": 0,
+            "leaks": 0,
+        }
+
+        self._fill_min()
+        self._start_reaper()
+
+    # ---------------------------------------
+    # Public API
+    # ---------------------------------------
+    def acquire(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            self._drain_leaked()
+            raw = None
+            returned_at = None
+            create = False
+            leaked = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool has been disposed")
+                while not self._idle and self._size >= self.max_size:
+                    if self._leaked:
+                        leaked = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout}s waiting for a database connection "
+                            f"(pool size {self.max_size}, all in use)"
+                        )
+                    # Wake up periodically so connections reclaimed by the GC get reused
+                    self._cond.wait(min(remaining, 1.0))
+
+                if not leaked:
+                    if self._idle:
+                        raw, returned_at = self._idle.pop()
+                    else:
+                        self._size += 1
+                        create = True
+
+            if leaked:
+                continue
+            if create:
+                raw = self._open()
+            elif (self.pre_ping and time.monotonic() - returned_at >= self.ping_interval
+                  and not self._ping(raw)):
+                self._stats["ping_failures"] += 1
+                self._discard(raw)
+                continue
+
+            checkout = _Checkout(raw, self._capture_stack())
+            with self._cond:
+                self._checked_out[id(checkout)] = checkout
+                self._stats["checkouts"] += 1
+            return PooledConnection(self, checkout)
+
+    def stats(self):
+        """Snapshot of pool counters for monitoring"""
+        self._drain_leaked()
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._checked_out),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        return data
+
+    def dispose(self):
+        """Close every idle connection and stop handing out new ones"""
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for raw in idle:
+            self._close_quietly(raw)
+
+    # ---------------------------------------
+    # Internals
+    # ---------------------------------------
+    def _open(self):
+        try:
+            raw = self._creator()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return raw
+
+    def _fill_min(self):
+        for _ in range(self.min_size):
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw = self._open()
+            except Exception as e:
+                # Let the first real checkout surface the error
+                logger.warning(f"Could not pre-open pooled connection: {e}")
+                return
+            with self._cond:
+                self._idle.appendleft((raw, time.monotonic()))
+                self._cond.notify()
+
+    def _ping(self, raw):
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute(self.ping_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding dead pooled connection: {e}")
+            return False
+
+    def _release(self, checkout, discard=False):
+        raw = checkout.raw
+        with self._cond:
+            self._checked_out.pop(id(checkout), None)
+
+        if not discard:
+            try:
+                # Never hand an open transaction to the next borrower
+                raw.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._discard(raw)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                close_it = True
+            else:
+                self._idle.append((raw, time.monotonic()))
+                close_it = False
+            self._cond.notify()
+        if close_it:
+            self._close_quietly(raw)
+
+    def _discard(self, raw):
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+        self._close_quietly(raw)
+        if not self._closed:
+            self._fill_min()
+
+    def _reclaim_leaked(self, checkout):
+        """Finalizer for proxies garbage collected without close()"""
+        # Must not take self._cond - deque.append is atomic
+        self._leaked.append(checkout)
+
+    def _drain_leaked(self):
+        """Return connections queued by _reclaim_leaked to the pool"""
+        while True:
+            try:
+                checkout = self._leaked.popleft()
+            except IndexError:
+                return
+            with self._cond:
+                if id(checkout) not in self._checked_out:
+                    continue
+                self._stats["leaks"] += 1
+            logger.warning(
+                "Database connection was garbage collected without being closed; "
+                "returning it to the pool.%s", self._format_stack(checkout)
+            )
+            self._release(checkout)
+
+    def _capture_stack(self):
+        if not self.leak_timeout:
+            return None
+        return traceback.extract_stack(limit=12)[:-2]
+
+    @staticmethod
+    def _format_stack(checkout):
+        if not checkout.stack:
+            return ""
+        return "\nChecked out at:\n" + "".join(traceback.format_list(checkout.stack))
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _start_reaper(self):
+        if not self.reap_interval:
+            return
+        pool_ref = weakref.ref(self)
+        interval = self.reap_interval
+
+        def reap_loop():
+            while True:
+                time.sleep(interval)
+                pool = pool_ref()
+                if pool is None or pool._closed:
+                    return
+                pool._reap()
+                del pool
+
+        self._reaper = threading.Thread(target=reap_loop, daemon=True, name="DBPoolReaper")
+        self._reaper.start()
+
+    def _reap(self):
+        """Evict idle connections and report leaked checkouts"""
+        self._drain_leaked()
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            if self.idle_timeout:
+                # Oldest idle connections sit on the left
+                while (self._idle and self._size > self.min_size
+                       and now - self._idle[0][1] > self.idle_timeout):
+                    raw, _ = self._idle.popleft()
+                    self._size -= 1
+                    expired.append(raw)
+            leaked = []
+            if self.leak_timeout:
+                for checkout in self._checked_out.values():
+                    if not checkout.leak_reported and now - checkout.checked_out_at > self.leak_timeout:
+                        checkout.leak_reported = True
+                        self._stats["leaks"] += 1
+                        leaked.append(checkout)
+
+        for raw in expired:
+            self._close_quietly(raw)
+        for checkout in leaked:
+            held = now - checkout.checked_out_at
+            logger.warning(
+                "Possible connection leak: connection checked out for %.0fs without being returned.%s",
+                held, self._format_stack(checkout)
+            )
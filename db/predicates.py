@@ -0,0 +1,63 @@
+# db/predicates.py - Index-friendly (sargable) date range filters
+import re
+from datetime import date, datetime, timedelta
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][\w.]*$")
+
+
+class DateRange:
+    """
+    Half-open date range [start, end).
+
+    predicate() renders it as `RegDate >= ? AND RegDate < ?` so the column is
+    compared as-is and IX_Patients_RegDate can seek, instead of wrapping the
+    column in CONVERT()/MONTH()/YEAR() and scanning every row.
+    """
+
+    __slots__ = ("start", "end")
+
+    def __init__(self, start, end):
+        self.start = as_date(start)
+        self.end = as_date(end)
+
+    @classmethod
+    def day(cls, day):
+        day = as_date(day)
+        return cls(day, day + timedelta(days=1))
+
+    @classmethod
+    def today(cls):
+        return cls.day(date.today())
+
+    @classmethod
+    def month(cls, year, month):
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return cls(start, end)
+
+    @classmethod
+    def this_month(cls):
+        today = date.today()
+        return cls.month(today.year, today.month)
+
+    @classmethod
+    def year(cls, year):
+        return cls(date(year, 1, 1), date(year + 1, 1, 1))
+
+    def predicate(self, column="RegDate"):
+        """(sql, params) for `column >= start AND column < end`"""
+        if not _IDENTIFIER_RE.match(column):
+            raise ValueError(f"Invalid column name: {column}")
+        return f"{column} >= ? AND {column} < ?", (self.start, self.end)
+
+    def __repr__(self):
+        return f"DateRange({self.start.isoformat()}, {self.end.isoformat()})"
+
+
+def as_date(value):
+    """date from a date, datetime or 'YYYY-MM-DD...' string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
@@ -0,0 +1,64 @@
+# db/rows.py - Row mappers compiled once per result shape
+from functools import lru_cache
+
+
+def column_names(cursor):
+    """Column names of the cursor's current result set"""
+    return tuple(col[0] for col in cursor.description)
+
+
+@lru_cache(maxsize=256)
+def _compile(columns, rename, record, convert):
+    keys = tuple(rename(name) for name in columns) if rename else columns
+    if record is not None:
+        # Records take the columns positionally, in SELECT order
+        make = record
+        if convert:
+            conversions = tuple((columns.index(name), func) for name, func in convert)
+
+            def make(*row):
+                row = list(row)
+                for index, func in conversions:
+                    if row[index] is not None:
+                        row[index] = func(row[index])
+                return record(*row)
+        return lambda row: make(*row)
+
+    if not convert:
+        return lambda row: dict(zip(keys, row))
+    conversions = tuple((keys[columns.index(name)], func) for name, func in convert)
+
+    def to_dict(row):
+        item = dict(zip(keys, row))
+        for key, func in conversions:
+            if item[key] is not None:
+                item[key] = func(item[key])
+        return item
+    return to_dict
+
+
+def row_mapper(cursor, rename=None, record=None, convert=None):
+    """
+    Return a function that turns one row of the cursor's result into a dict
+    (keys are the column names, passed through `rename`) or, with `record`,
+    into record(*row).
+
+    `convert` maps column names to functions applied to non-NULL values
+    (e.g. {"Price": float}). The mapper is built once per distinct
+    (columns, rename, record, convert) and cached, so renaming and lookups
+    are not repeated for every row or every call.
+    """
+    convert = tuple(sorted(convert.items())) if convert else None
+    return _compile(column_names(cursor), rename, record, convert)
+
+
+def fetch_all(cursor, **options):
+    """Every remaining row, mapped with row_mapper(cursor, **options)"""
+    mapper = row_mapper(cursor, **options)
+    return [mapper(row) for row in cursor.fetchall()]
+
+
+def fetch_one(cursor, **options):
+    """The next row mapped with row_mapper(cursor, **options), or None"""
+    row = cursor.fetchone()
+    return None if row is None else row_mapper(cursor, **options)(row)
@@ -0,0 +1,418 @@
+# db/sqlite_backend.py - SQLite connection wrapper with a T-SQL translation shim
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(Decimal, float)
+
+_NOW = "datetime('now', 'localtime')"
+
+_DATEPART_FORMATS = {
+    "year": "%Y", "yy": "%Y", "yyyy": "%Y",
+    "month": "%m", "mm": "%m", "m": "%m",
+    "day": "%d", "dd": "%d", "d": "%d",
+    "weekday": "%w", "dw": "%w",
+    "hour": "%H", "hh": "%H",
+    "minute": "%M", "mi": "%M",
+}
+
+
+# ---------------------------------------
+# T-SQL -> SQLite translation
+# ---------------------------------------
+def _skip_string(sql, i):
+    """Return the index just past the string literal starting at sql[i]"""
+    i += 1
+    while i < len(sql):
+        if sql[i] == "'":
+            if i + 1 < len(sql) and sql[i + 1] == "'":
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return i
+
+
+def _split_top_level(text, sep=","):
+    """Split on `sep` outside parentheses and string literals"""
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "'":
+            i = _skip_string(text, i)
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts]
+
+
+def _rewrite_calls(sql, name, rewrite):
+    """Replace every `name(args)` call outside string literals with rewrite(args)"""
+    pattern = re.compile(r"(?<![\w.])" + name + r"\s*\(", re.IGNORECASE)
+    out, i = [], 0
+    while i < len(sql):
+        ch = sql[i]
+        if ch == "'":
+            end = _skip_string(sql, i)
+            out.append(sql[i:end])
+            i = end
+            continue
+        match = pattern.match(sql, i)
+        if not match:
+            out.append(ch)
+            i += 1
+            continue
+        # Find the matching close paren
+        j, depth = match.end(), 1
+        while j < len(sql) and depth:
+            if sql[j] == "'":
+                j = _skip_string(sql, j)
+                continue
+            if sql[j] == "(":
+                depth += 1
+            elif sql[j] == ")":
+                depth -= 1
+            j += 1
+        inner = _rewrite_calls(sql[match.end():j - 1], name, rewrite)
+        out.append(rewrite(_split_top_level(inner)))
+        i = j
+    return "".join(out)
+
+
+def _rewrite_cast(args):
+    expr, _, target = args[0].rpartition(" AS ") if " AS " in args[0] else args[0].rpartition(" as ")
+    target = target.strip().lower()
+    if target == "date":
+        return f"date({expr})"
+    if target.startswith(("varchar", "nvarchar", "char", "nchar", "text")):
+        return f"CAST({expr} AS TEXT)"
+    if target.startswith(("decimal", "numeric", "float", "money")):
+        return f"CAST({expr} AS REAL)"
+    return f"CAST({args[0]})"
+
+
+def _rewrite_convert(args):
+    target, expr = args[0].lower(), args[1]
+    if target == "date":
+        return f"date({expr})"
+    if target == "datetime":
+        return f"datetime({expr})"
+    if target.startswith(("varchar", "nvarchar", "char")):
+        return f"CAST({expr} AS TEXT)"
+    return f"CAST({expr} AS {args[0]})"
+
+
+def _rewrite_datepart(args):
+    fmt = _DATEPART_FORMATS.get(args[0].lower())
+    if fmt is None:
+        raise ValueError(f"DATEPART({args[0]}, ...) is not supported by the SQLite backend")
+    return f"CAST(strftime('{fmt}', {args[1]}) AS INTEGER)"
+
+
+_DATEADD_UNITS = {
+    "day": "days", "dd": "days", "d": "days",
+    "month": "months", "mm": "months", "m": "months",
+    "year": "years", "yy": "years", "yyyy": "years",
+    "hour": "hours", "hh": "hours",
+    "minute": "minutes", "mi": "minutes",
+}
+
+
+def _rewrite_dateadd(args):
+    unit = _DATEADD_UNITS.get(args[0].lower())
+    if unit is None:
+        raise ValueError(f"DATEADD({args[0]}, ...) is not supported by the SQLite backend")
+    return f"datetime({args[2]}, ({args[1]}) || ' {unit}')"
+
+
+_OUTPUT_RE = re.compile(r"\bOUTPUT\s+((?:INSERTED|DELETED)\.\w+(?:\s*,\s*(?:INSERTED|DELETED)\.\w+)*)", re.IGNORECASE)
+# Table hints: WITH (NOLOCK), WITH (UPDLOCK, SERIALIZABLE), ...
+_TABLE_HINT_RE = re.compile(
+    r"\bWITH\s*\(\s*(?:NOLOCK|UPDLOCK|HOLDLOCK|ROWLOCK|SERIALIZABLE|READPAST)"
+    r"(?:\s*,\s*(?:NOLOCK|UPDLOCK|HOLDLOCK|ROWLOCK|SERIALIZABLE|READPAST))*\s*\)",
+    re.IGNORECASE,
+)
+_TOP_RE = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s*\(?\s*(\d+)\s*\)?\s+", re.IGNORECASE)
+_OFFSET_FETCH_RE = re.compile(
+    r"\bOFFSET\s+(\d+)\s+ROWS?\s+FETCH\s+(?:NEXT|FIRST)\s+(\d+)\s+ROWS?\s+ONLY\b", re.IGNORECASE
+)
+_NATIONAL_RE = re.compile(r"(?<![\w'])N'")
+
+
+def _strip_national_prefix(sql):
+    out, i = [], 0
+    while i < len(sql):
+        if sql[i] == "'":
+            end = _skip_string(sql, i)
+            out.append(sql[i:end])
+            i = end
+        elif _NATIONAL_RE.match(sql, i):
+            i += 1
+        else:
+            out.append(sql[i])
+            i += 1
+    return "".join(out)
+
+
+@lru_cache(maxsize=1024)
+def translate_tsql(sql):
+    """Translate the T-SQL dialect used by the app into SQLite SQL"""
+    sql = sql.strip().rstrip(";")
+    sql = _strip_national_prefix(sql)
+
+    returning = None
+    match = _OUTPUT_RE.search(sql)
+    if match:
+        returning = ", ".join(col.split(".", 1)[1].strip() for col in match.group(1).split(","))
+        sql = sql[:match.start()] + sql[match.end():]
+
+    limit = None
+    match = _TOP_RE.match(sql)
+    if match:
+        limit = match.group(2)
+        sql = match.group(1) + sql[match.end():]
+
+    sql = _OFFSET_FETCH_RE.sub(lambda m: f"LIMIT {m.group(2)} OFFSET {m.group(1)}", sql)
+
+    sql = re.sub(r"\bDEFAULT\s+GETDATE\(\)", f"DEFAULT ({_NOW})", sql, flags=re.IGNORECASE)
+    sql = _rewrite_calls(sql, "GETDATE", lambda args: _NOW)
+    sql = _rewrite_calls(sql, "ISNULL", lambda args: f"IFNULL({', '.join(args)})")
+    sql = _rewrite_calls(sql, "CONVERT", _rewrite_convert)
+    sql = _rewrite_calls(sql, "CAST", _rewrite_cast)
+    sql = _rewrite_calls(sql, "DATEPART", _rewrite_datepart)
+    sql = _rewrite_calls(sql, "DATEADD", _rewrite_dateadd)
+    sql = _rewrite_calls(sql, "YEAR", lambda args: f"CAST(strftime('%Y', {args[0]}) AS INTEGER)")
+    sql = _rewrite_calls(sql, "MONTH", lambda args: f"CAST(strftime('%m', {args[0]}) AS INTEGER)")
+    sql = _rewrite_calls(sql, "DAY", lambda args: f"CAST(strftime('%d', {args[0]}) AS INTEGER)")
+    sql = _rewrite_calls(sql, "LEN", lambda args: f"length(rtrim({args[0]}))")
+    sql = _rewrite_calls(sql, "DATALENGTH", lambda args: f"length({args[0]})")
+    sql = _TABLE_HINT_RE.sub("", sql)
+
+    if limit is not None:
+        sql = f"{sql} LIMIT {limit}"
+    if returning is not None:
+        sql = f"{sql} RETURNING {returning}"
+    return sql
+
+
+# ---------------------------------------
+# Rows and value conversion (mimic pyodbc)
+# ---------------------------------------
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?$")
+
+
+def _convert_value(value):
+    # SQLite has no date type - hand back date/datetime objects like pyodbc does
+    if type(value) is str and 10 <= len(value) <= 26 and value[4:5] == "-":
+        if _DATE_RE.match(value):
+            return date.fromisoformat(value)
+        if _DATETIME_RE.match(value):
+            return datetime.fromisoformat(value)
+    return value
+
+
+@lru_cache(maxsize=256)
+def _row_class(columns):
+    index = {name: i for i, name in reversed(list(enumerate(columns)))}
+
+    class Row(tuple):
+        """Tuple row that also supports attribute access (row.MrNo)"""
+        __slots__ = ()
+        cursor_description = columns
+
+        def __getattr__(self, name):
+            try:
+                return self[index[name]]
+            except KeyError:
+                raise AttributeError(name)
+
+    return Row
+
+
+class SQLiteCursor:
+    """pyodbc-style cursor over sqlite3"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._row_class = None
+        self.fast_executemany = False
+
+    @staticmethod
+    def _params(params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            return tuple(params[0])
+        return params
+
+    def execute(self, sql, *params):
+        self._cursor.execute(translate_tsql(sql), self._params(params))
+        self._row_class = None
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_tsql(sql), seq_of_params)
+        self._row_class = None
+        return self
+
+    def _make_row(self, raw):
+        if self._row_class is None:
+            self._row_class = _row_class(tuple(col[0] for col in self._cursor.description))
+        return self._row_class(_convert_value(v) for v in raw)
+
+    def fetchone(self):
+        raw = self._cursor.fetchone()
+        return None if raw is None else self._make_row(raw)
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [self._make_row(raw) for raw in rows]
+
+    def fetchall(self):
+        return [self._make_row(raw) for raw in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for raw in self._cursor:
+            yield self._make_row(raw)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """pyodbc-style connection over sqlite3"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return SQLiteCursor(self._conn.cursor())
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def has_table(self, name):
+        row = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    @property
+    def raw(self):
+        return self._conn
+
+
+def connect(target, uri=False):
+    conn = sqlite3.connect(target, uri=uri, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA foreign_keys = ON")
+    if target != ":memory:" and not uri:
+        conn.execute("PRAGMA journal_mode = WAL")
+    return SQLiteConnection(conn)
+
+
+# ---------------------------------------
+# Schema loader for SQLQuery1.sql
+# ---------------------------------------
+def _strip_comments(sql):
+    out, i = [], 0
+    while i < len(sql):
+        if sql[i] == "'":
+            end = _skip_string(sql, i)
+            out.append(sql[i:end])
+            i = end
+        elif sql.startswith("--", i):
+            while i < len(sql) and sql[i] != "\n":
+                i += 1
+        else:
+            out.append(sql[i])
+            i += 1
+    return "".join(out)
+
+
+def _translate_create_table(stmt):
+    """Returns (sql, table, identity_seed)"""
+    table = re.match(r"CREATE\s+TABLE\s+(?:dbo\.)?(\w+)", stmt, re.IGNORECASE).group(1)
+    seed = None
+    identity = re.search(r"\bINT\s+IDENTITY\s*\(\s*(\d+)\s*,\s*\d+\s*\)\s+PRIMARY\s+KEY", stmt, re.IGNORECASE)
+    if identity:
+        seed = int(identity.group(1))
+        stmt = stmt[:identity.start()] + "INTEGER PRIMARY KEY AUTOINCREMENT" + stmt[identity.end():]
+    stmt = re.sub(r"\bN?VARCHAR\s*\(\s*MAX\s*\)", "TEXT", stmt, flags=re.IGNORECASE)
+    return translate_tsql(stmt), table, seed
+
+
+def _translate_alter_add(stmt):
+    match = re.match(r"ALTER\s+TABLE\s+(\w+)\s+ADD\s+(.*)$", stmt, re.IGNORECASE | re.DOTALL)
+    table, columns = match.group(1), _split_top_level(match.group(2))
+    return [f"ALTER TABLE {table} ADD COLUMN {col}" for col in columns if col]
+
+
+def schema_statements(script):
+    """Yield SQLite statements for the tables, seed data, indexes and views in a T-SQL script"""
+    script = _strip_comments(script.lstrip("﻿"))
+    batches = re.split(r"^\s*GO\s*$", script, flags=re.IGNORECASE | re.MULTILINE)
+
+    for batch in batches:
+        if re.search(r"\bCREATE\s+PROCEDURE\b", batch, re.IGNORECASE):
+            continue
+        for stmt in _split_top_level(batch, ";"):
+            if not stmt:
+                continue
+            keyword = " ".join(stmt.split()[:2]).upper()
+
+            rename = re.search(r"sp_rename\s+'(\w+)\.(\w+)'\s*,\s*'(\w+)'", stmt, re.IGNORECASE)
+            drop_view = re.match(r"IF\s+OBJECT_ID\('(\w+)',\s*'V'\)\s+IS\s+NOT\s+NULL\s+DROP\s+VIEW", stmt, re.IGNORECASE)
+
+            if rename:
+                table, old, new = rename.groups()
+                yield f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}", None
+            elif drop_view:
+                yield f"DROP VIEW IF EXISTS {drop_view.group(1)}", None
+            elif keyword == "CREATE TABLE":
+                sql, table, seed = _translate_create_table(stmt)
+                yield sql, None
+                if seed and seed > 1:
+                    yield "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seed - 1)
+            elif keyword == "ALTER TABLE":
+                for sql in _translate_alter_add(stmt):
+                    yield sql, None
+            elif keyword in ("INSERT INTO", "CREATE INDEX", "CREATE VIEW") or keyword.startswith("UPDATE "):
+                yield translate_tsql(stmt), None
+            # Anything else (CREATE DATABASE, DROP TABLE, PRINT, SELECT, ...) is not needed locally
+
+
+def load_schema(conn, script_path):
+    """Create the tables and seed data from the SQL Server script"""
+    with open(script_path, encoding="utf-8-sig") as f:
+        script = f.read()
+    raw = conn.raw
+    for sql, params in schema_statements(script):
+        raw.execute(sql, params or ())
+    raw.commit()
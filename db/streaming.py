@@ -0,0 +1,33 @@
+# db/streaming.py - Reading large result sets a batch at a time
+import os
+
+# Rows per cursor.fetchmany() round trip - override with DB_STREAM_BATCH_SIZE
+STREAM_BATCH_SIZE = int(os.environ.get("DB_STREAM_BATCH_SIZE", 500))
+
+
+def stream_query(sql, params=(), batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield the rows of a SELECT in lists of at most `batch_size`.
+
+    Runs on its own pooled connection rather than the request's: a streamed
+    response keeps reading after the view has returned and the request
+    transaction has been committed. Nothing is checked out until the first
+    batch is requested, and the connection goes back to the pool when the
+    generator finishes or is closed (e.g. the client disconnected).
+    """
+    from db import get_connection
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
@@ -0,0 +1,209 @@
+# db/unit_of_work.py - Request-scoped connection and transaction handling
+import logging
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_request_context, current_app
+
+logger = logging.getLogger(__name__)
+
+_EXTENSION_KEY = "db_unit_of_work"
+_local = threading.local()
+
+
+class SharedConnection:
+    """
+    The connection shared by everything that runs inside one request.
+
+    close() is a no-op and `with` does nothing special: the connection is
+    committed (or rolled back) when the request finishes, or by the
+    outermost unit_of_work() block outside requests.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _Scope:
+    """Connection + transaction state for one request (or one thread)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.shared = SharedConnection(conn)
+        self.depth = 0
+        self.rollback_only = False
+        self.callbacks = []
+
+    def commit(self):
+        callbacks, self.callbacks = self.callbacks, []
+        if self.rollback_only:
+            logger.warning("Rolling back transaction marked rollback-only")
+            self.rollback()
+            return
+        self.conn.commit()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"on_commit callback failed: {str(e)}")
+
+    def rollback(self):
+        self.callbacks = []
+        self.rollback_only = False
+        self.conn.rollback()
+
+
+def init_app(app):
+    """Commit the request transaction before the response is sent; release the connection on teardown"""
+    app.extensions[_EXTENSION_KEY] = True
+    app.after_request(_finish_request_scope)
+    app.teardown_appcontext(_teardown_request_scope)
+
+
+def _request_scope_enabled():
+    return has_request_context() and _EXTENSION_KEY in current_app.extensions
+
+
+def _get_request_scope(create=True):
+    scope = g.get("_db_scope")
+    if scope is None and create:
+        from db import get_connection
+        scope = _Scope(get_connection())
+        # The request owns the outermost transaction
+        scope.depth = 1
+        g._db_scope = scope
+    return scope
+
+
+def _finish_request_scope(response):
+    """
+    Commit the request's transaction once the view has built its response.
+
+    Runs before the response goes out, so a failed commit turns into a 500
+    instead of a success the database never saw. Rolls back instead when a
+    unit_of_work() block failed or the response is a server error.
+    """
+    scope = g.pop("_db_scope", None)
+    if scope is None:
+        return response
+    try:
+        if scope.rollback_only or response.status_code >= 500:
+            scope.rollback()
+        else:
+            scope.commit()
+    finally:
+        scope.conn.close()
+    return response
+
+
+def _teardown_request_scope(exc):
+    # Only reached with a scope when after_request did not run (or work was
+    # done after it, e.g. while streaming) - never commit here
+    scope = g.pop("_db_scope", None)
+    if scope is None:
+        return
+    try:
+        scope.rollback()
+    except Exception as e:
+        logger.error(f"Error rolling back request transaction: {str(e)}")
+    finally:
+        scope.conn.close()
+
+
+def get_db():
+    """
+    Return the connection for the current request.
+
+    The first call checks a connection out of the pool; later calls in the
+    same request get the same connection. The request's work is committed
+    once, after the view returns (rolled back on errors), and the connection
+    is released when the request ends.
+    """
+    if not _request_scope_enabled():
+        raise RuntimeError(
+            "get_db() needs a request on an app with db.init_app() applied; "
+            "use unit_of_work() outside requests"
+        )
+    return _get_request_scope().shared
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Run a block of database work as one transaction.
+
+    Inside a request the block joins the request transaction: nothing is
+    committed when the block exits, and an error inside it marks the whole
+    request for rollback. Outside a request the outermost block checks out a
+    pooled connection, commits when it exits cleanly (rolls back when it
+    raises) and releases the connection; nested blocks join it.
+    """
+    if _request_scope_enabled():
+        scope = _get_request_scope()
+        try:
+            yield scope.shared
+        except BaseException:
+            scope.rollback_only = True
+            raise
+        return
+
+    scope = getattr(_local, "scope", None)
+    owns_connection = scope is None
+    if owns_connection:
+        from db import get_connection
+        scope = _Scope(get_connection())
+        _local.scope = scope
+
+    scope.depth += 1
+    try:
+        yield scope.shared
+    except BaseException:
+        scope.depth -= 1
+        if scope.depth == 0:
+            try:
+                scope.rollback()
+            except Exception as e:
+                logger.error(f"Rollback failed: {str(e)}")
+        else:
+            scope.rollback_only = True
+        if owns_connection:
+            _local.scope = None
+            scope.conn.close()
+        raise
+    else:
+        scope.depth -= 1
+        try:
+            if scope.depth == 0:
+                scope.commit()
+        finally:
+            if owns_connection:
+                _local.scope = None
+                scope.conn.close()
+
+
+def on_commit(callback):
+    """Run `callback` after the current unit of work commits (now if there is none)"""
+    if _request_scope_enabled():
+        scope = _get_request_scope(create=False)
+    else:
+        scope = getattr(_local, "scope", None)
+
+    if scope is None or scope.depth == 0:
+        callback()
+    else:
+        scope.callbacks.append(callback)
@@ -0,0 +1,343 @@
+# models/analytics_cube.py - In-memory columnar copy of Patients for the admin analytics
+
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+from db import unit_of_work
+from db.predicates import as_date
+from models.patient_model import add_change_listener
+from models.test_matcher import get_matcher
+from models.time_buckets import count_tests, empty_buckets, fill_buckets
+
+logger = logging.getLogger(__name__)
+
+# Seconds between COUNT / MAX(MrNo) / SUM(Amount) comparisons with the database
+DRIFT_CHECK_SECONDS = float(os.environ.get("CUBE_DRIFT_CHECK_SECONDS", 60))
+
+LOAD_SQL = "SELECT MrNo, RegDate, Gender, Doctor, Tests, Amount FROM Patients ORDER BY MrNo"
+DRIFT_SQL = "SELECT COUNT(*), ISNULL(MAX(MrNo), 0), ISNULL(SUM(Amount), 0) FROM Patients"
+
+
+class _Column:
+    """Growable NumPy array (amortized O(1) append)"""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, dtype, values=()):
+        self.data = np.array(values, dtype=dtype)
+        self.size = len(self.data)
+        if not self.size:
+            self.data = np.zeros(1024, dtype=dtype)
+
+    def append(self, value):
+        if self.size == len(self.data):
+            self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+        self.data[self.size] = value
+        self.size += 1
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+
+class _Vocab:
+    """Dictionary encoding of a text column: value <-> small integer code"""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def _split_items(tests):
+    """Patients.Tests items the way the monthly report has always split them"""
+    return [item.strip() for item in tests.split(",") if item.strip()] if tests else []
+
+
+class AnalyticsCube:
+    """
+    Column store of the Patients rows the dashboard aggregates over.
+
+    One NumPy array per column (RegDate ordinal, Amount, test count and
+    dictionary codes for Gender and Doctor) plus two sparse row -> test
+    memberships in COO form: the raw comma separated items of Patients.Tests
+    and the catalog tests found by TestNameMatcher. Every breakdown is a
+    mask plus np.bincount instead of a round trip and a re-parse of Tests.
+
+    Updates and deletes tombstone the old row (`alive`); updates append the
+    new version. Rows are compacted by the next rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._mr_no = _Column(np.int64)
+        self._day = _Column(np.int32)
+        self._amount = _Column(np.float64)
+        self._tests_per_row = _Column(np.int32)
+        self._gender = _Column(np.int32)
+        self._doctor = _Column(np.int32)
+        self._alive = _Column(np.bool_)
+        self._genders = _Vocab()
+        self._doctors = _Vocab()
+        self._items = _Vocab()
+        self._item_rows = _Column(np.int32)
+        self._item_ids = _Column(np.int32)
+        self._tests = []            # raw Tests text, kept to re-match a new catalog
+        self._catalog = None
+        self._catalog_rows = _Column(np.int32)
+        self._catalog_ids = _Column(np.int32)
+        self._row_of = {}
+
+    @classmethod
+    def load(cls, cursor):
+        """Build the cube from a full read of Patients"""
+        cube = cls()
+        cursor.execute(LOAD_SQL)
+        for mr_no, reg_date, gender, doctor, tests, amount in cursor.fetchall():
+            cube._append(mr_no, reg_date, gender, doctor, tests, amount)
+        return cube
+
+    def __len__(self):
+        with self._lock:
+            return len(self._row_of)
+
+    # -----------------------------------
+    # Incremental maintenance
+    # -----------------------------------
+    def _append(self, mr_no, reg_date, gender, doctor, tests, amount):
+        row = self._mr_no.size
+        self._mr_no.append(mr_no)
+        self._day.append(as_date(reg_date).toordinal())
+        self._amount.append(float(amount or 0))
+        self._tests_per_row.append(count_tests(tests))
+        self._gender.append(self._genders.code(gender))
+        self._doctor.append(self._doctors.code(doctor))
+        self._alive.append(True)
+        for item in _split_items(tests):
+            self._item_rows.append(row)
+            self._item_ids.append(self._items.code(item))
+        self._tests.append(tests or "")
+        if self._catalog is not None:
+            for index in get_matcher(self._catalog).match(tests):
+                self._catalog_rows.append(row)
+                self._catalog_ids.append(index)
+        self._row_of[mr_no] = row
+
+    def _drop(self, mr_no):
+        row = self._row_of.pop(mr_no, None)
+        if row is not None:
+            self._alive.data[row] = False
+
+    def apply(self, change):
+        """Apply a committed PatientChange; replaying a change is harmless"""
+        mr_no = int(change.mr_no)
+        with self._lock:
+            self._drop(mr_no)
+            if change.action in ("add", "update"):
+                data = change.data
+                self._append(
+                    mr_no, change.reg_date or data.get("reg_date"), data.get("gender"),
+                    data.get("doctor"), data.get("tests"), data.get("amount"),
+                )
+
+    def summary(self):
+        """(rows, max MrNo, total Amount) - compared with the database to detect drift"""
+        with self._lock:
+            alive = self._alive.values
+            mr_nos = self._mr_no.values[alive]
+            return (
+                int(alive.sum()),
+                int(mr_nos.max()) if len(mr_nos) else 0,
+                float(self._amount.values[alive].sum()),
+            )
+
+    # -----------------------------------
+    # Vectorized breakdowns
+    # -----------------------------------
+    def _mask(self, start=None, end=None):
+        mask = self._alive.values.copy()
+        if start is not None:
+            day = self._day.values
+            mask &= (day >= as_date(start).toordinal()) & (day < as_date(end).toordinal())
+        return mask
+
+    def bucket_stats(self, start, end, granularity):
+        """Same buckets as time_buckets.bucket_stats over [start, end)"""
+        start, end = as_date(start), as_date(end)
+        buckets = empty_buckets(start, end, granularity)
+        if not buckets:
+            return buckets
+
+        with self._lock:
+            mask = self._mask(start, end)
+            genders = self._genders.values
+            width = max(len(genders), 1)
+            key = (self._day.values[mask].astype(np.int64) - start.toordinal()) * width + self._gender.values[mask]
+            keys, groups = np.unique(key, return_inverse=True)
+            patients = np.bincount(groups, minlength=len(keys))
+            revenue = np.bincount(groups, weights=self._amount.values[mask], minlength=len(keys))
+            tests = np.bincount(groups, weights=self._tests_per_row.values[mask], minlength=len(keys))
+
+        rows = [
+            (date.fromordinal(start.toordinal() + int(k) // width), genders[int(k) % width],
+             int(p), float(r), int(t))
+            for k, p, r, t in zip(keys, patients, revenue, tests)
+        ]
+        return fill_buckets(buckets, rows, granularity, start)
+
+    def doctor_totals(self, start=None, end=None):
+        """[(Patients.Doctor text, patients, revenue)] by revenue, optionally within [start, end)"""
+        with self._lock:
+            mask = self._mask(start, end)
+            codes = self._doctor.values[mask]
+            size = len(self._doctors.values)
+            counts = np.bincount(codes, minlength=size)
+            revenue = np.bincount(codes, weights=self._amount.values[mask], minlength=size)
+            doctors = list(self._doctors.values)
+        found = np.nonzero(counts)[0]
+        found = found[np.argsort(-revenue[found], kind="stable")]
+        return [(doctors[code], int(counts[code]), float(revenue[code])) for code in found]
+
+    def item_counts(self, start=None, end=None):
+        """{test item: occurrences} for the comma separated Tests items, most frequent first"""
+        with self._lock:
+            mask = self._mask(start, end)
+            rows = self._item_rows.values
+            ids = self._item_ids.values[mask[rows]]
+            counts = np.bincount(ids, minlength=len(self._items.values))
+            items = list(self._items.values)
+        found = np.nonzero(counts)[0]
+        found = found[np.argsort(-counts[found], kind="stable")]
+        return {items[code]: int(counts[code]) for code in found}
+
+    def test_totals(self, names):
+        """Patients count and revenue per catalog test, like test_matcher.aggregate_tests"""
+        names = tuple(names)
+        with self._lock:
+            if names != self._catalog:
+                self._match_catalog(names)
+            rows = self._catalog_rows.values
+            keep = self._alive.values[rows]
+            ids = self._catalog_ids.values[keep]
+            counts = np.bincount(ids, minlength=len(names))
+            revenue = np.bincount(ids, weights=self._amount.values[rows[keep]], minlength=len(names))
+        return [int(c) for c in counts], [float(r) for r in revenue]
+
+    def _match_catalog(self, names):
+        """Re-run the matcher over every row - only when the test catalog changes"""
+        matcher = get_matcher(names)
+        self._catalog = names
+        self._catalog_rows = _Column(np.int32)
+        self._catalog_ids = _Column(np.int32)
+        for row, tests in enumerate(self._tests):
+            for index in matcher.match(tests):
+                self._catalog_rows.append(row)
+                self._catalog_ids.append(index)
+
+
+# ---------------------------------------
+# Process-wide cube
+# ---------------------------------------
+_cube = None
+_checked_at = 0.0
+_pending = None             # changes committed while a rebuild is loading
+_state_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+
+
+def get_cube(cursor):
+    """
+    Return the loaded cube, loading it with `cursor` the first time and
+    rebuilding it when it no longer matches the database.
+    """
+    global _checked_at
+    cube = _cube
+    if cube is None:
+        return _rebuild(cursor, None)
+    if time.monotonic() - _checked_at >= DRIFT_CHECK_SECONDS:
+        _checked_at = time.monotonic()
+        if has_drifted(cursor, cube):
+            logger.warning("Analytics cube drifted from Patients - rebuilding")
+            return _rebuild(cursor, cube)
+    return cube
+
+
+def has_drifted(cursor, cube):
+    """True if row count, highest MrNo or total Amount differ from the database"""
+    cursor.execute(DRIFT_SQL)
+    count, max_mr_no, revenue = cursor.fetchone()
+    rows, cube_max, cube_revenue = cube.summary()
+    return (count, max_mr_no) != (rows, cube_max) or abs(float(revenue) - cube_revenue) > 0.005
+
+
+def _rebuild(cursor, replacing):
+    global _cube, _checked_at, _pending
+    with _rebuild_lock:
+        if _cube is not replacing:
+            return _cube  # another thread rebuilt it meanwhile
+        with _state_lock:
+            _pending = []
+        try:
+            cube = AnalyticsCube.load(cursor)
+        except Exception:
+            with _state_lock:
+                _pending = None
+            raise
+        with _state_lock:
+            # Writes committed during the load may or may not be in it - replay them
+            for change in _pending:
+                cube.apply(change)
+            _pending = None
+            _cube = cube
+            _checked_at = time.monotonic()
+        return cube
+
+
+def reset_cube():
+    """Drop the cube - the next get_cube() reloads it"""
+    global _cube
+    with _state_lock:
+        _cube = None
+
+
+def warm_cube():
+    """Load the cube on a background thread (at startup)"""
+    def load():
+        try:
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+                try:
+                    get_cube(cursor)
+                finally:
+                    cursor.close()
+        except Exception as e:
+            logger.error(f"Loading the analytics cube failed: {str(e)}")
+
+    thread = threading.Thread(target=load, name="AnalyticsCubeLoader", daemon=True)
+    thread.start()
+    return thread
+
+
+def _on_patient_change(change):
+    with _state_lock:
+        if _pending is not None:
+            _pending.append(change)
+        cube = _cube
+    if cube is not None:
+        cube.apply(change)
+
+
+add_change_listener(_on_patient_change)
@@ -0,0 +1,174 @@
+# models/daily_stats.py - DailyPatientStats rollup: per-RegDate patient counters
+#
+#   python -m models.daily_stats [--fix] [--start YYYY-MM-DD --end YYYY-MM-DD]
+#
+# Reconciles the rollup against Patients and (with --fix) rewrites the days
+# that disagree. Checking only reads; schedule --fix for a quiet hour (e.g.
+# nightly), since a day rewritten while it is still taking registrations can
+# be off until the next run.
+
+import argparse
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from db import unit_of_work
+from db.predicates import DateRange, as_date
+from models.time_buckets import TEST_COUNT_SQL, count_tests
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("Patients", "Revenue", "MalePatients", "FemalePatients", "OtherPatients", "Tests")
+
+_GENDER_COUNTERS = {"Male": "MalePatients", "Female": "FemalePatients"}
+
+
+def _delta(sign, gender, amount, tests):
+    """Counter deltas (in COUNTERS order) for adding (+1) or removing (-1) one patient"""
+    gender_counter = _GENDER_COUNTERS.get(gender, "OtherPatients")
+    return (
+        sign,
+        sign * Decimal(str(amount or 0)),
+        sign if gender_counter == "MalePatients" else 0,
+        sign if gender_counter == "FemalePatients" else 0,
+        sign if gender_counter == "OtherPatients" else 0,
+        sign * count_tests(tests),
+    )
+
+
+def _apply(cursor, reg_date, delta):
+    """Add `delta` to the row for `reg_date`, creating it on the first patient of the day"""
+    # UPDLOCK + SERIALIZABLE holds the key range, so two first-of-the-day
+    # registrations can't both miss the row and insert it twice
+    cursor.execute(f"""
+        UPDATE DailyPatientStats WITH (UPDLOCK, SERIALIZABLE)
+        SET {', '.join(f'{c} = {c} + ?' for c in COUNTERS)}
+        WHERE StatDate = ?
+    """, (*delta, reg_date))
+    if cursor.rowcount == 0:
+        cursor.execute(f"""
+            INSERT INTO DailyPatientStats (StatDate, {', '.join(COUNTERS)})
+            VALUES (?, {', '.join('?' for _ in COUNTERS)})
+        """, (reg_date, *delta))
+
+
+def record_added(cursor, reg_date, gender, amount, tests):
+    """A patient was registered - call inside the same transaction"""
+    _apply(cursor, as_date(reg_date), _delta(1, gender, amount, tests))
+
+
+def record_removed(cursor, reg_date, gender, amount, tests):
+    """A patient was deleted - call inside the same transaction"""
+    _apply(cursor, as_date(reg_date), _delta(-1, gender, amount, tests))
+
+
+def record_changed(cursor, reg_date, old, new):
+    """A patient was edited; old / new are (gender, amount, tests)"""
+    removed, added = _delta(-1, *old), _delta(1, *new)
+    delta = tuple(a + b for a, b in zip(removed, added))
+    if any(delta):
+        _apply(cursor, as_date(reg_date), delta)
+
+
+def get_totals(cursor, date_range=None):
+    """Summed counters over all days (or a DateRange) - one small aggregate over the rollup"""
+    where, params = ("", ())
+    if date_range is not None:
+        where, params = date_range.predicate("StatDate")
+        where = "WHERE " + where
+    cursor.execute(f"""
+        SELECT {', '.join(f'ISNULL(SUM({c}), 0)' for c in COUNTERS)}
+        FROM DailyPatientStats
+        {where}
+    """, params)
+    row = cursor.fetchone()
+    totals = dict(zip(COUNTERS, row))
+    totals["Revenue"] = float(totals["Revenue"])
+    return totals
+
+
+# ---------------------------------------
+# Reconcile
+# ---------------------------------------
+def _actual(cursor, date_range):
+    where, params = date_range.predicate() if date_range else ("1 = 1", ())
+    cursor.execute(f"""
+        SELECT RegDate, COUNT(*), ISNULL(SUM(Amount), 0),
+            SUM(CASE WHEN Gender = 'Male' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN Gender = 'Female' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN Gender NOT IN ('Male', 'Female') THEN 1 ELSE 0 END),
+            ISNULL(SUM({TEST_COUNT_SQL}), 0)
+        FROM Patients
+        WHERE {where}
+        GROUP BY RegDate
+    """, params)
+    return {as_date(row[0]): _normalize(row[1:]) for row in cursor.fetchall()}
+
+
+def _recorded(cursor, date_range):
+    where, params = date_range.predicate("StatDate") if date_range else ("1 = 1", ())
+    cursor.execute(f"SELECT StatDate, {', '.join(COUNTERS)} FROM DailyPatientStats WHERE {where}", params)
+    return {as_date(row[0]): _normalize(row[1:]) for row in cursor.fetchall()}
+
+
+def _normalize(counters):
+    patients, revenue, male, female, other, tests = counters
+    return (int(patients), round(float(revenue or 0), 2), int(male or 0), int(female or 0),
+            int(other or 0), int(tests or 0))
+
+
+def reconcile(cursor, date_range=None, fix=False):
+    """
+    Compare the rollup with an aggregate of Patients. Returns
+    {date: (recorded, actual)} for every day that differs; with fix=True
+    those days are rewritten from Patients in the caller's transaction.
+    """
+    actual = _actual(cursor, date_range)
+    recorded = _recorded(cursor, date_range)
+    empty = (0, 0.0, 0, 0, 0, 0)
+
+    mismatches = {}
+    for day in sorted(set(actual) | set(recorded)):
+        expected, found = actual.get(day, empty), recorded.get(day, empty)
+        if expected != found:
+            mismatches[day] = (found, expected)
+
+    if fix:
+        for day, (_, expected) in mismatches.items():
+            cursor.execute("DELETE FROM DailyPatientStats WHERE StatDate = ?", (day,))
+            if expected != empty:
+                cursor.execute(f"""
+                    INSERT INTO DailyPatientStats (StatDate, {', '.join(COUNTERS)})
+                    VALUES (?, {', '.join('?' for _ in COUNTERS)})
+                """, (day, *expected))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify DailyPatientStats against Patients")
+    parser.add_argument("--fix", action="store_true", help="rewrite the days that differ")
+    parser.add_argument("--start", help="first RegDate to check (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last RegDate to check (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    date_range = None
+    if args.start or args.end:
+        if not (args.start and args.end):
+            parser.error("--start and --end go together")
+        date_range = DateRange(args.start, as_date(args.end) + timedelta(days=1))
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    with unit_of_work() as conn:
+        cursor = conn.cursor()
+        mismatches = reconcile(cursor, date_range, fix=args.fix)
+        cursor.close()
+
+    for day, (found, expected) in mismatches.items():
+        logger.warning(f"{day}: rollup {dict(zip(COUNTERS, found))} != patients {dict(zip(COUNTERS, expected))}")
+    action = "fixed" if args.fix else "found"
+    print(f"✅ DailyPatientStats reconciled: {len(mismatches)} mismatched days {action}")
+    return 1 if mismatches and not args.fix else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
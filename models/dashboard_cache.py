@@ -0,0 +1,188 @@
+# models/dashboard_cache.py - Admin dashboard panel snapshots with stale-while-revalidate
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from db import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+
+class _Panel:
+    __slots__ = ("name", "compute", "ttl", "affects")
+
+    def __init__(self, name, compute, ttl, affects):
+        self.name = name
+        self.compute = compute
+        self.ttl = ttl
+        self.affects = affects
+
+
+class _Snapshot:
+    __slots__ = ("value", "computed_at", "stale", "failed_at")
+
+    def __init__(self, value, computed_at):
+        self.value = value
+        self.computed_at = computed_at
+        self.stale = False      # invalidated by a write
+        self.failed_at = None   # last failed refresh (backoff)
+
+
+class DashboardCache:
+    """
+    Last good payload per dashboard panel.
+
+    - fresh snapshots (younger than the panel TTL) are served as-is
+    - expired snapshots are served immediately while one background
+      refresh recomputes them (stale-while-revalidate)
+    - snapshots invalidated by a write wait up to `wait_timeout` seconds for
+      the refresh, then fall back to the old snapshot
+    - if the database is slow or down the last good snapshot keeps being
+      served; failed refreshes are retried after `retry_interval` seconds
+    """
+
+    def __init__(self, max_workers=2, wait_timeout=2.0, cold_timeout=30.0, retry_interval=5.0):
+        self.wait_timeout = wait_timeout
+        self.cold_timeout = cold_timeout
+        self.retry_interval = retry_interval
+        self._panels = {}
+        self._snapshots = {}
+        self._generations = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="DashboardRefresh")
+
+    def register(self, name, compute, ttl, affects=None):
+        """
+        compute(cursor) -> JSON payload (raise on failure).
+        affects(reg_date) -> True if a patient write on that date changes the panel
+        (None means every patient write does).
+        """
+        self._panels[name] = _Panel(name, compute, ttl, affects)
+        self._generations.setdefault(name, 0)
+
+    @property
+    def panels(self):
+        return list(self._panels)
+
+    def get(self, name):
+        """Return (payload, status, age_seconds); status is HIT, STALE or MISS"""
+        return self._resolve(name, self._begin(name), None)
+
+    def get_many(self, names, timeout):
+        """
+        get() for several panels at once: refreshes run concurrently on the
+        executor and all panels share one `timeout` deadline. Returns
+        {name: (payload, status, age_seconds) or the exception raised}.
+        """
+        started = {name: self._begin(name) for name in names}
+        deadline = time.monotonic() + timeout
+        results = {}
+        for name, state in started.items():
+            try:
+                results[name] = self._resolve(name, state, deadline)
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def _begin(self, name):
+        """Serve from the snapshot if possible, otherwise start (or join) a refresh"""
+        panel = self._panels[name]
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot and not snapshot.stale and now - snapshot.computed_at < panel.ttl:
+                return (snapshot.value, "HIT", now - snapshot.computed_at), None, None
+            if snapshot and snapshot.failed_at and now - snapshot.failed_at < self.retry_interval:
+                return (snapshot.value, "STALE", now - snapshot.computed_at), None, None
+            return None, snapshot, self._refresh_locked(panel)
+
+    def _resolve(self, name, state, deadline):
+        ready, snapshot, future = state
+        if ready is not None:
+            return ready
+
+        def wait(limit):
+            if deadline is not None:
+                limit = max(0.0, min(limit, deadline - time.monotonic()))
+            return future.result(timeout=limit)
+
+        if snapshot is None:
+            # Cold start - nothing to fall back to
+            try:
+                return wait(self.cold_timeout), "MISS", 0.0
+            except FutureTimeout:
+                raise TimeoutError(f"Dashboard panel '{name}' is still computing")
+
+        if snapshot.stale:
+            try:
+                return wait(self.wait_timeout), "MISS", 0.0
+            except Exception:
+                pass  # slow or failing database - serve the last good snapshot
+        return snapshot.value, "STALE", time.monotonic() - snapshot.computed_at
+
+    def warm(self):
+        """Start computing every panel that has no fresh snapshot"""
+        now = time.monotonic()
+        with self._lock:
+            for panel in self._panels.values():
+                snapshot = self._snapshots.get(panel.name)
+                if snapshot is None or snapshot.stale or now - snapshot.computed_at >= panel.ttl:
+                    self._refresh_locked(panel)
+
+    def invalidate(self, *names):
+        """Mark panels stale (all panels when called without names)"""
+        with self._lock:
+            for name in names or list(self._panels):
+                self._generations[name] = self._generations.get(name, 0) + 1
+                snapshot = self._snapshots.get(name)
+                if snapshot:
+                    snapshot.stale = True
+                    snapshot.failed_at = None
+
+    def invalidate_for_date(self, reg_date):
+        """Invalidate only the panels whose window contains `reg_date`"""
+        names = [
+            panel.name for panel in self._panels.values()
+            if reg_date is None or panel.affects is None or panel.affects(reg_date)
+        ]
+        if names:
+            self.invalidate(*names)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def _refresh_locked(self, panel):
+        future = self._inflight.get(panel.name)
+        if future is None:
+            future = self._executor.submit(self._refresh, panel, self._generations.get(panel.name, 0))
+            self._inflight[panel.name] = future
+        return future
+
+    def _refresh(self, panel, generation):
+        try:
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+                try:
+                    value = panel.compute(cursor)
+                finally:
+                    cursor.close()
+        except Exception as e:
+            logger.error(f"Refreshing dashboard panel '{panel.name}' failed: {str(e)}")
+            with self._lock:
+                self._inflight.pop(panel.name, None)
+                snapshot = self._snapshots.get(panel.name)
+                if snapshot:
+                    snapshot.failed_at = time.monotonic()
+            raise
+
+        with self._lock:
+            self._inflight.pop(panel.name, None)
+            snapshot = _Snapshot(value, time.monotonic())
+            # A write that landed while computing may not be in `value`
+            snapshot.stale = self._generations.get(panel.name, 0) != generation
+            self._snapshots[panel.name] = snapshot
+        return value
@@ -0,0 +1,57 @@
+# models/doctor_index.py - Normalized lookup from free-text Patients.Doctor to Doctors rows
+
+import re
+import threading
+
+_PREFIX_RE = re.compile(r"^(?:dr|doctor)\b\.?\s*")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_doctor_name(name):
+    """'  DR.  Ahmed   khan ' -> 'ahmed khan'"""
+    if not name:
+        return ""
+    key = " ".join(name.split()).lower()
+    key = _PREFIX_RE.sub("", key)
+    key = _PUNCT_RE.sub(" ", key)
+    return " ".join(key.split())
+
+
+class DoctorIndex:
+    """Active doctors keyed by normalized name"""
+
+    def __init__(self, rows):
+        # rows: (DoctorId, Name, Specialization) ordered by Name
+        self.doctors = [tuple(row) for row in rows]
+        self._by_key = {}
+        for doctor in self.doctors:
+            # First doctor wins if two names normalize to the same key
+            self._by_key.setdefault(normalize_doctor_name(doctor[1]), doctor)
+
+    def lookup(self, name):
+        """Doctors row for a free-text doctor name, or None"""
+        return self._by_key.get(normalize_doctor_name(name))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_doctor_index(cursor):
+    """Return the cached index, loading it with `cursor` the first time"""
+    global _index
+    index = _index
+    if index is None:
+        cursor.execute("SELECT DoctorId, Name, Specialization FROM Doctors WHERE IsActive = 1 ORDER BY Name")
+        index = DoctorIndex(cursor.fetchall())
+        with _index_lock:
+            if _index is None:
+                _index = index
+    return index
+
+
+def invalidate_doctor_index():
+    """Drop the cached index - call after the Doctors table changes"""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,143 @@
+# models/letterhead.py - Clinic letterhead prepared once per process and shared by every PDF
+
+import logging
+import os
+import threading
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import SimpleDocTemplate
+
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "logo.png")
+LOGO_SIZE = 1.2 * inch
+LOGO_DPI = 200                  # the logo prints 1.2" wide - more pixels only add bytes
+
+CLINIC_NAME = "CITI LAB & DIAGNOSTIC CENTRE"
+CLINIC_LINES = ("Opposite: C.M.H Muzaffarabad Azad Kashmir", "Cell: 0301-5225117 | Ph: 05822-447698")
+FOOTER_LINES = ("Thank you for choosing Citi Lab & Diagnostic Centre", "For any queries, please contact: 0301-5225117")
+
+BRAND_COLOR = colors.Color(0, 0.4, 0.4)
+PAGE_MARGIN = 30
+EDGE_MARGIN = 20
+HEADER_HEIGHT = LOGO_SIZE + 16
+HEADER_GAP = 18
+FOOTER_HEIGHT = 48
+
+# Part of every cached PDF's key - bump when the letterhead or a strategy's layout changes
+TEMPLATE_VERSION = 1
+
+_logo_jpeg = None
+_logo_lock = threading.Lock()
+_styles = None
+
+
+def _load_logo():
+    """static/logo.png scaled to print size, flattened onto the header colour, as JPEG bytes"""
+    from PIL import Image as PILImage
+
+    pixels = int(LOGO_SIZE / inch * LOGO_DPI)
+    with PILImage.open(LOGO_PATH) as logo:
+        logo = logo.convert("RGBA")
+        logo.thumbnail((pixels, pixels), PILImage.LANCZOS)
+        background = PILImage.new("RGB", logo.size, tuple(int(c * 255) for c in BRAND_COLOR.rgb()))
+        background.paste(logo, mask=logo.split()[3])
+    out = BytesIO()
+    background.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def logo_jpeg():
+    """Cached logo bytes (b"" if the file is missing or unreadable)"""
+    global _logo_jpeg
+    if _logo_jpeg is None:
+        with _logo_lock:
+            if _logo_jpeg is None:
+                try:
+                    _logo_jpeg = _load_logo()
+                except Exception as e:
+                    logger.warning(f"Letterhead logo unavailable: {str(e)}")
+                    _logo_jpeg = b""
+    return _logo_jpeg
+
+
+def get_styles():
+    """
+    One shared stylesheet. Styles are only read while documents build, so
+    strategies must derive new styles (ParagraphStyle(parent=...)) rather
+    than change these.
+    """
+    global _styles
+    if _styles is None:
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle("Receipt", parent=styles["Normal"], fontSize=11))
+        _styles = styles
+    return _styles
+
+
+def _draw_header(canvas, width, height):
+    top = height - EDGE_MARGIN
+    left = PAGE_MARGIN
+    canvas.setFillColor(BRAND_COLOR)
+    canvas.rect(left, top - HEADER_HEIGHT, width - 2 * PAGE_MARGIN, HEADER_HEIGHT, stroke=0, fill=1)
+
+    jpeg = logo_jpeg()
+    if jpeg:
+        # JPEG data is embedded as-is (DCTDecode) - no decoding or recompression per PDF
+        canvas.drawImage(ImageReader(BytesIO(jpeg)), left + 10, top - 8 - LOGO_SIZE, LOGO_SIZE, LOGO_SIZE)
+
+    text_left = left + 1.4 * inch + 10
+    canvas.setFillColor(colors.white)
+    canvas.setFont("Helvetica-Bold", 16)
+    canvas.drawString(text_left, top - 36, CLINIC_NAME)
+    canvas.setStrokeColor(colors.white)
+    canvas.setLineWidth(1)
+    canvas.line(text_left, top - 46, width - PAGE_MARGIN - 10, top - 46)
+    canvas.setFont("Helvetica", 10)
+    for i, line in enumerate(CLINIC_LINES):
+        canvas.drawString(text_left, top - 62 - 13 * i, line)
+
+
+def _draw_footer(canvas, width, note):
+    canvas.setFillColor(colors.black)
+    lines = [("Helvetica-BoldOblique", FOOTER_LINES[0])] + [("Helvetica-Oblique", line) for line in FOOTER_LINES[1:]]
+    lines.append(("Helvetica-Oblique", note))
+    for i, (font, line) in enumerate(lines):
+        canvas.setFont(font, 9)
+        canvas.drawString(PAGE_MARGIN, EDGE_MARGIN + 12 * (len(lines) - 1 - i), line)
+
+
+def letterhead_document(buffer, note):
+    """
+    A4 SimpleDocTemplate whose frame leaves room for the letterhead, and the
+    page callback that stamps it. The header and the `note` footer line are
+    drawn once per PDF into a form XObject that every page references, so
+    strategies only lay out the patient specific flowables:
+
+        doc, on_page = letterhead_document(buffer, "This is a computer generated receipt")
+        doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
+    """
+    width, height = A4
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4,
+        rightMargin=PAGE_MARGIN, leftMargin=PAGE_MARGIN,
+        topMargin=EDGE_MARGIN + HEADER_HEIGHT + HEADER_GAP,
+        bottomMargin=EDGE_MARGIN + FOOTER_HEIGHT,
+    )
+
+    def on_page(canvas, doc):
+        if not canvas.hasForm("Letterhead"):
+            canvas.beginForm("Letterhead")
+            _draw_header(canvas, width, height)
+            _draw_footer(canvas, width, note)
+            canvas.endForm()
+        canvas.saveState()
+        canvas.doForm("Letterhead")
+        canvas.restoreState()
+
+    return doc, on_page
@@ -0,0 +1,88 @@
+# models/patient_cache.py - Bounded LRU + TTL cache of single patients (PDF reprints)
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models.patient_model import Patient, add_change_listener
+
+PATIENT_CACHE_SIZE = int(os.environ.get("PATIENT_CACHE_SIZE", 1024))
+PATIENT_CACHE_TTL = float(os.environ.get("PATIENT_CACHE_TTL", 300))    # seconds
+
+
+class PatientCache:
+    """
+    Patients by MrNo, least recently used evicted beyond `max_size`, entries
+    expire after `ttl` seconds. Misses (unknown MrNo, database errors) are
+    not cached.
+
+    Writes invalidate through the patient change listeners. A lookup that
+    raced with a write (started before the invalidation, finished after it)
+    is returned but not stored, so the cache never keeps the pre-write row.
+    """
+
+    def __init__(self, loader, max_size=PATIENT_CACHE_SIZE, ttl=PATIENT_CACHE_TTL):
+        self._loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()   # mr_no -> (patient, loaded_at)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, mr_no):
+        """The patient dict for `mr_no` (a copy), or None"""
+        mr_no = int(mr_no)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(mr_no)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(mr_no)
+                self.hits += 1
+                return dict(entry[0])
+            self._entries.pop(mr_no, None)
+            self.misses += 1
+            generation = self._generation
+
+        patient = self._loader(mr_no)
+        if patient is None:
+            return None
+        with self._lock:
+            if generation == self._generation:
+                self._entries[mr_no] = (patient, time.monotonic())
+                self._entries.move_to_end(mr_no)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return dict(patient)
+
+    def invalidate(self, mr_no):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(int(mr_no), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+patient_cache = PatientCache(Patient.get_patient_by_mr_no)
+
+
+def get_patient(mr_no):
+    """Cached Patient.get_patient_by_mr_no()"""
+    return patient_cache.get(mr_no)
+
+
+def _on_patient_change(change):
+    if change.action in ("update", "delete"):
+        patient_cache.invalidate(change.mr_no)
+
+
+add_change_listener(_on_patient_change)
@@ -1,7 +1,25 @@
 # models/patient_model.py - UPDATED WITH EDIT AND DELETE METHODS
 
 import re
-from db import get_connection
+from db import STREAM_BATCH_SIZE, on_commit, stream_query, unit_of_work
+from db.rows import fetch_all, fetch_one
+from db.predicates import DateRange
+from models.daily_stats import get_totals, record_added, record_changed, record_removed
+from models.receipt_model import create_receipt, delete_receipts, sync_receipt
+
+# Patient listing page size (default / cap)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Listing columns and their to_dict() keys
+PATIENT_COLUMNS = "MrNo, RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount"
+PATIENT_FIELDS = ("mr_no", "reg_date", "reporting_date", "name", "gender", "age", "doctor", "tests", "amount")
+
+# Sort keys the saved-patients table may order by -> Patients column
+SORTABLE_COLUMNS = {
+    "mr_no": "MrNo", "name": "Name", "age": "Age", "gender": "Gender",
+    "doctor": "Doctor", "amount": "Amount", "reg_date": "RegDate",
+}
 
 def _to_snake(name: str) -> str:
     s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
@@ -42,7 +60,58 @@ def validate_patient(data):
 
     return errors
 
+# ---------------------------------------
+# Change listeners (Observer) - caches and read models subscribe here
+# ---------------------------------------
+def _patient_filters(date_range=None, doctor=None, gender=None):
+    """(conditions, params) for the optional listing filters"""
+    where, params = [], []
+    if date_range is not None:
+        sql, range_params = date_range.predicate()
+        where.append(sql)
+        params.extend(range_params)
+    if doctor:
+        where.append("Doctor = ?")
+        params.append(doctor)
+    if gender:
+        where.append("Gender = ?")
+        params.append(gender)
+    return where, params
+
+class PatientChange:
+    """A committed patient write: action is 'add', 'update' or 'delete'"""
+
+    __slots__ = ("action", "mr_no", "reg_date", "data")
+
+    def __init__(self, action, mr_no, reg_date=None, data=None):
+        self.action = action
+        self.mr_no = mr_no
+        self.reg_date = reg_date
+        self.data = data or {}
+
+_change_listeners = []
+
+def add_change_listener(listener):
+    """Call listener(PatientChange) after every committed add / update / delete"""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+def remove_change_listener(listener):
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+def _notify_change(change):
+    for listener in list(_change_listeners):
+        try:
+            listener(change)
+        except Exception as e:
+            print(f"Patient change listener failed: {str(e)}")
+
 class Patient:
+    """One Patients row; slotted so large listings don't carry a __dict__ per record"""
+
+    __slots__ = PATIENT_FIELDS
+
     def __init__(self, mr_no=None, reg_date=None, reporting_date=None, name=None, gender=None,
                  age=None, doctor=None, tests=None, amount=None):
         self.mr_no = mr_no
@@ -68,6 +137,16 @@ class Patient:
             "amount": self.amount
         }
 
+    def as_tuple(self):
+        """Values in PATIENT_FIELDS order (e.g. a CSV row)"""
+        return (self.mr_no, self.reg_date, self.reporting_date, self.name, self.gender,
+                self.age, self.doctor, self.tests, self.amount)
+
+    @classmethod
+    def from_row(cls, row):
+        """Record from a row selected with PATIENT_COLUMNS"""
+        return cls(*row)
+
     @staticmethod
     def add_patient(data: dict):
         # 1. VALIDATE FIRST
@@ -75,82 +154,178 @@ class Patient:
         if errors:
             return {"success": False, "errors": errors}
 
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            query = """
-                INSERT INTO Patients 
-                (RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount)
-                OUTPUT INSERTED.MrNo
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """
-
-            cursor.execute(query, (
-                data['reg_date'],
-                data['reporting_date'],
-                data['name'],
-                data['gender'],
-                data['age'],
-                data['doctor'],
-                data['tests'],
-                data['amount']
-            ))
-
-            inserted = cursor.fetchone()
-            conn.commit()
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+
+                query = """
+                    INSERT INTO Patients 
+                    (RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount)
+                    OUTPUT INSERTED.MrNo
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """
+
+                cursor.execute(query, (
+                    data['reg_date'],
+                    data['reporting_date'],
+                    data['name'],
+                    data['gender'],
+                    data['age'],
+                    data['doctor'],
+                    data['tests'],
+                    data['amount']
+                ))
+
+                inserted = cursor.fetchone()
+
+                # Normalized billing rows and daily counters commit (or roll back) with the patient
+                create_receipt(cursor, inserted[0], data['tests'], data['amount'])
+                record_added(cursor, data['reg_date'], data['gender'], data['amount'], data['tests'])
+                cursor.close()
+
+                change = PatientChange("add", inserted[0], data['reg_date'], data)
+                on_commit(lambda: _notify_change(change))
 
             return {"success": True, "mr_no": inserted[0]}
 
         except Exception as e:
             print(f"Database Error: {str(e)}")  # Debug print
-            if conn:
-                conn.rollback()
             return {"success": False, "errors": [f"Database error: {str(e)}"]}
 
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Error closing connection: {str(e)}")
-
     @staticmethod
     def get_all_patients():
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT MrNo, RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount
-                FROM Patients
-                ORDER BY MrNo DESC
-            """)
+                cursor.execute("""
+                    SELECT MrNo, RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount
+                    FROM Patients
+                    ORDER BY MrNo DESC
+                """)
 
-            cols = [col[0] for col in cursor.description]
-            snake_cols = [_to_snake(c) for c in cols]
-            rows = cursor.fetchall()
+                patients = fetch_all(cursor, rename=_to_snake)
+                cursor.close()
 
-            return [dict(zip(snake_cols, row)) for row in rows]
+            return patients
 
         except Exception as e:
             print(f"Error fetching patients: {str(e)}")  # Debug print
             return []
 
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Error closing connection: {str(e)}")
+    @staticmethod
+    def get_patients_page(after=None, limit=PAGE_SIZE, date_range=None, doctor=None, gender=None):
+        """
+        One page of patients, newest MrNo first, continuing below MrNo `after`.
+
+        Keyset pagination: `MrNo < ?` seeks the primary key, so page 1000 costs
+        the same as page 1 (OFFSET would read and discard every earlier row).
+        Returns {"patients", "next_cursor", "has_more"}; pass next_cursor back
+        as `after` for the following page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = _patient_filters(date_range, doctor, gender)
+        if after is not None:
+            where.insert(0, "MrNo < ?")
+            params.insert(0, int(after))
+
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            # One extra row tells whether another page follows
+            cursor.execute(f"""
+                SELECT TOP {limit + 1} {PATIENT_COLUMNS}
+                FROM Patients
+                {"WHERE " + " AND ".join(where) if where else ""}
+                ORDER BY MrNo DESC
+            """, params)
+            patients = fetch_all(cursor, rename=_to_snake)
+            cursor.close()
+
+        has_more = len(patients) > limit
+        del patients[limit:]
+        return {
+            "patients": patients,
+            "next_cursor": patients[-1]["mr_no"] if has_more else None,
+            "has_more": has_more
+        }
+
+    @staticmethod
+    def stream_patients(date_range=None, doctor=None, gender=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        Every matching patient as a Patient record, newest MrNo first, read
+        with fetchmany() on a dedicated connection - only one batch of rows is
+        held at a time, however large the result. Records are turned into
+        dicts (to_dict) or tuples (as_tuple) only by whoever writes them out.
+        """
+        where, params = _patient_filters(date_range, doctor, gender)
+        batches = stream_query(f"""
+            SELECT {PATIENT_COLUMNS}
+            FROM Patients
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY MrNo DESC
+        """, params, batch_size)
+        for rows in batches:
+            yield from map(Patient.from_row, rows)
+
+    @staticmethod
+    def search_patients(offset=0, limit=PAGE_SIZE, search=None, order_by="mr_no", descending=True,
+                        doctor=None, gender=None):
+        """
+        One sorted, filtered page for the saved-patients table.
+
+        `search` matches an exact MR No or a Name / Doctor prefix - prefixes
+        can seek IX_Patients_Name / IX_Patients_Doctor where '%term%' would
+        scan every row. `order_by` is a to_dict() key from SORTABLE_COLUMNS.
+        Returns (total, filtered, patients): total comes from the
+        DailyPatientStats rollup, filtered is only counted when a filter is set.
+        """
+        column = SORTABLE_COLUMNS.get(order_by, "MrNo")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = [], []
+        if search:
+            term = re.sub(r"([\\%_\[])", r"\\\1", search.strip()) + "%"
+            matches = ["Name LIKE ? ESCAPE '\\'", "Doctor LIKE ? ESCAPE '\\'"]
+            params.extend([term, term])
+            if search.strip().isdigit():
+                matches.append("MrNo = ?")
+                params.append(int(search.strip()))
+            where.append("(" + " OR ".join(matches) + ")")
+        filters, filter_params = _patient_filters(None, doctor, gender)
+        where += filters
+        params += filter_params
+        where_sql = "WHERE " + " AND ".join(where) if where else ""
+        direction = "DESC" if descending else "ASC"
+
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            total = get_totals(cursor)["Patients"]
+            filtered = total
+            if where:
+                cursor.execute(f"SELECT COUNT(*) FROM Patients {where_sql}", params)
+                filtered = cursor.fetchone()[0]
+
+            # MrNo breaks ties so pages don't overlap when the sort column repeats
+            cursor.execute(f"""
+                SELECT {PATIENT_COLUMNS}
+                FROM Patients
+                {where_sql}
+                ORDER BY {column} {direction}{", MrNo " + direction if column != "MrNo" else ""}
+                OFFSET {max(0, int(offset))} ROWS FETCH NEXT {limit} ROWS ONLY
+            """, params)
+            patients = fetch_all(cursor, rename=_to_snake)
+            cursor.close()
+
+        return total, filtered, patients
+
+    @staticmethod
+    def get_doctor_names():
+        """Distinct Patients.Doctor values for filter dropdowns (read off IX_Patients_Doctor)"""
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT Doctor FROM Patients WHERE Doctor IS NOT NULL AND Doctor <> '' ORDER BY Doctor")
+            names = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+        return names
 
     # =============================================
     # NEW METHODS FOR EDIT AND DELETE FUNCTIONALITY
@@ -159,153 +334,137 @@ class Patient:
     @staticmethod
     def update_patient(mr_no, data):
         """Update patient in database"""
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Check if patient exists
-            cursor.execute("SELECT * FROM Patients WHERE MrNo = ?", (mr_no,))
-            if not cursor.fetchone():
-                return {"success": False, "message": "Patient not found"}
-            
-            # Update patient
-            cursor.execute("""
-                UPDATE Patients 
-                SET Name = ?, Age = ?, Gender = ?, Doctor = ?, Tests = ?, Amount = ?
-                WHERE MrNo = ?
-            """, (
-                data['name'],
-                data['age'], 
-                data['gender'],
-                data['doctor'],
-                data['tests'],
-                data['amount'],
-                mr_no
-            ))
-            
-            conn.commit()
-            
-            if cursor.rowcount > 0:
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+
+                # Old values (locked until commit) for the daily counters delta
+                cursor.execute(
+                    "SELECT RegDate, Gender, Amount, Tests FROM Patients WITH (UPDLOCK) WHERE MrNo = ?",
+                    (mr_no,)
+                )
+                updated = cursor.fetchone()
+                if updated:
+                    cursor.execute("""
+                        UPDATE Patients 
+                        SET Name = ?, Age = ?, Gender = ?, Doctor = ?, Tests = ?, Amount = ?
+                        WHERE MrNo = ?
+                    """, (
+                        data['name'],
+                        data['age'], 
+                        data['gender'],
+                        data['doctor'],
+                        data['tests'],
+                        data['amount'],
+                        mr_no
+                    ))
+                    record_changed(cursor, updated[0], tuple(updated[1:]),
+                                   (data['gender'], data['amount'], data['tests']))
+                    sync_receipt(cursor, mr_no, data['tests'], data['amount'])
+                cursor.close()
+
+                if updated:
+                    change = PatientChange("update", mr_no, updated[0], data)
+                    on_commit(lambda: _notify_change(change))
+
+            if updated:
                 return {"success": True, "message": "Patient updated successfully"}
             else:
-                return {"success": False, "message": "No changes made"}
+                return {"success": False, "message": "Patient not found"}
                 
         except Exception as e:
             print(f"Database update error: {str(e)}")
-            if conn:
-                conn.rollback()
             return {"success": False, "message": f"Database error: {str(e)}"}
-        
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Error closing connection: {str(e)}")
 
     @staticmethod  
     def delete_patient(mr_no):
         """Delete patient from database"""
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Check if patient exists
-            cursor.execute("SELECT * FROM Patients WHERE MrNo = ?", (mr_no,))
-            if not cursor.fetchone():
-                return {"success": False, "message": "Patient not found"}
-            
-            # Delete patient
-            cursor.execute("DELETE FROM Patients WHERE MrNo = ?", (mr_no,))
-            conn.commit()
-            
-            if cursor.rowcount > 0:
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+                delete_receipts(cursor, mr_no)
+                cursor.execute(
+                    "DELETE FROM Patients OUTPUT DELETED.RegDate, DELETED.Gender, DELETED.Amount, DELETED.Tests "
+                    "WHERE MrNo = ?",
+                    (mr_no,)
+                )
+                deleted = cursor.fetchone()
+                if deleted:
+                    record_removed(cursor, *deleted)
+                cursor.close()
+
+                if deleted:
+                    change = PatientChange("delete", mr_no, deleted[0])
+                    on_commit(lambda: _notify_change(change))
+
+            if deleted:
                 return {"success": True, "message": "Patient deleted successfully"}
             else:
-                return {"success": False, "message": "Failed to delete patient"}
+                return {"success": False, "message": "Patient not found"}
                 
         except Exception as e:
             print(f"Database delete error: {str(e)}")
-            if conn:
-                conn.rollback()
             return {"success": False, "message": f"Database error: {str(e)}"}
-        
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Error closing connection: {str(e)}")
 
     @staticmethod
     def get_patient_by_mr_no(mr_no):
         """Get single patient by MR number"""
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT MrNo, RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount
-                FROM Patients 
-                WHERE MrNo = ?
-            """, (mr_no,))
+                cursor.execute("""
+                    SELECT MrNo, RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount
+                    FROM Patients 
+                    WHERE MrNo = ?
+                """, (mr_no,))
 
-            cols = [col[0] for col in cursor.description]
-            snake_cols = [_to_snake(c) for c in cols]
-            row = cursor.fetchone()
+                patient = fetch_one(cursor, rename=_to_snake)
+                cursor.close()
 
-            if row:
-                return dict(zip(snake_cols, row))
-            else:
-                return None
+            return patient
 
         except Exception as e:
             print(f"Error fetching patient: {str(e)}")
             return None
 
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Error closing connection: {str(e)}")
+    @staticmethod
+    def get_patients_by_mr_nos(mr_nos):
+        """Patients (dicts) for the given MR numbers, in that order; unknown numbers are left out"""
+        mr_nos = list(dict.fromkeys(int(mr_no) for mr_no in mr_nos))
+        if not mr_nos:
+            return []
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {PATIENT_COLUMNS}
+                FROM Patients
+                WHERE MrNo IN ({", ".join("?" * len(mr_nos))})
+            """, mr_nos)
+            found = {patient.mr_no: patient for patient in map(Patient.from_row, cursor.fetchall())}
+            cursor.close()
+        return [found[mr_no].to_dict() for mr_no in mr_nos if mr_no in found]
 
     @staticmethod
     def get_patient_statistics():
         """Get patient statistics for dashboard"""
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # Total patients count
-            cursor.execute("SELECT COUNT(*) FROM Patients")
-            total_patients = cursor.fetchone()[0]
-
-            # Total revenue
-            cursor.execute("SELECT SUM(Amount) FROM Patients")
-            total_revenue = cursor.fetchone()[0] or 0
-
-            # Gender distribution
-            cursor.execute("SELECT Gender, COUNT(*) FROM Patients GROUP BY Gender")
-            gender_distribution = {row[0]: row[1] for row in cursor.fetchall()}
-
-            # Today's patients
-            cursor.execute("SELECT COUNT(*) FROM Patients WHERE CAST(RegDate AS DATE) = CAST(GETDATE() AS DATE)")
-            today_patients = cursor.fetchone()[0]
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+
+                # Counters come from the DailyPatientStats rollup - a few rows, not the whole table
+                totals = get_totals(cursor)
+                today = get_totals(cursor, DateRange.today())
+                cursor.close()
+
+            total_patients = totals["Patients"]
+            total_revenue = totals["Revenue"]
+            gender_distribution = {
+                gender: totals[counter]
+                for gender, counter in (("Male", "MalePatients"), ("Female", "FemalePatients"), ("Other", "OtherPatients"))
+                if totals[counter]
+            }
+            today_patients = today["Patients"]
 
             return {
                 "total_patients": total_patients,
@@ -322,12 +481,3 @@ class Patient:
                 "gender_distribution": {},
                 "today_patients": 0
             }
-
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Error closing connection: {str(e)}")
\ No newline at end of file
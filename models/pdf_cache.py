@@ -0,0 +1,146 @@
+# models/pdf_cache.py - Disk cache of generated receipts / reports, keyed by content hash
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from models.patient_model import add_change_listener
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DIR = os.environ.get(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pdf_cache")
+)
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+
+class PDFKey:
+    """Where a PDF for (mr_no, pdf_type, patient record, template version) lives; digest doubles as the ETag"""
+
+    __slots__ = ("mr_no", "pdf_type", "digest")
+
+    def __init__(self, mr_no, pdf_type, digest):
+        self.mr_no = mr_no
+        self.pdf_type = pdf_type
+        self.digest = digest
+
+    @classmethod
+    def for_patient(cls, pdf_type, patient, template_version):
+        record = json.dumps(patient, sort_keys=True, default=str)
+        digest = hashlib.sha256(f"{pdf_type}\0{template_version}\0{record}".encode("utf-8")).hexdigest()
+        return cls(int(patient["mr_no"]), pdf_type, digest[:32])
+
+    @property
+    def filename(self):
+        # MrNo first so a patient's files can be found without knowing their hashes
+        return f"{self.mr_no}-{self.pdf_type}-{self.digest}.pdf"
+
+
+class PDFCache:
+    """
+    Generated PDFs on disk, evicted least recently used once their total
+    size passes `max_bytes`. A file's mtime is its last use. An edited
+    patient hashes to a new key on its own; update / delete still remove
+    the patient's files so stale and deleted records don't linger.
+    """
+
+    def __init__(self, directory=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._sizes = None          # filename -> bytes, loaded from the directory on first use
+        self._lock = threading.Lock()
+
+    def _index(self):
+        if self._sizes is None:
+            self._sizes = {}
+            names = os.listdir(self.directory) if os.path.isdir(self.directory) else ()
+            for name in names:
+                if name.endswith(".pdf"):
+                    self._sizes[name] = os.path.getsize(os.path.join(self.directory, name))
+        return self._sizes
+
+    def get(self, key):
+        """Path of the cached PDF for `key`, or None"""
+        path = os.path.join(self.directory, key.filename)
+        with self._lock:
+            if key.filename not in self._index():
+                return None
+            try:
+                os.utime(path)      # mark as recently used
+            except OSError:
+                self._sizes.pop(key.filename, None)
+                return None
+        return path
+
+    def put(self, key, data):
+        """Store the PDF bytes for `key`; returns its path"""
+        with self._lock:
+            self._index()
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                path = os.path.join(self.directory, key.filename)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+            self._sizes[key.filename] = len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+        def last_used(name):
+            try:
+                return os.path.getmtime(os.path.join(self.directory, name))
+            except OSError:
+                return 0
+        for name in sorted(self._sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(name)
+            self._remove(name)
+
+    def invalidate(self, mr_no):
+        """Drop every cached PDF of a patient"""
+        prefix = f"{int(mr_no)}-"
+        with self._lock:
+            for name in [n for n in self._index() if n.startswith(prefix)]:
+                del self._sizes[name]
+                self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._index()):
+                self._remove(name)
+            self._sizes = None
+
+    def _remove(self, name):
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except OSError as e:
+            logger.warning(f"Could not remove cached PDF {name}: {str(e)}")
+
+    def size(self):
+        with self._lock:
+            return sum(self._index().values())
+
+
+pdf_cache = PDFCache()
+
+
+def _on_patient_change(change):
+    if change.action in ("update", "delete"):
+        pdf_cache.invalidate(change.mr_no)
+
+
+add_change_listener(_on_patient_change)
@@ -0,0 +1,117 @@
+# models/pdf_jobs.py - Background PDF jobs: submit now, poll for status, download when done
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from models.pdf_cache import pdf_cache
+from models.pdf_pool import pdf_render_pool
+
+logger = logging.getLogger(__name__)
+
+PDF_JOB_THREADS = int(os.environ.get("PDF_JOB_THREADS", 2))      # jobs handed to the render pool at once
+PDF_JOB_TTL = float(os.environ.get("PDF_JOB_TTL", 3600))          # seconds a finished job stays pollable
+PDF_JOB_HISTORY = int(os.environ.get("PDF_JOB_HISTORY", 1000))    # most jobs kept
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class PDFJob:
+    __slots__ = ("id", "key", "status", "error", "created", "finished")
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def mr_no(self):
+        return self.key.mr_no
+
+    @property
+    def pdf_type(self):
+        return self.key.pdf_type
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "mr_no": self.mr_no,
+            "pdf_type": self.pdf_type,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class PDFJobQueue:
+    """
+    Jobs render through `render(patient, pdf_type)` on a few background
+    threads (which mostly wait on the PDF worker processes) and store the
+    bytes in `store` under the job's PDFKey, so a finished job is served
+    from the cache directory. Jobs are kept in memory, per process, for
+    `ttl` seconds after they finish and at most `history` of them.
+    """
+
+    def __init__(self, render, store, threads=PDF_JOB_THREADS, ttl=PDF_JOB_TTL, history=PDF_JOB_HISTORY):
+        self._render = render
+        self.store = store
+        self.threads = threads
+        self.ttl = ttl
+        self.history = history
+        self._jobs = OrderedDict()      # id -> PDFJob, oldest first
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, patient, key):
+        """Queue the PDF for `patient` under `key`; returns the PDFJob (already done if cached)"""
+        job = PDFJob(key)
+        if self.store.get(key) is not None:
+            job.status, job.finished = DONE, time.time()
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            if job.status == QUEUED:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="pdf-job")
+                self._executor.submit(self._run, job, patient)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, patient):
+        job.status = RUNNING
+        try:
+            self.store.put(job.key, self._render(patient, job.pdf_type))
+            job.status = DONE
+        except Exception as e:
+            logger.error(f"PDF job {job.id} ({job.pdf_type} for {job.mr_no}) failed: {str(e)}")
+            job.error = str(e) or type(e).__name__
+            job.status = FAILED
+        job.finished = time.time()
+
+    def _prune(self):
+        expired = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if len(self._jobs) < self.history and not (job.finished and job.finished < expired):
+                continue
+            if job.finished:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+pdf_jobs = PDFJobQueue(pdf_render_pool.render, pdf_cache)
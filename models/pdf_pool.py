@@ -0,0 +1,178 @@
+# models/pdf_pool.py - Render PDFs in worker processes, away from the request threads
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", min(4, os.cpu_count() or 1)))   # 0 renders inline
+PDF_QUEUE_SIZE = int(os.environ.get("PDF_QUEUE_SIZE", 4 * max(PDF_WORKERS, 1)))  # jobs running + waiting
+PDF_JOB_TIMEOUT = float(os.environ.get("PDF_JOB_TIMEOUT", 30))                    # seconds
+PDF_START_METHOD = os.environ.get("PDF_START_METHOD", "spawn")
+
+
+class PDFRenderError(Exception):
+    """The PDF could not be rendered"""
+
+
+class PDFRenderTimeout(PDFRenderError):
+    """A worker did not finish the PDF within the job timeout"""
+
+
+def render_pdf(patient, pdf_type):
+    """The PDF for `patient` as bytes. Runs in a worker process (or inline)."""
+    from routes.patients import PDFGenerator
+
+    result = PDFGenerator().generate_pdf(patient, pdf_type)
+    if not result["success"]:
+        raise PDFRenderError(result["error"])
+    return result["buffer"].getvalue()
+
+
+def render_receipts(patients):
+    """Receipts for all `patients` in one PDF, each on its own page(s). Runs in a worker process (or inline)."""
+    from io import BytesIO
+    from routes.patients import ReceiptPDFStrategy
+
+    result = ReceiptPDFStrategy().generate_batch(patients, BytesIO())
+    if not result["success"]:
+        raise PDFRenderError(result["error"])
+    return result["buffer"].getvalue()
+
+
+def _warm_up():
+    # Load the logo and stylesheet before the first job rather than during it
+    from models.letterhead import get_styles, logo_jpeg
+
+    logo_jpeg()
+    get_styles()
+
+
+class PDFRenderPool:
+    """
+    ReportLab layout is CPU bound and holds the GIL, so PDFs are rendered by
+    a pool of worker processes and the request thread only waits for the
+    bytes. At most `queue_size` jobs are submitted at once; beyond that
+    (and when `workers` is 0) the PDF is rendered inline as before.
+
+    A job that overruns `timeout` raises PDFRenderTimeout. Its worker can't
+    be interrupted, so the pool is torn down and started again on the next
+    job; jobs of other requests in that pool fail with PDFRenderError.
+    """
+
+    def __init__(self, workers=PDF_WORKERS, queue_size=PDF_QUEUE_SIZE, timeout=PDF_JOB_TIMEOUT,
+                 start_method=PDF_START_METHOD):
+        self.workers = workers
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self._executor = None
+        self._lock = threading.Lock()
+        self.inline_renders = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_warm_up,
+                )
+            return self._executor
+
+    def _discard(self, executor, kill=False):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if kill:
+            # No public API stops a running job - end the workers themselves
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, patient, pdf_type):
+        """The PDF bytes; raises PDFRenderError / PDFRenderTimeout"""
+        return self._call(render_pdf, patient, pdf_type)
+
+    def render_receipts(self, patients):
+        """One PDF with the receipts of all `patients`, rendered by a single worker"""
+        return self._call(render_receipts, patients)
+
+    def _call(self, func, *args):
+        if self.workers <= 0 or not self._slots.acquire(blocking=False):
+            self.inline_renders += 1
+            return func(*args)
+        try:
+            executor = self._get_executor()
+            future = executor.submit(func, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                logger.error(f"PDF job {func.__name__} timed out after {self.timeout}s")
+                self._discard(executor, kill=True)
+                raise PDFRenderTimeout(f"PDF rendering timed out after {self.timeout:g}s")
+            except BrokenProcessPool as e:
+                logger.error(f"PDF worker pool broke: {str(e)}")
+                self._discard(executor)
+                raise PDFRenderError("PDF worker stopped unexpectedly")
+        finally:
+            self._slots.release()
+
+    def render_many(self, patients, pdf_type):
+        """
+        Yield (patient, PDF bytes) in order, rendered in parallel across the
+        workers. A PDF that failed is yielded as its PDFRenderError instead
+        of raising, so the rest of the batch still comes through. The batch
+        takes one queue slot; when none is free it is rendered inline.
+        """
+        if self.workers <= 0 or not self._slots.acquire(blocking=False):
+            for patient in patients:
+                self.inline_renders += 1
+                try:
+                    yield patient, render_pdf(patient, pdf_type)
+                except Exception as e:
+                    yield patient, e if isinstance(e, PDFRenderError) else PDFRenderError(str(e))
+            return
+
+        futures = []
+        try:
+            executor = self._get_executor()
+            futures = [(patient, executor.submit(render_pdf, patient, pdf_type)) for patient in patients]
+            for index, (patient, future) in enumerate(futures):
+                try:
+                    yield patient, future.result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    logger.error(f"Batch PDF for {patient.get('mr_no')} timed out after {self.timeout}s")
+                    self._discard(executor, kill=True)
+                    error = PDFRenderTimeout(f"PDF rendering timed out after {self.timeout:g}s")
+                    for patient, _ in futures[index:]:
+                        yield patient, error
+                    return
+                except BrokenProcessPool as e:
+                    logger.error(f"PDF worker pool broke: {str(e)}")
+                    self._discard(executor)
+                    error = PDFRenderError("PDF worker stopped unexpectedly")
+                    for patient, _ in futures[index:]:
+                        yield patient, error
+                    return
+                except Exception as e:
+                    yield patient, e if isinstance(e, PDFRenderError) else PDFRenderError(str(e))
+        finally:
+            # The consumer may stop early (client went away) - drop what hasn't started
+            for _, future in futures:
+                future.cancel()
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+pdf_render_pool = PDFRenderPool()
@@ -0,0 +1,95 @@
+# models/receipt_backfill.py - One-off migration of historical Patients.Tests into Receipts / Receipt_Tests
+#
+#   python -m models.receipt_backfill [--chunk 1000] [--limit N]
+#
+# Every patient without a receipt gets one, plus a Receipt_Tests row per
+# catalog test found in its Tests text. Each chunk is its own transaction, so
+# the run can be stopped at any point and restarted: patients that already
+# have a receipt are skipped.
+
+import argparse
+import logging
+
+from db import unit_of_work
+from models.receipt_model import get_test_catalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK = 1000
+
+
+def _pending_patients(cursor, after, chunk):
+    cursor.execute(f"""
+        SELECT TOP {int(chunk)} p.MrNo, p.Tests, p.Amount
+        FROM Patients p
+        WHERE p.MrNo > ?
+            AND NOT EXISTS (SELECT 1 FROM Receipts r WHERE r.PatientMrNo = p.MrNo)
+        ORDER BY p.MrNo
+    """, (after,))
+    return cursor.fetchall()
+
+
+def backfill_chunk(cursor, patients, catalog):
+    """Write receipts for one chunk of (MrNo, Tests, Amount) rows; returns (receipts, test rows, unmatched)"""
+    cursor.fast_executemany = True  # pyodbc: send each executemany as one array-bound batch
+    cursor.executemany(
+        "INSERT INTO Receipts (PatientMrNo, TotalAmount, Discount, NetAmount) VALUES (?, ?, 0, ?)",
+        [(mr_no, amount, amount) for mr_no, _, amount in patients]
+    )
+
+    # executemany can't return identities - read them back through IX_Receipts_PatientMrNo
+    first, last = patients[0][0], patients[-1][0]
+    cursor.execute(
+        "SELECT PatientMrNo, MAX(ReceiptId) FROM Receipts WHERE PatientMrNo BETWEEN ? AND ? GROUP BY PatientMrNo",
+        (first, last)
+    )
+    receipt_of = {row[0]: row[1] for row in cursor.fetchall()}
+
+    test_rows = []
+    unmatched = 0
+    for mr_no, tests, _ in patients:
+        parsed = catalog.parse(tests)
+        if not parsed:
+            unmatched += 1
+        test_rows.extend((receipt_of[mr_no], test_id, price) for test_id, price in parsed)
+    if test_rows:
+        cursor.executemany("INSERT INTO Receipt_Tests (ReceiptId, TestId, TestPrice) VALUES (?, ?, ?)", test_rows)
+    return len(patients), len(test_rows), unmatched
+
+
+def backfill_receipts(chunk=DEFAULT_CHUNK, limit=None):
+    """Backfill every patient without a receipt, `chunk` patients per transaction"""
+    totals = {'patients': 0, 'tests': 0, 'unmatched': 0}
+    after = 0
+    while limit is None or totals['patients'] < limit:
+        size = chunk if limit is None else min(chunk, limit - totals['patients'])
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            patients = _pending_patients(cursor, after, size)
+            if not patients:
+                cursor.close()
+                break
+            done, tests, unmatched = backfill_chunk(cursor, patients, get_test_catalog(cursor))
+            cursor.close()
+        after = patients[-1][0]
+        totals['patients'] += done
+        totals['tests'] += tests
+        totals['unmatched'] += unmatched
+        logger.info(f"Backfilled receipts up to MrNo {after}: {totals['patients']} patients, {totals['tests']} tests")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill Receipts / Receipt_Tests from Patients.Tests")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="patients per transaction")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many patients")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    totals = backfill_receipts(chunk=args.chunk, limit=args.limit)
+    print(f"✅ Backfilled {totals['patients']} patients with {totals['tests']} receipt tests "
+          f"({totals['unmatched']} patients had no catalog test in their Tests text)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# models/receipt_model.py - Normalized Receipts / Receipt_Tests rows for patient registrations
+
+import threading
+
+from models.test_matcher import get_matcher
+
+
+class TestCatalog:
+    """Active Tests rows with the matcher that finds them in Patients.Tests text"""
+
+    __test__ = False  # not a pytest class despite the name
+
+    def __init__(self, rows):
+        # rows: (TestId, TestName, Price) ordered by TestId
+        self.tests = [(row[0], row[1], float(row[2] or 0)) for row in rows]
+        self._matcher = get_matcher(tuple(test[1] for test in self.tests))
+
+    def parse(self, tests):
+        """[(TestId, Price)] for the catalog tests named in a Patients.Tests string"""
+        return [self.tests[index][::2] for index in sorted(self._matcher.match(tests))]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_test_catalog(cursor):
+    """Return the cached catalog, loading it with `cursor` the first time"""
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        cursor.execute("SELECT TestId, TestName, Price FROM Tests WHERE IsActive = 1 ORDER BY TestId")
+        catalog = TestCatalog(cursor.fetchall())
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = catalog
+    return catalog
+
+
+def invalidate_test_catalog():
+    """Drop the cached catalog - call after the Tests table changes"""
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def create_receipt(cursor, mr_no, tests, amount, catalog=None):
+    """
+    Write the Receipts row and one Receipt_Tests row per catalog test for a
+    registration. Runs on the caller's cursor, i.e. inside its transaction.
+    Returns the new ReceiptId.
+    """
+    catalog = catalog or get_test_catalog(cursor)
+    cursor.execute("""
+        INSERT INTO Receipts (PatientMrNo, TotalAmount, Discount, NetAmount)
+        OUTPUT INSERTED.ReceiptId
+        VALUES (?, ?, 0, ?)
+    """, (mr_no, amount, amount))
+    receipt_id = cursor.fetchone()[0]
+    _write_receipt_tests(cursor, receipt_id, catalog.parse(tests))
+    return receipt_id
+
+
+def sync_receipt(cursor, mr_no, tests, amount):
+    """Bring the patient's latest receipt in line with edited Tests / Amount (creates one if missing)"""
+    cursor.execute("SELECT TOP 1 ReceiptId FROM Receipts WHERE PatientMrNo = ? ORDER BY ReceiptId DESC", (mr_no,))
+    row = cursor.fetchone()
+    if row is None:
+        return create_receipt(cursor, mr_no, tests, amount)
+
+    receipt_id = row[0]
+    cursor.execute(
+        "UPDATE Receipts SET TotalAmount = ?, NetAmount = ? - ISNULL(Discount, 0) WHERE ReceiptId = ?",
+        (amount, amount, receipt_id)
+    )
+    cursor.execute("DELETE FROM Receipt_Tests WHERE ReceiptId = ?", (receipt_id,))
+    _write_receipt_tests(cursor, receipt_id, get_test_catalog(cursor).parse(tests))
+    return receipt_id
+
+
+def delete_receipts(cursor, mr_no):
+    """Remove a patient's receipts and their Receipt_Tests - the patient row can't go while they exist"""
+    cursor.execute(
+        "DELETE FROM Receipt_Tests WHERE ReceiptId IN (SELECT ReceiptId FROM Receipts WHERE PatientMrNo = ?)",
+        (mr_no,)
+    )
+    cursor.execute("DELETE FROM Receipts WHERE PatientMrNo = ?", (mr_no,))
+
+
+def _write_receipt_tests(cursor, receipt_id, tests):
+    if tests:
+        cursor.executemany(
+            "INSERT INTO Receipt_Tests (ReceiptId, TestId, TestPrice) VALUES (?, ?, ?)",
+            [(receipt_id, test_id, price) for test_id, price in tests]
+        )
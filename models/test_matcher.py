@@ -0,0 +1,124 @@
+# models/test_matcher.py - Multi-pattern matching of test names in Patients.Tests
+
+from collections import deque
+from functools import lru_cache
+
+
+class TestNameMatcher:
+    """
+    Aho-Corasick automaton over the test catalog.
+
+    Patients.Tests is free text built by the reception form as
+    "Name A, Name B, ...". One pass over that text finds every catalog name
+    in it. A hit only counts when it covers a whole list item, so "CBC" is
+    not counted for "CBC with ESR" and a name inside another name's
+    parentheses - e.g. "IgE" in "Immunoglobulins (iga,ige,igg,igm)" - is
+    ignored.
+    """
+
+    __test__ = False  # not a pytest class despite the name
+
+    def __init__(self, names):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for index, name in enumerate(names):
+            key = self.normalize(name)
+            if key:
+                self._add(key, index)
+        self._link()
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split()).lower() if text else ""
+
+    def _add(self, key, index):
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + ((index, len(key)),)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    @staticmethod
+    def _item_bounds(text):
+        """Start and end offsets of the comma separated items (commas inside brackets don't split)"""
+        starts, ends = set(), set()
+        depth, item_start = 0, 0
+        for pos, ch in enumerate(text + ","):
+            if ch in "([":
+                depth += 1
+            elif ch in ")]" and depth:
+                depth -= 1
+            elif ch == "," and (depth == 0 or pos == len(text)):
+                lo, hi = item_start, pos
+                while lo < hi and text[lo] == " ":
+                    lo += 1
+                while hi > lo and text[hi - 1] == " ":
+                    hi -= 1
+                starts.add(lo)
+                ends.add(hi)
+                item_start, depth = pos + 1, 0
+        return starts, ends
+
+    def match(self, text):
+        """Set of catalog indexes whose name appears as a whole item in `text`"""
+        text = self.normalize(text)
+        if not text:
+            return set()
+        starts, ends = self._item_bounds(text)
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] and pos + 1 in ends:
+                for index, length in out[state]:
+                    if pos + 1 - length in starts:
+                        found.add(index)
+        return found
+
+
+@lru_cache(maxsize=4)
+def get_matcher(names):
+    """Matcher for a catalog (tuple of names) - rebuilt only when the catalog changes"""
+    return TestNameMatcher(names)
+
+
+def aggregate_tests(rows, names):
+    """
+    Patients count and revenue per catalog test in one pass over
+    (Tests, Amount) rows. Returns two lists aligned with `names`.
+    """
+    matcher = get_matcher(tuple(names))
+    counts = [0] * len(names)
+    revenue = [0.0] * len(names)
+    for tests, amount in rows:
+        hits = matcher.match(tests)
+        if not hits:
+            continue
+        amount = float(amount or 0)
+        for index in hits:
+            counts[index] += 1
+            revenue[index] += amount
+    return counts, revenue
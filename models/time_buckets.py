@@ -0,0 +1,115 @@
+# models/time_buckets.py - Patients counters bucketed by day / week / month / year
+
+from datetime import timedelta
+
+from db.predicates import DateRange, as_date
+
+GRANULARITIES = ("day", "week", "month", "year")
+
+# Same count the admin endpoints used to get from len(Tests.split(','))
+TEST_COUNT_SQL = (
+    "CASE WHEN Tests IS NULL OR Tests = '' THEN 0 "
+    "ELSE DATALENGTH(Tests) - DATALENGTH(REPLACE(Tests, ',', '')) + 1 END"
+)
+
+
+def count_tests(tests):
+    """TEST_COUNT_SQL for one Tests string"""
+    return tests.count(",") + 1 if tests else 0
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def bucket_start(day, granularity, origin):
+    """First day of the bucket holding `day`; weeks are 7-day runs counted from `origin`"""
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return origin + timedelta(days=7 * ((day - origin).days // 7))
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    raise ValueError(f"Unknown granularity '{granularity}'. Choose one of: {', '.join(GRANULARITIES)}")
+
+
+def next_bucket(start, granularity):
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return _add_months(start, 1)
+    if granularity == "year":
+        return start.replace(year=start.year + 1, month=1, day=1)
+    raise ValueError(f"Unknown granularity '{granularity}'. Choose one of: {', '.join(GRANULARITIES)}")
+
+
+def empty_buckets(start, end, granularity):
+    """Zeroed buckets covering [start, end), clipped to the range"""
+    buckets = []
+    current = bucket_start(start, granularity, start)
+    while current < end:
+        following = next_bucket(current, granularity)
+        buckets.append({
+            "start": max(current, start),
+            "end": min(following, end),
+            "patients": 0,
+            "revenue": 0,
+            "tests": 0,
+            "gender_stats": {},
+        })
+        current = following
+    return buckets
+
+
+def fill_buckets(buckets, rows, granularity, origin):
+    """Add per-(day, gender) rows - (RegDate, Gender, patients, revenue, tests) - into `buckets`"""
+    by_start = {bucket_start(b["start"], granularity, origin): b for b in buckets}
+    for reg_date, gender, patients, revenue, tests in rows:
+        bucket = by_start.get(bucket_start(as_date(reg_date), granularity, origin))
+        if bucket is None:
+            continue
+        bucket["patients"] += patients or 0
+        bucket["revenue"] += revenue or 0
+        bucket["tests"] += tests or 0
+        if gender:
+            bucket["gender_stats"][gender] = bucket["gender_stats"].get(gender, 0) + (patients or 0)
+    for bucket in buckets:
+        # Empty buckets keep an integer 0, like the endpoints always reported
+        bucket["revenue"] = float(bucket["revenue"]) if bucket["revenue"] else 0
+    return buckets
+
+
+def bucket_stats(cursor, start, end, granularity):
+    """
+    Patients, revenue, test count and gender split per bucket over [start, end).
+
+    One grouped query (per day and gender) feeds every granularity; the
+    per-day rows are rolled up into buckets here.
+    """
+    start, end = as_date(start), as_date(end)
+    buckets = empty_buckets(start, end, granularity)
+    if not buckets:
+        return buckets
+
+    where, params = DateRange(start, end).predicate()
+    cursor.execute(f"""
+        SELECT RegDate, Gender, COUNT(*), ISNULL(SUM(Amount), 0), ISNULL(SUM({TEST_COUNT_SQL}), 0)
+        FROM Patients
+        WHERE {where}
+        GROUP BY RegDate, Gender
+    """, params)
+    return fill_buckets(buckets, cursor.fetchall(), granularity, start)
+
+
+def totals(buckets):
+    """Sum of patients / revenue / tests over a list of buckets"""
+    return {
+        "patients": sum(b["patients"] for b in buckets),
+        "revenue": sum(b["revenue"] for b in buckets),
+        "tests": sum(b["tests"] for b in buckets),
+    }
@@ -1,15 +1,30 @@
 # admin.py - COMPLETE UPDATED VERSION WITH REAL-TIME REPORTS AND FIXED TEST MANAGEMENT
 from flask import Blueprint, render_template, session, redirect, url_for, jsonify, request
-from db import get_connection
+from db import get_db, get_pool, on_commit, query_stats, unit_of_work
+from db.predicates import DateRange, as_date
+from db.rows import fetch_all
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 import json
+import os
+from models.analytics_cube import get_cube
+from models.dashboard_cache import DashboardCache
+from models.doctor_index import get_doctor_index, invalidate_doctor_index
+from models.receipt_model import invalidate_test_catalog
+from models.downsample import lttb
+from models.time_buckets import GRANULARITIES, bucket_stats, totals
+from models.patient_model import add_change_listener
 
 admin_bp = Blueprint("admin", __name__)
 
+# Handlers share one connection per request (released on teardown)
+
+# Answer the report panels from the in-memory analytics cube instead of SQL
+ANALYTICS_CUBE = os.environ.get("ANALYTICS_CUBE", "1") != "0"
+
 def get_dashboard_stats():
     """Get statistics for admin dashboard - FIXED FOR YOUR SCHEMA"""
-    conn = get_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
     try:
@@ -26,21 +41,21 @@ def get_dashboard_stats():
         tests_count = cursor.fetchone()[0]
         
         # Get monthly revenue - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("""
+        where, params = DateRange.this_month().predicate()
+        cursor.execute(f"""
             SELECT ISNULL(SUM(Amount), 0) 
             FROM Patients 
-            WHERE MONTH(RegDate) = MONTH(GETDATE()) 
-            AND YEAR(RegDate) = YEAR(GETDATE())
-        """)
+            WHERE {where}
+        """, params)
         monthly_revenue = cursor.fetchone()[0] or 0
         
         # Get today's patients count
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute("SELECT COUNT(*) FROM Patients WHERE CONVERT(date, RegDate) = ?", (today,))
+        where, params = DateRange.today().predicate()
+        cursor.execute(f"SELECT COUNT(*) FROM Patients WHERE {where}", params)
         today_patients = cursor.fetchone()[0] or 0
         
         # Get today's revenue - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("SELECT ISNULL(SUM(Amount), 0) FROM Patients WHERE CONVERT(date, RegDate) = ?", (today,))
+        cursor.execute(f"SELECT ISNULL(SUM(Amount), 0) FROM Patients WHERE {where}", params)
         today_revenue = cursor.fetchone()[0] or 0
         
         return {
@@ -64,13 +79,14 @@ def get_dashboard_stats():
         }
     finally:
         cursor.close()
-        conn.close()
 
 @admin_bp.route("/admin")
 def admin_dashboard():
     if session.get("role") != "Admin":
         return redirect(url_for("auth.login_page"))
     
+    # Start computing stale panels now - the page fetches them right after it loads
+    dashboard_cache.warm()
     stats = get_dashboard_stats()
     return render_template("admin_dashboard.html", 
                          full_name=session.get('fullname'),
@@ -80,66 +96,83 @@ def admin_dashboard():
 # REAL-TIME REPORTS APIs - FIXED FOR YOUR SCHEMA
 # ===========================================
 
+def _period_buckets(cursor, start, end, granularity):
+    """Per-bucket patients / revenue / tests - from the analytics cube when enabled"""
+    if ANALYTICS_CUBE:
+        return get_cube(cursor).bucket_stats(start, end, granularity)
+    return bucket_stats(cursor, start, end, granularity)
+
+def _daily_stats(cursor):
+    """Payload for /admin/api/daily-stats"""
+    today_range = DateRange.today()
+    today = today_range.start.strftime('%Y-%m-%d')
+    
+    # Today's patients, revenue, tests and gender split in one grouped query
+    bucket = _period_buckets(cursor, today_range.start, today_range.end, 'day')[0]
+    today_patients = bucket['patients']
+    today_revenue = bucket['revenue']
+    test_count = bucket['tests']
+    gender_stats = bucket['gender_stats']
+    
+    return {
+        'success': True,
+        'date': today,
+        'patients': today_patients,
+        'revenue': float(today_revenue),
+        'tests': test_count,
+        'gender_stats': gender_stats,
+        'avg_amount': round(float(today_revenue / today_patients) if today_patients > 0 else 0, 2),
+        'tests_per_patient': round(test_count / today_patients, 1) if today_patients > 0 else 0
+    }
+
 @admin_bp.route("/admin/api/daily-stats")
 def get_daily_stats():
     """Get today's statistics - FIXED FOR YOUR SCHEMA"""
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        # Today's patients count
-        cursor.execute("SELECT COUNT(*) FROM Patients WHERE CONVERT(date, RegDate) = ?", (today,))
-        today_patients = cursor.fetchone()[0] or 0
-        
-        # Today's revenue - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("SELECT ISNULL(SUM(Amount), 0) FROM Patients WHERE CONVERT(date, RegDate) = ?", (today,))
-        today_revenue = cursor.fetchone()[0] or 0
-        
-        # Today's tests performed
-        cursor.execute("SELECT Tests FROM Patients WHERE CONVERT(date, RegDate) = ?", (today,))
-        today_tests_data = cursor.fetchall()
-        
-        test_count = 0
-        for test_row in today_tests_data:
-            if test_row[0]:
-                tests = test_row[0].split(',')
-                test_count += len(tests)
-        
-        # Today's patients by gender
-        cursor.execute("""
-            SELECT Gender, COUNT(*) 
-            FROM Patients 
-            WHERE CONVERT(date, RegDate) = ? 
-            GROUP BY Gender
-        """, (today,))
-        
-        gender_data = cursor.fetchall()
-        gender_stats = {}
-        for gender, count in gender_data:
-            if gender:
-                gender_stats[gender] = count
-        
-        return jsonify({
-            'success': True,
-            'date': today,
-            'patients': today_patients,
-            'revenue': float(today_revenue),
-            'tests': test_count,
-            'gender_stats': gender_stats,
-            'avg_amount': round(float(today_revenue / today_patients) if today_patients > 0 else 0, 2),
-            'tests_per_patient': round(test_count / today_patients, 1) if today_patients > 0 else 0
-        })
-        
-    except Exception as e:
-        print(f"Error in daily stats: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    return _panel_response('daily-stats', 'daily stats')
+
+def _weekly_stats(cursor):
+    """Payload for /admin/api/weekly-stats"""
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=6)
+    
+    # Daily breakdown - one grouped query for the whole week
+    daily_data = {}
+    for bucket in _period_buckets(cursor, start_date, end_date + timedelta(days=1), 'day'):
+        daily_data[bucket['start'].strftime('%Y-%m-%d')] = {
+            'patients': bucket['patients'],
+            'revenue': bucket['revenue'],
+            'tests': bucket['tests']
+        }
+    
+    # Calculate totals
+    total_patients = sum(day['patients'] for day in daily_data.values())
+    total_revenue = sum(day['revenue'] for day in daily_data.values())
+    total_tests = sum(day['tests'] for day in daily_data.values())
+    
+    # Day names for chart
+    day_names = []
+    for i in range(7):
+        day = start_date + timedelta(days=i)
+        day_names.append(day.strftime('%a'))
+    
+    return {
+        'success': True,
+        'period': {
+            'start': start_date.strftime('%Y-%m-%d'),
+            'end': end_date.strftime('%Y-%m-%d')
+        },
+        'total_patients': total_patients,
+        'total_revenue': total_revenue,
+        'total_tests': total_tests,
+        'daily_data': daily_data,
+        'day_names': day_names,
+        'avg_daily_patients': round(total_patients / 7, 1) if total_patients > 0 else 0,
+        'avg_daily_revenue': round(total_revenue / 7, 2) if total_revenue > 0 else 0,
+        'avg_daily_tests': round(total_tests / 7, 1) if total_tests > 0 else 0
+    }
 
 @admin_bp.route("/admin/api/weekly-stats")
 def get_weekly_stats():
@@ -147,82 +180,88 @@ def get_weekly_stats():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=6)
-        
-        # Get daily breakdown - FIXED: Use Amount instead of TotalAmount
-        daily_data = {}
-        for i in range(7):
-            date = start_date + timedelta(days=i)
-            date_str = date.strftime('%Y-%m-%d')
-            
-            cursor.execute("""
-                SELECT COUNT(*), ISNULL(SUM(Amount), 0)
-                FROM Patients 
-                WHERE CONVERT(date, RegDate) = ?
-            """, (date_str,))
-            
-            result = cursor.fetchone()
-            patients_count = result[0] or 0 if result else 0
-            revenue = float(result[1]) if result and result[1] else 0
-            
-            daily_data[date_str] = {
-                'patients': patients_count,
-                'revenue': revenue,
-                'tests': 0
-            }
-        
-        # Calculate tests for each day
-        cursor.execute("""
-            SELECT CONVERT(date, RegDate) as reg_date, Tests
-            FROM Patients 
-            WHERE CONVERT(date, RegDate) BETWEEN ? AND ?
-        """, (start_date, end_date))
-        
-        test_data = cursor.fetchall()
-        for row in test_data:
-            if row and row[0] and row[1]:
-                date_str = row[0].strftime('%Y-%m-%d')
-                if date_str in daily_data:
-                    tests = row[1].split(',')
-                    daily_data[date_str]['tests'] += len(tests)
-        
-        # Calculate totals
-        total_patients = sum(day['patients'] for day in daily_data.values())
-        total_revenue = sum(day['revenue'] for day in daily_data.values())
-        total_tests = sum(day['tests'] for day in daily_data.values())
-        
-        # Day names for chart
-        day_names = []
-        for i in range(7):
-            day = start_date + timedelta(days=i)
-            day_names.append(day.strftime('%a'))
-        
-        return jsonify({
-            'success': True,
-            'period': {
-                'start': start_date.strftime('%Y-%m-%d'),
-                'end': end_date.strftime('%Y-%m-%d')
-            },
-            'total_patients': total_patients,
-            'total_revenue': total_revenue,
-            'total_tests': total_tests,
-            'daily_data': daily_data,
-            'day_names': day_names,
-            'avg_daily_patients': round(total_patients / 7, 1) if total_patients > 0 else 0,
-            'avg_daily_revenue': round(total_revenue / 7, 2) if total_revenue > 0 else 0,
-            'avg_daily_tests': round(total_tests / 7, 1) if total_tests > 0 else 0
-        })
-        
-    except Exception as e:
-        print(f"Error in weekly stats: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    return _panel_response('weekly-stats', 'weekly stats')
+
+def _monthly_stats(cursor):
+    """Payload for /admin/api/monthly-stats"""
+    this_month = DateRange.this_month()
+    where, params = this_month.predicate()
+    
+    # Weekly breakdown - days 1-7 are Week 1, 8-14 Week 2, ... 29-31 Week 5
+    weeks = _period_buckets(cursor, this_month.start, this_month.end, 'week')
+    weeks_data = {}
+    for week, bucket in enumerate(weeks, start=1):
+        weeks_data[f'Week {week}'] = {
+            'patients': bucket['patients'],
+            'revenue': bucket['revenue'],
+            'tests': bucket['tests']
+        }
+    for week in range(len(weeks) + 1, 6):  # Always report 5 weeks
+        weeks_data[f'Week {week}'] = {'patients': 0, 'revenue': 0, 'tests': 0}
+    
+    month_totals = totals(weeks)
+    total_patients = month_totals['patients']
+    total_revenue = month_totals['revenue']
+    
+    if ANALYTICS_CUBE:
+        cube = get_cube(cursor)
+        doctor_data = [row[::2] for row in cube.doctor_totals(this_month.start, this_month.end) if row[0]]
+        test_counts = cube.item_counts(this_month.start, this_month.end)
+    else:
+        doctor_data, test_counts = _monthly_doctors_and_tests(cursor, where, params)
+    
+    # Doctor-wise revenue (Top 5)
+    doctor_revenue = {}
+    for row in doctor_data[:5]:  # Top 5 doctors
+        if row and row[0]:
+            doctor_revenue[row[0]] = float(row[1]) if row[1] else 0
+    
+    # Get top 5 tests
+    top_tests = sorted(test_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+    top_tests_dict = dict(top_tests)
+    
+    return {
+        'success': True,
+        'month': datetime.now().strftime('%B %Y'),
+        'total_patients': total_patients,
+        'total_revenue': total_revenue,
+        'weeks_data': weeks_data,
+        'doctor_revenue': doctor_revenue,
+        'top_tests': top_tests_dict,
+        'avg_patient_value': round(total_revenue / total_patients, 2) if total_patients > 0 else 0,
+        'weeks': list(weeks_data.keys())
+    }
+
+def _monthly_doctors_and_tests(cursor, where, params):
+    """Doctor revenue rows and test item counts for the month, straight from SQL"""
+    # Doctor-wise revenue - FIXED: Use Amount instead of TotalAmount
+    cursor.execute(f"""
+        SELECT Doctor, ISNULL(SUM(Amount), 0) as revenue
+        FROM Patients 
+        WHERE {where} 
+            AND Doctor IS NOT NULL AND Doctor != ''
+        GROUP BY Doctor
+        ORDER BY revenue DESC
+    """, params)
+    doctor_data = cursor.fetchall()
+    
+    # Most common tests this month
+    cursor.execute(f"""
+        SELECT Tests FROM Patients 
+        WHERE {where} 
+            AND Tests IS NOT NULL AND Tests != ''
+    """, params)
+    
+    all_tests_data = cursor.fetchall()
+    test_counts = {}
+    for row in all_tests_data:
+        if row and row[0]:
+            tests = row[0].split(',')
+            for test in tests:
+                test = test.strip()
+                if test:
+                    test_counts[test] = test_counts.get(test, 0) + 1
+    return doctor_data, test_counts
 
 @admin_bp.route("/admin/api/monthly-stats")
 def get_monthly_stats():
@@ -230,115 +269,71 @@ def get_monthly_stats():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        
-        # Monthly patients and revenue - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("""
-            SELECT COUNT(*), ISNULL(SUM(Amount), 0)
-            FROM Patients 
-            WHERE MONTH(RegDate) = ? AND YEAR(RegDate) = ?
-        """, (current_month, current_year))
-        
-        result = cursor.fetchone()
-        total_patients = result[0] or 0 if result else 0
-        total_revenue = float(result[1]) if result and result[1] else 0
-        
-        # Weekly breakdown
-        weeks_data = {}
-        for week in range(1, 6):  # Up to 5 weeks
-            weeks_data[f'Week {week}'] = {
-                'patients': 0,
-                'revenue': 0,
-                'tests': 0
-            }
-        
-        # Get all patients for the month - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("""
-            SELECT 
-                CASE 
-                    WHEN DATEPART(day, RegDate) BETWEEN 1 AND 7 THEN 1
-                    WHEN DATEPART(day, RegDate) BETWEEN 8 AND 14 THEN 2
-                    WHEN DATEPART(day, RegDate) BETWEEN 15 AND 21 THEN 3
-                    WHEN DATEPART(day, RegDate) BETWEEN 22 AND 28 THEN 4
-                    ELSE 5
-                END as week_num,
-                Amount, Tests
-            FROM Patients 
-            WHERE MONTH(RegDate) = ? AND YEAR(RegDate) = ?
-        """, (current_month, current_year))
-        
-        patients_data = cursor.fetchall()
-        for row in patients_data:
-            if row and row[0]:
-                week_num = row[0]
-                week_key = f'Week {week_num}'
-                
-                if week_key in weeks_data:
-                    weeks_data[week_key]['patients'] += 1
-                    weeks_data[week_key]['revenue'] += float(row[1]) if row[1] else 0
-                    if row[2]:
-                        tests = row[2].split(',')
-                        weeks_data[week_key]['tests'] += len(tests)
-        
-        # Doctor-wise revenue (Top 5) - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("""
-            SELECT Doctor, ISNULL(SUM(Amount), 0) as revenue
-            FROM Patients 
-            WHERE MONTH(RegDate) = ? AND YEAR(RegDate) = ? 
-                AND Doctor IS NOT NULL AND Doctor != ''
-            GROUP BY Doctor
-            ORDER BY revenue DESC
-        """, (current_month, current_year))
-        
-        doctor_revenue = {}
-        doctor_data = cursor.fetchall()
-        for row in doctor_data[:5]:  # Top 5 doctors
-            if row and row[0]:
-                doctor_revenue[row[0]] = float(row[1]) if row[1] else 0
-        
-        # Most common tests this month
-        cursor.execute("""
-            SELECT Tests FROM Patients 
-            WHERE MONTH(RegDate) = ? AND YEAR(RegDate) = ? 
-                AND Tests IS NOT NULL AND Tests != ''
-        """, (current_month, current_year))
-        
-        all_tests_data = cursor.fetchall()
-        test_counts = {}
-        for row in all_tests_data:
-            if row and row[0]:
-                tests = row[0].split(',')
-                for test in tests:
-                    test = test.strip()
-                    if test:
-                        test_counts[test] = test_counts.get(test, 0) + 1
-        
-        # Get top 5 tests
-        top_tests = sorted(test_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_tests_dict = dict(top_tests)
-        
-        return jsonify({
-            'success': True,
-            'month': datetime.now().strftime('%B %Y'),
-            'total_patients': total_patients,
-            'total_revenue': total_revenue,
-            'weeks_data': weeks_data,
-            'doctor_revenue': doctor_revenue,
-            'top_tests': top_tests_dict,
-            'avg_patient_value': round(total_revenue / total_patients, 2) if total_patients > 0 else 0,
-            'weeks': list(weeks_data.keys())
+    return _panel_response('monthly-stats', 'monthly stats')
+
+def _test_statistics(cursor):
+    """Payload for /admin/api/test-statistics"""
+    # Get all tests
+    cursor.execute("SELECT TestId, TestName, Price, Category FROM Tests WHERE IsActive = 1 ORDER BY TestName")
+    all_tests = cursor.fetchall()
+    
+    if ANALYTICS_CUBE:
+        patient_counts, revenues = get_cube(cursor).test_totals([test[1] for test in all_tests])
+    else:
+        patient_counts, revenues = _receipt_test_totals(cursor, [test[0] for test in all_tests])
+    
+    test_stats = []
+    for test, patient_count, total_revenue in zip(all_tests, patient_counts, revenues):
+        test_id, test_name, price, category = test
+        
+        test_stats.append({
+            'test_id': test_id,
+            'test_name': test_name,
+            'price': float(price),
+            'category': category or 'General',
+            'patient_count': patient_count,
+            'total_revenue': float(total_revenue),
+            'popularity_rank': patient_count
         })
-        
-    except Exception as e:
-        print(f"Error in monthly stats: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    
+    # Sort by popularity and take top 10
+    test_stats.sort(key=lambda x: x['popularity_rank'], reverse=True)
+    top_tests = test_stats[:10]
+    
+    # Calculate category distribution
+    category_stats = {}
+    for test in top_tests:
+        category = test['category']
+        category_stats[category] = category_stats.get(category, 0) + 1
+    
+    # Calculate summary
+    total_tests_performed = sum(t['patient_count'] for t in test_stats)
+    total_revenue_from_tests = sum(t['total_revenue'] for t in test_stats)
+    
+    return {
+        'success': True,
+        'top_tests': top_tests,
+        'total_tests_count': len(all_tests),
+        'category_stats': category_stats,
+        'summary': {
+            'most_popular_test': top_tests[0]['test_name'] if top_tests else 'None',
+            'total_tests_performed': total_tests_performed,
+            'total_revenue_from_tests': total_revenue_from_tests
+        }
+    }
+
+def _receipt_test_totals(cursor, test_ids):
+    """Patients and revenue per test from the normalized Receipt_Tests rows (indexed join)"""
+    cursor.execute("""
+        SELECT rt.TestId, COUNT(*), ISNULL(SUM(r.NetAmount), 0)
+        FROM Receipt_Tests rt
+        JOIN Receipts r ON r.ReceiptId = rt.ReceiptId
+        GROUP BY rt.TestId
+    """)
+    found = {row[0]: (row[1], float(row[2])) for row in cursor.fetchall()}
+    counts = [found.get(test_id, (0, 0.0))[0] for test_id in test_ids]
+    revenues = [found.get(test_id, (0, 0.0))[1] for test_id in test_ids]
+    return counts, revenues
 
 @admin_bp.route("/admin/api/test-statistics")
 def get_test_statistics():
@@ -346,77 +341,72 @@ def get_test_statistics():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Get all tests
-        cursor.execute("SELECT TestId, TestName, Price, Category FROM Tests WHERE IsActive = 1 ORDER BY TestName")
-        all_tests = cursor.fetchall()
-        
-        test_stats = []
-        for test in all_tests:
-            test_id, test_name, price, category = test
-            
-            # Count patients who took this test - REMOVED IsActive check from Patients
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM Patients 
-                WHERE Tests LIKE ?
-            """, (f'%{test_name}%',))
-            
-            patient_count = cursor.fetchone()[0] or 0
-            
-            # Calculate revenue from this test - FIXED: Use Amount instead of TotalAmount
-            cursor.execute("""
-                SELECT ISNULL(SUM(Amount), 0)
-                FROM Patients 
-                WHERE Tests LIKE ?
-            """, (f'%{test_name}%',))
-            
-            total_revenue = cursor.fetchone()[0] or 0
-            
-            test_stats.append({
-                'test_id': test_id,
-                'test_name': test_name,
-                'price': float(price),
-                'category': category or 'General',
+    return _panel_response('test-statistics', 'test statistics')
+
+def _doctor_statistics(cursor):
+    """Payload for /admin/api/doctor-statistics"""
+    # Active doctors come from the cached name index (rebuilt when a doctor is added)
+    doctor_index = get_doctor_index(cursor)
+    all_doctors = doctor_index.doctors
+    
+    # One aggregate for all doctors; Patients.Doctor is free text, so join in memory
+    if ANALYTICS_CUBE:
+        grouped = get_cube(cursor).doctor_totals()
+    else:
+        cursor.execute("""
+            SELECT Doctor, COUNT(*), ISNULL(SUM(Amount), 0)
+            FROM Patients 
+            GROUP BY Doctor
+        """)
+        grouped = cursor.fetchall()
+    
+    totals = {}
+    for doctor_text, patient_count, revenue in grouped:
+        doctor = doctor_index.lookup(doctor_text)
+        if doctor is None:
+            continue
+        count, total = totals.get(doctor[0], (0, 0.0))
+        totals[doctor[0]] = (count + patient_count, total + float(revenue or 0))
+    
+    doctor_stats = []
+    for doctor_id, doctor_name, specialization in all_doctors:
+        patient_count, total_revenue = totals.get(doctor_id, (0, 0))
+        
+        if patient_count > 0:  # Only include doctors with patients
+            doctor_stats.append({
+                'doctor_id': doctor_id,
+                'doctor_name': doctor_name,
+                'specialization': specialization or 'General',
                 'patient_count': patient_count,
-                'total_revenue': float(total_revenue),
-                'popularity_rank': patient_count
+                'total_revenue': total_revenue,
+                'avg_revenue_per_patient': round(total_revenue / patient_count, 2) if patient_count > 0 else 0
             })
-        
-        # Sort by popularity and take top 10
-        test_stats.sort(key=lambda x: x['popularity_rank'], reverse=True)
-        top_tests = test_stats[:10]
-        
-        # Calculate category distribution
-        category_stats = {}
-        for test in top_tests:
-            category = test['category']
-            category_stats[category] = category_stats.get(category, 0) + 1
-        
-        # Calculate summary
-        total_tests_performed = sum(t['patient_count'] for t in test_stats)
-        total_revenue_from_tests = sum(t['total_revenue'] for t in test_stats)
-        
-        return jsonify({
-            'success': True,
-            'top_tests': top_tests,
-            'total_tests_count': len(all_tests),
-            'category_stats': category_stats,
-            'summary': {
-                'most_popular_test': top_tests[0]['test_name'] if top_tests else 'None',
-                'total_tests_performed': total_tests_performed,
-                'total_revenue_from_tests': total_revenue_from_tests
-            }
-        })
-        
-    except Exception as e:
-        print(f"Error in test statistics: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    
+    # Sort by revenue and take top 10
+    doctor_stats.sort(key=lambda x: x['total_revenue'], reverse=True)
+    top_doctors = doctor_stats[:10]
+    
+    # Calculate specialization distribution
+    specialization_stats = {}
+    for doctor in top_doctors:
+        spec = doctor['specialization']
+        specialization_stats[spec] = specialization_stats.get(spec, 0) + doctor['patient_count']
+    
+    # Calculate summary
+    total_patients_referred = sum(d['patient_count'] for d in doctor_stats)
+    total_revenue_from_doctors = sum(d['total_revenue'] for d in doctor_stats)
+    
+    return {
+        'success': True,
+        'top_doctors': top_doctors,
+        'total_doctors_count': len(all_doctors),
+        'specialization_stats': specialization_stats,
+        'summary': {
+            'top_earning_doctor': top_doctors[0]['doctor_name'] if top_doctors else 'None',
+            'total_patients_referred': total_patients_referred,
+            'total_revenue_from_doctors': total_revenue_from_doctors
+        }
+    }
 
 @admin_bp.route("/admin/api/doctor-statistics")
 def get_doctor_statistics():
@@ -424,70 +414,41 @@ def get_doctor_statistics():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Get all doctors
-        cursor.execute("SELECT DoctorId, Name, Specialization FROM Doctors WHERE IsActive = 1 ORDER BY Name")
-        all_doctors = cursor.fetchall()
-        
-        doctor_stats = []
-        for doctor in all_doctors:
-            doctor_id, doctor_name, specialization = doctor
-            
-            # Count patients referred by this doctor - REMOVED IsActive check from Patients
-            cursor.execute("""
-                SELECT COUNT(*), ISNULL(SUM(Amount), 0)
-                FROM Patients 
-                WHERE Doctor = ?
-            """, (doctor_name,))
-            
-            result = cursor.fetchone()
-            patient_count = result[0] or 0 if result else 0
-            total_revenue = float(result[1]) if result and result[1] else 0
-            
-            if patient_count > 0:  # Only include doctors with patients
-                doctor_stats.append({
-                    'doctor_id': doctor_id,
-                    'doctor_name': doctor_name,
-                    'specialization': specialization or 'General',
-                    'patient_count': patient_count,
-                    'total_revenue': total_revenue,
-                    'avg_revenue_per_patient': round(total_revenue / patient_count, 2) if patient_count > 0 else 0
-                })
-        
-        # Sort by revenue and take top 10
-        doctor_stats.sort(key=lambda x: x['total_revenue'], reverse=True)
-        top_doctors = doctor_stats[:10]
-        
-        # Calculate specialization distribution
-        specialization_stats = {}
-        for doctor in top_doctors:
-            spec = doctor['specialization']
-            specialization_stats[spec] = specialization_stats.get(spec, 0) + doctor['patient_count']
-        
-        # Calculate summary
-        total_patients_referred = sum(d['patient_count'] for d in doctor_stats)
-        total_revenue_from_doctors = sum(d['total_revenue'] for d in doctor_stats)
-        
-        return jsonify({
-            'success': True,
-            'top_doctors': top_doctors,
-            'total_doctors_count': len(all_doctors),
-            'specialization_stats': specialization_stats,
-            'summary': {
-                'top_earning_doctor': top_doctors[0]['doctor_name'] if top_doctors else 'None',
-                'total_patients_referred': total_patients_referred,
-                'total_revenue_from_doctors': total_revenue_from_doctors
-            }
-        })
-        
-    except Exception as e:
-        print(f"Error in doctor statistics: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    return _panel_response('doctor-statistics', 'doctor statistics')
+
+def _yearly_overview(cursor):
+    """Payload for /admin/api/yearly-overview"""
+    current_year = datetime.now().year
+    this_year = DateRange.year(current_year)
+    
+    # Monthly breakdown for current year - one grouped query
+    months = _period_buckets(cursor, this_year.start, this_year.end, 'month')
+    monthly_data = {}
+    for bucket in months:
+        monthly_data[bucket['start'].month] = {
+            'patients': bucket['patients'],
+            'revenue': bucket['revenue']
+        }
+    
+    # Year totals
+    year_totals = totals(months)
+    yearly_total_patients = year_totals['patients']
+    yearly_total_revenue = year_totals['revenue']
+    
+    # Month names for chart
+    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
+                  'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    
+    return {
+        'success': True,
+        'year': current_year,
+        'monthly_data': monthly_data,
+        'month_names': month_names,
+        'yearly_total_patients': yearly_total_patients,
+        'yearly_total_revenue': yearly_total_revenue,
+        'avg_monthly_patients': round(yearly_total_patients / 12, 1) if yearly_total_patients > 0 else 0,
+        'avg_monthly_revenue': round(yearly_total_revenue / 12, 2) if yearly_total_revenue > 0 else 0
+    }
 
 @admin_bp.route("/admin/api/yearly-overview")
 def get_yearly_overview():
@@ -495,58 +456,206 @@ def get_yearly_overview():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
+    return _panel_response('yearly-overview', 'yearly overview')
+
+# ===========================================
+# DASHBOARD SNAPSHOT CACHE
+# ===========================================
+
+# Seconds a panel snapshot is served before it is recomputed in the background
+PANEL_TTLS = {
+    'daily-stats': int(os.environ.get("DASHBOARD_TTL_DAILY", 30)),
+    'weekly-stats': int(os.environ.get("DASHBOARD_TTL_WEEKLY", 60)),
+    'monthly-stats': int(os.environ.get("DASHBOARD_TTL_MONTHLY", 120)),
+    'yearly-overview': int(os.environ.get("DASHBOARD_TTL_YEARLY", 300)),
+    'test-statistics': int(os.environ.get("DASHBOARD_TTL_TESTS", 300)),
+    'doctor-statistics': int(os.environ.get("DASHBOARD_TTL_DOCTORS", 300)),
+}
+
+def _is_today(reg_date):
+    return as_date(reg_date) == datetime.now().date()
+
+def _in_last_week(reg_date):
+    today = datetime.now().date()
+    return today - timedelta(days=6) <= as_date(reg_date) <= today
+
+def _in_this_month(reg_date):
+    reg_date, today = as_date(reg_date), datetime.now().date()
+    return (reg_date.year, reg_date.month) == (today.year, today.month)
+
+def _in_this_year(reg_date):
+    return as_date(reg_date).year == datetime.now().year
+
+# Panels refresh concurrently on this many threads; the overview waits at most
+# DASHBOARD_PANEL_TIMEOUT seconds and returns whatever panels are ready
+DASHBOARD_WORKERS = int(os.environ.get("DASHBOARD_WORKERS", 6))
+DASHBOARD_PANEL_TIMEOUT = float(os.environ.get("DASHBOARD_PANEL_TIMEOUT", 5))
+
+dashboard_cache = DashboardCache(max_workers=DASHBOARD_WORKERS)
+dashboard_cache.register('daily-stats', _daily_stats, PANEL_TTLS['daily-stats'], affects=_is_today)
+dashboard_cache.register('weekly-stats', _weekly_stats, PANEL_TTLS['weekly-stats'], affects=_in_last_week)
+dashboard_cache.register('monthly-stats', _monthly_stats, PANEL_TTLS['monthly-stats'], affects=_in_this_month)
+dashboard_cache.register('yearly-overview', _yearly_overview, PANEL_TTLS['yearly-overview'], affects=_in_this_year)
+# Test and doctor panels are all-time totals - every patient write touches them
+dashboard_cache.register('test-statistics', _test_statistics, PANEL_TTLS['test-statistics'])
+dashboard_cache.register('doctor-statistics', _doctor_statistics, PANEL_TTLS['doctor-statistics'])
+
+def _on_patient_change(change):
+    """Patient add / update / delete committed - drop only the panels covering its RegDate"""
+    dashboard_cache.invalidate_for_date(change.reg_date)
+
+add_change_listener(_on_patient_change)
+
+def _panel_response(panel, label):
+    """JSON response for a dashboard panel served from the snapshot cache"""
     try:
-        current_year = datetime.now().year
-        
-        # Monthly breakdown for current year - FIXED: Use Amount instead of TotalAmount
-        monthly_data = {}
-        for month in range(1, 13):
-            cursor.execute("""
-                SELECT COUNT(*), ISNULL(SUM(Amount), 0)
-                FROM Patients 
-                WHERE MONTH(RegDate) = ? AND YEAR(RegDate) = ?
-            """, (month, current_year))
-            
-            result = cursor.fetchone()
-            monthly_data[month] = {
-                'patients': result[0] or 0 if result else 0,
-                'revenue': float(result[1]) if result and result[1] else 0
-            }
-        
-        # Year totals - FIXED: Use Amount instead of TotalAmount
-        cursor.execute("""
-            SELECT COUNT(*), ISNULL(SUM(Amount), 0)
+        payload, status, age = dashboard_cache.get(panel)
+    except Exception as e:
+        print(f"Error in {label}: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)})
+    
+    response = jsonify(payload)
+    response.headers['X-Cache'] = status
+    response.headers['Age'] = str(int(age))
+    return response
+
+@admin_bp.route("/admin/api/overview")
+def get_overview():
+    """All dashboard panels in one payload - computed concurrently, partial on timeout"""
+    if session.get("role") != "Admin":
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    requested = request.args.get('panels')
+    names = dashboard_cache.panels
+    if requested:
+        names = [name for name in requested.split(',') if name in names]
+    timeout = min(request.args.get('timeout', DASHBOARD_PANEL_TIMEOUT, type=float), DASHBOARD_PANEL_TIMEOUT)
+    
+    panels = {}
+    meta = {}
+    for name, result in dashboard_cache.get_many(names, timeout).items():
+        if isinstance(result, Exception):
+            print(f"Error in overview panel {name}: {str(result)}")
+            panels[name] = {'success': False, 'message': str(result)}
+            meta[name] = {'status': 'TIMEOUT' if isinstance(result, TimeoutError) else 'ERROR'}
+        else:
+            payload, status, age = result
+            panels[name] = payload
+            meta[name] = {'status': status, 'age': round(age, 1)}
+    
+    return jsonify({
+        'success': True,
+        'partial': any(m['status'] in ('TIMEOUT', 'ERROR') for m in meta.values()),
+        'panels': panels,
+        'meta': meta
+    })
+
+# ===========================================
+# RANGE ANALYTICS APIs
+# ===========================================
+
+# Chart series longer than this are downsampled (LTTB) on the server
+RANGE_MAX_POINTS = int(os.environ.get("RANGE_STATS_MAX_POINTS", 400))
+RANGE_TOP_DOCTORS = 20
+
+def _range_doctor_stats(cursor, start, end):
+    """Patients and revenue per doctor over [start, end), name variants folded together"""
+    if ANALYTICS_CUBE:
+        grouped = get_cube(cursor).doctor_totals(start, end)
+    else:
+        where, params = DateRange(start, end).predicate()
+        cursor.execute(f"""
+            SELECT Doctor, COUNT(*), ISNULL(SUM(Amount), 0)
             FROM Patients 
-            WHERE YEAR(RegDate) = ?
-        """, (current_year,))
-        
-        result = cursor.fetchone()
-        yearly_total_patients = result[0] or 0 if result else 0
-        yearly_total_revenue = float(result[1]) if result and result[1] else 0
-        
-        # Month names for chart
-        month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                      'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        
-        return jsonify({
-            'success': True,
-            'year': current_year,
-            'monthly_data': monthly_data,
-            'month_names': month_names,
-            'yearly_total_patients': yearly_total_patients,
-            'yearly_total_revenue': yearly_total_revenue,
-            'avg_monthly_patients': round(yearly_total_patients / 12, 1) if yearly_total_patients > 0 else 0,
-            'avg_monthly_revenue': round(yearly_total_revenue / 12, 2) if yearly_total_revenue > 0 else 0
+            WHERE {where}
+            GROUP BY Doctor
+        """, params)
+        grouped = cursor.fetchall()
+    
+    doctor_index = get_doctor_index(cursor)
+    doctors = {}
+    for doctor_text, patient_count, revenue in grouped:
+        doctor = doctor_index.lookup(doctor_text)
+        name = doctor[1] if doctor else (doctor_text or 'Unknown')
+        count, total = doctors.get(name, (0, 0.0))
+        doctors[name] = (count + patient_count, total + float(revenue or 0))
+    
+    doctor_stats = [
+        {'doctor_name': name, 'patient_count': count, 'total_revenue': total}
+        for name, (count, total) in doctors.items()
+    ]
+    doctor_stats.sort(key=lambda x: x['total_revenue'], reverse=True)
+    return doctor_stats[:RANGE_TOP_DOCTORS]
+
+def _range_stats(cursor, start, end, granularity, max_points):
+    """Payload for /admin/api/range-stats over the half-open range [start, end)"""
+    buckets = _period_buckets(cursor, start, end, granularity)
+    range_totals = totals(buckets)
+    
+    gender_stats = {}
+    for bucket in buckets:
+        for gender, count in bucket['gender_stats'].items():
+            gender_stats[gender] = gender_stats.get(gender, 0) + count
+    
+    # Totals above use every bucket; only the chart series is downsampled
+    keep = lttb([b['start'].toordinal() for b in buckets], [b['revenue'] for b in buckets], max_points)
+    series = []
+    for index in keep:
+        bucket = buckets[index]
+        series.append({
+            'start': bucket['start'].strftime('%Y-%m-%d'),
+            'end': (bucket['end'] - timedelta(days=1)).strftime('%Y-%m-%d'),
+            'patients': bucket['patients'],
+            'revenue': bucket['revenue'],
+            'tests': bucket['tests']
         })
-        
+    
+    total_patients = range_totals['patients']
+    return {
+        'success': True,
+        'period': {
+            'start': start.strftime('%Y-%m-%d'),
+            'end': (end - timedelta(days=1)).strftime('%Y-%m-%d')
+        },
+        'granularity': granularity,
+        'total_patients': total_patients,
+        'total_revenue': range_totals['revenue'],
+        'total_tests': range_totals['tests'],
+        'avg_patient_value': round(range_totals['revenue'] / total_patients, 2) if total_patients > 0 else 0,
+        'gender_stats': gender_stats,
+        'doctor_stats': _range_doctor_stats(cursor, start, end),
+        'bucket_count': len(buckets),
+        'downsampled': len(series) < len(buckets),
+        'series': series
+    }
+
+@admin_bp.route("/admin/api/range-stats")
+def get_range_stats():
+    """Statistics for any date range: ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive)&granularity=day|week|month|year"""
+    if session.get("role") != "Admin":
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        start = as_date(request.args['start'])
+        end = as_date(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'start and end dates are required (YYYY-MM-DD)'}), 400
+    if end < start:
+        return jsonify({'success': False, 'message': 'end must not be before start'}), 400
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'success': False, 'message': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+    max_points = max(3, min(request.args.get('points', RANGE_MAX_POINTS, type=int), RANGE_MAX_POINTS))
+    
+    try:
+        cursor = get_db().cursor()
+        stats = _range_stats(cursor, start, end + timedelta(days=1), granularity, max_points)
+        cursor.close()
+        return jsonify(stats)
     except Exception as e:
-        print(f"Error in yearly overview: {str(e)}")
+        print(f"Error in range stats: {str(e)}")
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
 
 # ===========================================
 # STAFF MANAGEMENT APIs
@@ -558,27 +667,17 @@ def get_staff():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
+    conn = get_db()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT UserId, Username, FullName, Role FROM Users WHERE IsActive = 1 AND Role != 'Admin' ORDER BY UserId")
-        staff = cursor.fetchall()
-        
-        staff_list = []
-        for user in staff:
-            staff_list.append({
-                'UserId': user[0],
-                'Username': user[1],
-                'FullName': user[2],
-                'Role': user[3]
-            })
+        staff_list = fetch_all(cursor)
         
         return jsonify(staff_list)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
     finally:
         cursor.close()
-        conn.close()
 
 @admin_bp.route("/admin/staff/add", methods=["POST"])
 def add_staff():
@@ -587,30 +686,28 @@ def add_staff():
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
     data = request.get_json()
-    conn = get_connection()
-    cursor = conn.cursor()
     
     try:
-        # Check if username already exists
-        cursor.execute("SELECT UserId FROM Users WHERE Username = ?", (data['username'],))
-        if cursor.fetchone():
-            return jsonify({'success': False, 'message': 'Username already exists'})
-        
-        # Insert new staff
-        hashed_password = generate_password_hash(data['password'])
-        cursor.execute(
-            "INSERT INTO Users (Username, Password, Role, FullName) VALUES (?, ?, ?, ?)",
-            (data['username'], hashed_password, data['role'], data['full_name'])
-        )
-        conn.commit()
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+
+            # Check if username already exists
+            cursor.execute("SELECT UserId FROM Users WHERE Username = ?", (data['username'],))
+            if cursor.fetchone():
+                cursor.close()
+                return jsonify({'success': False, 'message': 'Username already exists'})
+
+            # Insert new staff
+            hashed_password = generate_password_hash(data['password'])
+            cursor.execute(
+                "INSERT INTO Users (Username, Password, Role, FullName) VALUES (?, ?, ?, ?)",
+                (data['username'], hashed_password, data['role'], data['full_name'])
+            )
+            cursor.close()
         
         return jsonify({'success': True, 'message': 'Staff added successfully'})
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
 
 # ===========================================
 # DOCTOR MANAGEMENT APIs
@@ -622,28 +719,19 @@ def get_doctors():
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
+    conn = get_db()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT DoctorId, Name, Specialization, ContactNumber, ConsultationFee FROM Doctors WHERE IsActive = 1 ORDER BY DoctorId")
-        doctors = cursor.fetchall()
-        
-        doctors_list = []
-        for doctor in doctors:
-            doctors_list.append({
-                'DoctorId': doctor[0],
-                'Name': doctor[1],
-                'Specialization': doctor[2],
-                'ContactNumber': doctor[3],
-                'ConsultationFee': float(doctor[4]) if doctor[4] else 0.0
-            })
+        doctors_list = fetch_all(cursor, convert={'ConsultationFee': float})
+        for doctor in doctors_list:
+            doctor['ConsultationFee'] = doctor['ConsultationFee'] or 0.0
         
         return jsonify(doctors_list)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
     finally:
         cursor.close()
-        conn.close()
 
 @admin_bp.route("/admin/doctors/add", methods=["POST"])
 def add_doctor():
@@ -652,35 +740,45 @@ def add_doctor():
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
     data = request.get_json()
-    conn = get_connection()
-    cursor = conn.cursor()
     
     try:
-        cursor.execute(
-            "INSERT INTO Doctors (Name, Specialization, ContactNumber, ConsultationFee) VALUES (?, ?, ?, ?)",
-            (data['name'], data.get('specialization'), data.get('contact_number'), data.get('consultation_fee', 0))
-        )
-        conn.commit()
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO Doctors (Name, Specialization, ContactNumber, ConsultationFee) VALUES (?, ?, ?, ?)",
+                (data['name'], data.get('specialization'), data.get('contact_number'), data.get('consultation_fee', 0))
+            )
+            cursor.close()
+        
+        # Doctor statistics join through the name index - rebuild it once the doctor is saved
+        on_commit(invalidate_doctor_index)
+        on_commit(lambda: dashboard_cache.invalidate('doctor-statistics'))
         
         return jsonify({'success': True, 'message': 'Doctor added successfully'})
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
 
 # ===========================================
 # TEST MANAGEMENT APIs - FIXED FOR YOUR SCHEMA
 # ===========================================
 
+def _range_value(value):
+    # A 0 bound has always been reported as "no bound"
+    return float(value) if value else None
+
+TEST_ROW_CONVERSIONS = {
+    'Price': float,
+    'Male_Range_Min': _range_value, 'Male_Range_Max': _range_value,
+    'Female_Range_Min': _range_value, 'Female_Range_Max': _range_value,
+}
+
 @admin_bp.route("/admin/tests")
 def get_tests():
     """Get all tests - FIXED VERSION WITH CORRECT COLUMN NAMES"""
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
+    conn = get_db()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -690,7 +788,7 @@ def get_tests():
                 Category, 
                 Price, 
                 ReportingTime,
-                Range_Text,
+                Range_Text AS NormalRange,
                 SampleType,
                 Male_Range_Min,
                 Male_Range_Max,
@@ -708,31 +806,7 @@ def get_tests():
             WHERE IsActive = 1 
             ORDER BY TestId
         """)
-        tests = cursor.fetchall()
-        
-        tests_list = []
-        for test in tests:
-            tests_list.append({
-                'TestId': test[0],
-                'TestName': test[1],
-                'Category': test[2],
-                'Price': float(test[3]),
-                'ReportingTime': test[4],
-                'NormalRange': test[5],  # This is Range_Text in database
-                'SampleType': test[6],
-                'Male_Range_Min': float(test[7]) if test[7] else None,
-                'Male_Range_Max': float(test[8]) if test[8] else None,
-                'Female_Range_Min': float(test[9]) if test[9] else None,
-                'Female_Range_Max': float(test[10]) if test[10] else None,
-                'Range_Unit': test[11],
-                'Interpretation_Low': test[12],
-                'Interpretation_Normal': test[13],
-                'Interpretation_High': test[14],
-                'Sample_Type': test[15],
-                'Methodology': test[16],
-                'Turnaround_Time': test[17],
-                'Department': test[18]
-            })
+        tests_list = fetch_all(cursor, convert=TEST_ROW_CONVERSIONS)
         
         return jsonify(tests_list)
     except Exception as e:
@@ -740,7 +814,6 @@ def get_tests():
         return jsonify({'success': False, 'message': str(e)})
     finally:
         cursor.close()
-        conn.close()
 
 @admin_bp.route("/admin/tests/add", methods=["POST"])
 def add_test():
@@ -749,63 +822,61 @@ def add_test():
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
     data = request.get_json()
-    conn = get_connection()
-    cursor = conn.cursor()
     
     try:
-        cursor.execute("""
-            INSERT INTO Tests (
-                TestName, 
-                Price, 
-                Category, 
-                Range_Text,
-                ReportingTime,
-                SampleType,
-                Male_Range_Min,
-                Male_Range_Max,
-                Female_Range_Min,
-                Female_Range_Max,
-                Range_Unit,
-                Interpretation_Low,
-                Interpretation_Normal,
-                Interpretation_High,
-                Sample_Type,
-                Methodology,
-                Turnaround_Time,
-                Department,
-                IsActive,
-                CreatedAt
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, GETDATE())
-        """, (
-            data['test_name'],
-            data['price'],
-            data.get('category'),
-            data.get('normal_range'),  # This goes to Range_Text
-            data.get('reporting_time'),
-            data.get('sample_type'),
-            data.get('male_range_min'),
-            data.get('male_range_max'),
-            data.get('female_range_min'),
-            data.get('female_range_max'),
-            data.get('range_unit'),
-            data.get('interpretation_low'),
-            data.get('interpretation_normal'),
-            data.get('interpretation_high'),
-            data.get('sample_type'),
-            data.get('methodology'),
-            data.get('turnaround_time'),
-            data.get('department')
-        ))
-        conn.commit()
-        
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO Tests (
+                    TestName, 
+                    Price, 
+                    Category, 
+                    Range_Text,
+                    ReportingTime,
+                    SampleType,
+                    Male_Range_Min,
+                    Male_Range_Max,
+                    Female_Range_Min,
+                    Female_Range_Max,
+                    Range_Unit,
+                    Interpretation_Low,
+                    Interpretation_Normal,
+                    Interpretation_High,
+                    Sample_Type,
+                    Methodology,
+                    Turnaround_Time,
+                    Department,
+                    IsActive,
+                    CreatedAt
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, GETDATE())
+            """, (
+                data['test_name'],
+                data['price'],
+                data.get('category'),
+                data.get('normal_range'),  # This goes to Range_Text
+                data.get('reporting_time'),
+                data.get('sample_type'),
+                data.get('male_range_min'),
+                data.get('male_range_max'),
+                data.get('female_range_min'),
+                data.get('female_range_max'),
+                data.get('range_unit'),
+                data.get('interpretation_low'),
+                data.get('interpretation_normal'),
+                data.get('interpretation_high'),
+                data.get('sample_type'),
+                data.get('methodology'),
+                data.get('turnaround_time'),
+                data.get('department')
+            ))
+            cursor.close()
+        
+        on_commit(invalidate_test_catalog)
+        on_commit(lambda: dashboard_cache.invalidate('test-statistics'))
         return jsonify({'success': True, 'message': 'Test added successfully'})
     except Exception as e:
-        conn.rollback()
         print(f"Error adding test: {str(e)}")
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
 
 @admin_bp.route("/admin/tests/update/<int:test_id>", methods=["PUT"])
 def update_test(test_id):
@@ -814,62 +885,60 @@ def update_test(test_id):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
     data = request.get_json()
-    conn = get_connection()
-    cursor = conn.cursor()
     
     try:
-        cursor.execute("""
-            UPDATE Tests SET 
-                TestName = ?, 
-                Price = ?, 
-                Category = ?, 
-                Range_Text = ?,
-                ReportingTime = ?,
-                SampleType = ?,
-                Male_Range_Min = ?,
-                Male_Range_Max = ?,
-                Female_Range_Min = ?,
-                Female_Range_Max = ?,
-                Range_Unit = ?,
-                Interpretation_Low = ?,
-                Interpretation_Normal = ?,
-                Interpretation_High = ?,
-                Sample_Type = ?,
-                Methodology = ?,
-                Turnaround_Time = ?,
-                Department = ?
-            WHERE TestId = ?
-        """, (
-            data['test_name'],
-            data['price'],
-            data.get('category'),
-            data.get('normal_range'),  # This goes to Range_Text
-            data.get('reporting_time'),
-            data.get('sample_type'),
-            data.get('male_range_min'),
-            data.get('male_range_max'),
-            data.get('female_range_min'),
-            data.get('female_range_max'),
-            data.get('range_unit'),
-            data.get('interpretation_low'),
-            data.get('interpretation_normal'),
-            data.get('interpretation_high'),
-            data.get('sample_type'),
-            data.get('methodology'),
-            data.get('turnaround_time'),
-            data.get('department'),
-            test_id
-        ))
-        conn.commit()
-        
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE Tests SET 
+                    TestName = ?, 
+                    Price = ?, 
+                    Category = ?, 
+                    Range_Text = ?,
+                    ReportingTime = ?,
+                    SampleType = ?,
+                    Male_Range_Min = ?,
+                    Male_Range_Max = ?,
+                    Female_Range_Min = ?,
+                    Female_Range_Max = ?,
+                    Range_Unit = ?,
+                    Interpretation_Low = ?,
+                    Interpretation_Normal = ?,
+                    Interpretation_High = ?,
+                    Sample_Type = ?,
+                    Methodology = ?,
+                    Turnaround_Time = ?,
+                    Department = ?
+                WHERE TestId = ?
+            """, (
+                data['test_name'],
+                data['price'],
+                data.get('category'),
+                data.get('normal_range'),  # This goes to Range_Text
+                data.get('reporting_time'),
+                data.get('sample_type'),
+                data.get('male_range_min'),
+                data.get('male_range_max'),
+                data.get('female_range_min'),
+                data.get('female_range_max'),
+                data.get('range_unit'),
+                data.get('interpretation_low'),
+                data.get('interpretation_normal'),
+                data.get('interpretation_high'),
+                data.get('sample_type'),
+                data.get('methodology'),
+                data.get('turnaround_time'),
+                data.get('department'),
+                test_id
+            ))
+            cursor.close()
+        
+        on_commit(invalidate_test_catalog)
+        on_commit(lambda: dashboard_cache.invalidate('test-statistics'))
         return jsonify({'success': True, 'message': 'Test updated successfully'})
     except Exception as e:
-        conn.rollback()
         print(f"Error updating test: {str(e)}")
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
 
 @admin_bp.route("/admin/tests/delete/<int:test_id>", methods=["DELETE"])
 def delete_test(test_id):
@@ -877,17 +946,39 @@ def delete_test(test_id):
     if session.get("role") != "Admin":
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute("UPDATE Tests SET IsActive = 0 WHERE TestId = ?", (test_id,))
-        conn.commit()
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE Tests SET IsActive = 0 WHERE TestId = ?", (test_id,))
+            cursor.close()
         
+        on_commit(invalidate_test_catalog)
+        on_commit(lambda: dashboard_cache.invalidate('test-statistics'))
         return jsonify({'success': True, 'message': 'Test deleted successfully'})
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+
+# ===========================================
+# QUERY PERFORMANCE APIs
+# ===========================================
+
+@admin_bp.route("/admin/api/query-stats", methods=["GET", "DELETE"])
+def get_query_stats():
+    """Per-statement latency histograms (p50/p95/p99) and recent slow queries"""
+    if session.get("role") != "Admin":
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    if request.method == "DELETE":
+        query_stats.reset()
+        return jsonify({'success': True, 'message': 'Query statistics reset'})
+    
+    snapshot = query_stats.snapshot()
+    limit = request.args.get('limit', type=int)
+    if limit:
+        snapshot['queries'] = snapshot['queries'][:limit]
+    
+    return jsonify({
+        'success': True,
+        'pool': get_pool().stats(),
+        **snapshot
+    })
@@ -1,7 +1,8 @@
 # routes/auth.py - Sirf login function update karein
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash
-from db import get_connection
+from db import get_db, on_commit, unit_of_work
+from db.rows import fetch_one
 import secrets
 from datetime import datetime, timedelta
 import re
@@ -16,50 +17,43 @@ def initialize_default_passwords():
     Function to initialize default passwords when needed
     Run this once manually or during first setup
     """
-    conn = None
-    cursor = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        print("🔐 Setting up default hashed passwords...")
-        
-        # Hash and update passwords
-        admin_hash = generate_password_hash('Imran@4200')
-        reception_hash = generate_password_hash('Rec@001')
-        tech_hash = generate_password_hash('Tech@123')
-        
-        # Update admin password
-        cursor.execute(
-            "UPDATE Users SET Password = ?, FullName = ? WHERE Username = 'admin' AND Role = 'Admin'",
-            (admin_hash, 'System Administrator')
-        )
-        print("✅ Admin password set: Imran@4200")
-        
-        # Update reception password  
-        cursor.execute(
-            "UPDATE Users SET Password = ?, FullName = ? WHERE Username = 'reception' AND Role = 'Receptionist'", 
-            (reception_hash, 'Reception Staff')
-        )
-        print("✅ Reception password set: Rec@001")
-        
-        # Update technician password
-        cursor.execute(
-            "UPDATE Users SET Password = ?, FullName = ? WHERE Username = 'technician' AND Role = 'Technician'",
-            (tech_hash, 'Lab Technician')
-        )
-        print("✅ Technician password set: Tech@123")
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            
+            print("🔐 Setting up default hashed passwords...")
+            
+            # Hash and update passwords
+            admin_hash = generate_password_hash('Imran@4200')
+            reception_hash = generate_password_hash('Rec@001')
+            tech_hash = generate_password_hash('Tech@123')
+            
+            # Update admin password
+            cursor.execute(
+                "UPDATE Users SET Password = ?, FullName = ? WHERE Username = 'admin' AND Role = 'Admin'",
+                (admin_hash, 'System Administrator')
+            )
+            print("✅ Admin password set: Imran@4200")
+            
+            # Update reception password  
+            cursor.execute(
+                "UPDATE Users SET Password = ?, FullName = ? WHERE Username = 'reception' AND Role = 'Receptionist'", 
+                (reception_hash, 'Reception Staff')
+            )
+            print("✅ Reception password set: Rec@001")
+            
+            # Update technician password
+            cursor.execute(
+                "UPDATE Users SET Password = ?, FullName = ? WHERE Username = 'technician' AND Role = 'Technician'",
+                (tech_hash, 'Lab Technician')
+            )
+            print("✅ Technician password set: Tech@123")
+            cursor.close()
         
-        conn.commit()
         print("🎉 Default passwords initialized successfully!")
-            
+        
     except Exception as e:
         print(f"❌ Error initializing passwords: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
 
 @auth_bp.route("/")
 def login_page():
@@ -84,7 +78,7 @@ def login():
     conn = None
     cursor = None
     try:
-        conn = get_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
         # Try with IsActive column first, if error, try without it
@@ -100,12 +94,9 @@ def login():
                 (username,)
             )
         
-        row = cursor.fetchone()
+        user = fetch_one(cursor)
 
-        if row:
-            # Convert to dict for safe access
-            columns = [column[0] for column in cursor.description]
-            user = dict(zip(columns, row))
+        if user:
             print(f"✅ User found: {user['Username']}, Role: {user['Role']}")
             print(f"📊 Stored password: {user['Password'][:50]}...")
 
@@ -207,7 +198,6 @@ def login():
     finally:
         try:
             if cursor: cursor.close()
-            if conn: conn.close()
         except Exception as e:
             print(f"Error closing connection: {e}")
 
@@ -261,7 +251,7 @@ def forgot_password():
         conn = None
         cursor = None
         try:
-            conn = get_connection()
+            conn = get_db()
             cursor = conn.cursor()
             
             # Check user with email and username
@@ -269,12 +259,9 @@ def forgot_password():
                 "SELECT UserId, Username, Email FROM Users WHERE Username = ? AND Email = ? AND IsActive = 1",
                 (username, email)
             )
-            row = cursor.fetchone()
+            user = fetch_one(cursor)
             
-            if row:
-                # Convert to dict
-                columns = [column[0] for column in cursor.description]
-                user = dict(zip(columns, row))
+            if user:
                 
                 # Generate reset token
                 token = secrets.token_urlsafe(32)
@@ -312,7 +299,6 @@ def forgot_password():
             })
         finally:
             if cursor: cursor.close()
-            if conn: conn.close()
             
     except Exception as e:
         print(f"Error in forgot_password: {e}")
@@ -397,25 +383,22 @@ def reset_password(token):
             })
         
         # Update password in database
-        conn = None
-        cursor = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Hash the new password
-            hashed_password = generate_password_hash(new_password)
-            
-            # Update user password
-            cursor.execute(
-                "UPDATE Users SET Password = ? WHERE UserId = ?",
-                (hashed_password, token_data['user_id'])
-            )
-            
-            conn.commit()
-            
-            # Mark token as used
-            token_data['used'] = True
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+
+                # Hash the new password
+                hashed_password = generate_password_hash(new_password)
+
+                # Update user password
+                cursor.execute(
+                    "UPDATE Users SET Password = ? WHERE UserId = ?",
+                    (hashed_password, token_data['user_id'])
+                )
+                cursor.close()
+
+            # Mark token as used once the new password is committed
+            on_commit(lambda: token_data.update(used=True))
             
             print(f"✅ Password reset successful for user ID: {token_data['user_id']}")
             
@@ -426,15 +409,10 @@ def reset_password(token):
                 
         except Exception as e:
             print(f"Database error in reset_password: {e}")
-            if conn:
-                conn.rollback()
             return jsonify({
                 'success': False, 
                 'message': 'Database error occurred. Please try again.'
             })
-        finally:
-            if cursor: cursor.close()
-            if conn: conn.close()
             
     except Exception as e:
         print(f"Error in reset_password: {e}")
@@ -1,17 +1,27 @@
 # routes/patients.py
-from flask import Blueprint, render_template, request, jsonify, send_file
-from models.patient_model import Patient
-from io import BytesIO
-from reportlab.lib.pagesizes import A4, letter
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet
+from flask import Blueprint, Response, render_template, request, jsonify, send_file, url_for
+from models.patient_model import MAX_PAGE_SIZE, PAGE_SIZE, PATIENT_FIELDS, Patient
+from models.patient_cache import get_patient
+from models.letterhead import TEMPLATE_VERSION, get_styles, letterhead_document
+from models.pdf_cache import PDFKey, pdf_cache
+from models.pdf_jobs import DONE, pdf_jobs
+from models.pdf_pool import PDFRenderError, PDFRenderTimeout, pdf_render_pool
+from io import BytesIO, StringIO
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import PageBreak, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib import colors
-from datetime import datetime
+from openpyxl import Workbook
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import csv
 import logging
+import tempfile
+import zipfile
 from abc import ABC, abstractmethod
 import json
-from db import get_connection
+from db import STREAM_BATCH_SIZE, unit_of_work
+from db.predicates import DateRange, as_date
+from db.rows import fetch_all
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -68,24 +78,14 @@ class ReceiptPDFStrategy(PDFGenerationStrategy):
     
     def generate(self, patient_data, buffer):
         try:
-            doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=20, bottomMargin=20)
+            # Letterhead (logo, clinic block, footer) is stamped by the page template
+            doc, on_page = letterhead_document(buffer, "This is a computer generated receipt")
             elements = []
-            styles = getSampleStyleSheet()
-            styles['Normal'].fontSize = 11
-
-            # Header Section
-            elements.extend(self._create_header(styles))
-            
-            # Patient Information Section
-            elements.extend(self._create_patient_info(patient_data, styles))
+            styles = get_styles()
             
-            # Tests Details Section
-            elements.extend(self._create_tests_section(patient_data, styles))
+            elements.extend(self.receipt_elements(patient_data, styles))
             
-            # Footer Section
-            elements.extend(self._create_footer(styles))
-            
-            doc.build(elements)
+            doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
             buffer.seek(0)
             return {"success": True, "buffer": buffer}
             
@@ -93,44 +93,28 @@ class ReceiptPDFStrategy(PDFGenerationStrategy):
             logger.error(f"PDF generation error: {str(e)}")
             return {"success": False, "error": str(e)}
 
-    def _create_header(self, styles):
-        """Create PDF header with logo and clinic info"""
-        elements = []
-        
-        logo_path = "static/logo.png"
+    def generate_batch(self, patients, buffer):
+        """Receipts of many patients in one document, each starting on a new page"""
         try:
-            logo_img = Image(logo_path, 1.2 * inch, 1.2 * inch)
-        except:
-            logo_img = Spacer(1.2 * inch, 1.2 * inch)
-
-        header_table = Table(
-            [[
-                logo_img,
-                Paragraph(
-                    "<b><font size='16' color='white'>CITI LAB & DIAGNOSTIC CENTRE</font></b><br/>"
-                    "<font color='white'>"
-                    "<u><b>______________________________________________</b></u><br/>"
-                    "Opposite: C.M.H Muzaffarabad Azad Kashmir<br/>"
-                    "Cell: 0301-5225117 | Ph: 05822-447698"
-                    "</font>",
-                    styles['Normal']
-                )
-            ]],
-            colWidths=[1.4 * inch, A4[0] - (1.4 * inch + 60)]
-        )
-
-        header_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.Color(0, 0.4, 0.4)),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
+            doc, on_page = letterhead_document(buffer, "This is a computer generated receipt")
+            elements = []
+            styles = get_styles()
+            for patient_data in patients:
+                if elements:
+                    elements.append(PageBreak())
+                elements.extend(self.receipt_elements(patient_data, styles))
+            
+            doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
+            buffer.seek(0)
+            return {"success": True, "buffer": buffer}
+            
+        except Exception as e:
+            logger.error(f"Batch PDF generation error: {str(e)}")
+            return {"success": False, "error": str(e)}
 
-        elements.append(header_table)
-        elements.append(Spacer(1, 18))
-        return elements
+    def receipt_elements(self, patient_data, styles):
+        """Flowables of one receipt: patient information, then the tests"""
+        return self._create_patient_info(patient_data, styles) + self._create_tests_section(patient_data, styles)
 
     def _create_patient_info(self, patient_data, styles):
         """Create patient information section"""
@@ -163,28 +147,12 @@ class ReceiptPDFStrategy(PDFGenerationStrategy):
         elements = []
         
         tests_text = patient_data.get("tests", "")
-        tests_paragraph = Paragraph(f"<b>Tests Investigations:</b><br/>{tests_text}", styles['Normal'])
+        tests_paragraph = Paragraph(f"<b>Tests Investigations:</b><br/>{tests_text}", styles['Receipt'])
         elements.append(tests_paragraph)
         elements.append(Spacer(1, 12))
         
         return elements
 
-    def _create_footer(self, styles):
-        """Create PDF footer"""
-        elements = []
-        
-        footer_text = """
-        <b><i>Thank you for choosing Citi Lab & Diagnostic Centre</i></b><br/>
-        <i>For any queries, please contact: 0301-5225117</i><br/>
-        <i>This is a computer generated receipt</i>
-        """
-        
-        footer_paragraph = Paragraph(footer_text, styles['Normal'])
-        elements.append(Spacer(1, 20))
-        elements.append(footer_paragraph)
-        
-        return elements
-
 class DetailedReportPDFStrategy(PDFGenerationStrategy):
     """Strategy for generating detailed report PDFs (extensible for future)"""
     
@@ -196,19 +164,15 @@ class LabReportPDFStrategy(PDFGenerationStrategy):
     
     def generate(self, patient_data, buffer):
         try:
-            doc = SimpleDocTemplate(buffer, pagesize=A4, 
-                                   rightMargin=30, leftMargin=30, 
-                                   topMargin=20, bottomMargin=20)
+            doc, on_page = letterhead_document(buffer, "This is a computer generated lab report")
             elements = []
-            styles = getSampleStyleSheet()
+            styles = get_styles()
             
-            elements.extend(self._create_header(styles))
             elements.extend(self._create_patient_info(patient_data, styles))
             elements.extend(self._create_test_results(patient_data, styles))
             elements.extend(self._create_interpretation_section(styles))
-            elements.extend(self._create_footer(styles))
             
-            doc.build(elements)
+            doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
             buffer.seek(0)
             return {"success": True, "buffer": buffer}
             
@@ -216,44 +180,6 @@ class LabReportPDFStrategy(PDFGenerationStrategy):
             logger.error(f"Lab report PDF error: {str(e)}")
             return {"success": False, "error": str(e)}
 
-    def _create_header(self, styles):
-        elements = []
-        
-        logo_path = "static/logo.png"
-        try:
-            logo_img = Image(logo_path, 1.2 * inch, 1.2 * inch)
-        except:
-            logo_img = Spacer(1.2 * inch, 1.2 * inch)
-
-        header_table = Table(
-            [[
-                logo_img,
-                Paragraph(
-                    "<b><font size='16' color='white'>CITI LAB & DIAGNOSTIC CENTRE</font></b><br/>"
-                    "<font color='white'>"
-                    "<u><b>______________________________________________</b></u><br/>"
-                    "Opposite: C.M.H Muzaffarabad Azad Kashmir<br/>"
-                    "Cell: 0301-5225117 | Ph: 05822-447698"
-                    "</font>",
-                    styles['Normal']
-                )
-            ]],
-            colWidths=[1.4 * inch, A4[0] - (1.4 * inch + 60)]
-        )
-
-        header_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.Color(0, 0.4, 0.4)),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-
-        elements.append(header_table)
-        elements.append(Spacer(1, 18))
-        return elements
-
     def _create_patient_info(self, patient_data, styles):
         elements = []
         
@@ -344,21 +270,6 @@ class LabReportPDFStrategy(PDFGenerationStrategy):
         
         return elements
 
-    def _create_footer(self, styles):
-        elements = []
-        
-        footer_text = """
-        <b><i>Thank you for choosing Citi Lab & Diagnostic Centre</i></b><br/>
-        <i>For any queries, please contact: 0301-5225117</i><br/>
-        <i>This is a computer generated lab report</i>
-        """
-        
-        footer_paragraph = Paragraph(footer_text, styles['Normal'])
-        elements.append(Spacer(1, 20))
-        elements.append(footer_paragraph)
-        
-        return elements
-
 # ---------------------------------------
 # PDF GENERATOR CONTEXT using Strategy Pattern
 # ---------------------------------------
@@ -408,7 +319,7 @@ class TestModel:
     def get_all_tests_with_details():
         """Get all tests with complete details including ranges"""
         try:
-            with get_connection() as conn:
+            with unit_of_work() as conn:
                 cursor = conn.cursor(dictionary=True)
                 
                 cursor.execute("""
@@ -460,7 +371,7 @@ class TestModel:
     def get_test_by_id(test_id):
         """Get test details by ID"""
         try:
-            with get_connection() as conn:
+            with unit_of_work() as conn:
                 cursor = conn.cursor(dictionary=True)
                 
                 cursor.execute("""
@@ -482,7 +393,6 @@ class PatientService:
     
     def __init__(self):
         self.response_factory = ResponseFactory()
-        self.pdf_generator = PDFGenerator()
 
     def validate_patient_data(self, data):
         """Enhanced patient data validation"""
@@ -605,11 +515,27 @@ class PatientService:
                 message="Patient addition failed"
             ), 500
 
+    @staticmethod
+    def _pdf_response(source, filename, key):
+        """Inline PDF with the cache key as ETag; answers 304 to a matching If-None-Match"""
+        response = send_file(
+            source,
+            as_attachment=False,
+            download_name=filename,
+            mimetype='application/pdf',
+            etag=key.digest,
+            conditional=True,
+            last_modified=None,
+        )
+        # Let browsers keep the PDF but revalidate it, the record may have been edited since
+        response.cache_control.no_cache = True
+        return response
+
     def generate_patient_pdf(self, mr_no, pdf_type="receipt"):
         """Generate PDF for patient"""
         try:
-            patients = Patient.get_all_patients()
-            patient = next((p for p in patients if p.get('mr_no') == mr_no), None)
+            # Reprints of the same receipt / report are served from the patient cache
+            patient = get_patient(mr_no)
 
             if not patient:
                 return self.response_factory.create_response(
@@ -618,22 +544,38 @@ class PatientService:
                     message="PDF generation failed"
                 ), 404
 
-            pdf_result = self.pdf_generator.generate_pdf(patient, pdf_type)
-            
-            if pdf_result["success"]:
-                return send_file(
-                    pdf_result["buffer"],
-                    as_attachment=False,
-                    download_name=pdf_result["filename"],
-                    mimetype='application/pdf'
-                )
-            else:
+            # Same record + same template = same PDF; the key doubles as the ETag
+            key = PDFKey.for_patient(pdf_type, patient, TEMPLATE_VERSION)
+            filename = f"{pdf_type}_{patient['mr_no']}.pdf"
+            if request.if_none_match.contains(key.digest):
+                return self._pdf_response(BytesIO(), filename, key)
+
+            path = pdf_cache.get(key)
+            if path is not None:
+                return self._pdf_response(path, filename, key)
+
+            # Rendered by the PDF worker processes so layout doesn't stall other requests
+            try:
+                data = pdf_render_pool.render(patient, pdf_type)
+            except PDFRenderTimeout as e:
                 return self.response_factory.create_response(
                     "error",
-                    errors=[f"PDF generation failed: {pdf_result['error']}"],
+                    errors=[str(e)],
+                    message="Failed to generate PDF"
+                ), 503
+            except PDFRenderError as e:
+                return self.response_factory.create_response(
+                    "error",
+                    errors=[f"PDF generation failed: {str(e)}"],
                     message="Failed to generate PDF"
                 ), 500
 
+            try:
+                pdf_cache.put(key, data)
+            except OSError as e:
+                logger.warning(f"Could not cache {filename}: {str(e)}")
+            return self._pdf_response(BytesIO(data), filename, key)
+
         except Exception as e:
             logger.error(f"PDF generation route error: {str(e)}")
             return self.response_factory.create_response(
@@ -750,7 +692,7 @@ def debug_tests():
     try:
         print("=== DEBUG TESTS ROUTE CALLED ===")
         
-        with get_connection() as conn:
+        with unit_of_work() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -780,14 +722,7 @@ def debug_tests():
                 ORDER BY TestName
             """)
             
-            columns = [column[0] for column in cursor.description]
-            test_samples = []
-            
-            for row in cursor.fetchall():
-                test = {}
-                for i, col in enumerate(columns):
-                    test[col] = row[i]
-                test_samples.append(test)
+            test_samples = fetch_all(cursor)
             
             return jsonify({
                 "success": True,
@@ -816,7 +751,7 @@ def get_all_tests():
     try:
         print("=== GET_ALL_TESTS ROUTE CALLED ===")
         
-        with get_connection() as conn:
+        with unit_of_work() as conn:
             cursor = conn.cursor()
             
             # Use Range_Text instead of NormalRange (your database column name)
@@ -827,22 +762,7 @@ def get_all_tests():
                 ORDER BY TestName
             """)
             
-            columns = [column[0] for column in cursor.description]
-            print(f"Query columns: {columns}")
-            
-            tests = []
-            for row in cursor.fetchall():
-                test = {}
-                for i, col in enumerate(columns):
-                    value = row[i]
-                    if col == 'Price' and value is not None:
-                        try:
-                            test[col] = float(value)
-                        except:
-                            test[col] = 0.0
-                    else:
-                        test[col] = value
-                tests.append(test)
+            tests = fetch_all(cursor, convert={'Price': float})
             
             print(f"✅ Retrieved {len(tests)} tests from database")
             
@@ -921,6 +841,427 @@ def generate_lab_report(mr_no):
     """Generate lab report PDF with ranges"""
     return patient_service.generate_patient_pdf(mr_no, "lab_report")
 
+# ----------------------------------------
+# Background PDF jobs (long reports, bulk prints)
+# ----------------------------------------
+PDF_TYPES = ("receipt", "detailed_report", "lab_report")
+
+def _pdf_job_response(job):
+    data = job.to_dict()
+    data["status_url"] = url_for('patients.pdf_job_status', job_id=job.id)
+    if job.status == DONE:
+        data["download_url"] = url_for('patients.pdf_job_download', job_id=job.id)
+    return data
+
+@patients_bp.route('/pdf-jobs', methods=['POST'])
+def create_pdf_job():
+    """
+    Queue a PDF and return at once with 202 and the job; poll status_url
+    until the job has a download_url. Body (JSON or form): mr_no and type
+    (receipt, detailed_report or lab_report; receipt by default).
+    """
+    payload = request.get_json(silent=True) or request.form
+    pdf_type = payload.get('type') or "receipt"
+    try:
+        mr_no = int(payload.get('mr_no'))
+    except (TypeError, ValueError):
+        mr_no = None
+    if mr_no is None or pdf_type not in PDF_TYPES:
+        return jsonify(ResponseFactory.create_response(
+            "error",
+            errors=[f"mr_no must be a number and type one of {', '.join(PDF_TYPES)}"],
+            message="Invalid PDF job"
+        )), 400
+
+    patient = get_patient(mr_no)
+    if not patient:
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=["Patient not found"], message="Invalid PDF job"
+        )), 404
+
+    job = pdf_jobs.submit(patient, PDFKey.for_patient(pdf_type, patient, TEMPLATE_VERSION))
+    data = _pdf_job_response(job)
+    response = jsonify(ResponseFactory.create_response("success", data=data, message="PDF job queued"))
+    response.headers["Location"] = data["status_url"]
+    return response, 202
+
+@patients_bp.route('/pdf-jobs/<job_id>', methods=['GET'])
+def pdf_job_status(job_id):
+    """Status of a PDF job (queued, running, done or failed)"""
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=["Unknown or expired PDF job"], message="PDF job not found"
+        )), 404
+    return jsonify(ResponseFactory.create_response("success", data=_pdf_job_response(job)))
+
+@patients_bp.route('/pdf-jobs/<job_id>/download', methods=['GET'])
+def pdf_job_download(job_id):
+    """The finished PDF, from the PDF cache directory"""
+    job = pdf_jobs.get(job_id)
+    if job is None or job.status != DONE:
+        return jsonify(ResponseFactory.create_response(
+            "error",
+            errors=["PDF job is not finished" if job else "Unknown or expired PDF job"],
+            message="PDF not available"
+        )), 409 if job else 404
+
+    path = pdf_jobs.store.get(job.key)
+    if path is None:
+        # Evicted, or dropped because the patient changed since - submit a new job
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=["The PDF is no longer cached"], message="PDF not available"
+        )), 410
+    return PatientService._pdf_response(path, f"{job.pdf_type}_{job.mr_no}.pdf", job.key)
+
+# ----------------------------------------
+# Batch receipt printing
+# ----------------------------------------
+BATCH_RECEIPT_LIMIT = 500
+
+class _ChunkWriter:
+    """Write-only file for ZipFile that hands out what was written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+def _receipt_zip_chunks(patients):
+    """ZIP of one receipt per patient, streamed as the PDF workers finish them"""
+    out = _ChunkWriter()
+    errors = []
+    # PDFs are already compressed - store them as they are
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as archive:
+        pending = []
+        for patient in patients:
+            key = PDFKey.for_patient("receipt", patient, TEMPLATE_VERSION)
+            path = pdf_cache.get(key)
+            if path is None:
+                pending.append((patient, key))
+                continue
+            with open(path, "rb") as f:
+                archive.writestr(f"receipt_{patient['mr_no']}.pdf", f.read())
+            yield out.take()
+
+        keys = {id(patient): key for patient, key in pending}
+        for patient, result in pdf_render_pool.render_many([p for p, _ in pending], "receipt"):
+            if isinstance(result, Exception):
+                errors.append(f"{patient['mr_no']}: {result}")
+                continue
+            try:
+                pdf_cache.put(keys[id(patient)], result)
+            except OSError as e:
+                logger.warning(f"Could not cache receipt {patient['mr_no']}: {str(e)}")
+            archive.writestr(f"receipt_{patient['mr_no']}.pdf", result)
+            yield out.take()
+
+        if errors:
+            archive.writestr("ERRORS.txt", "Receipts that could not be generated:\n" + "\n".join(errors) + "\n")
+    yield out.take()
+
+@patients_bp.route('/receipts/batch', methods=['GET'])
+def batch_receipts():
+    """
+    Receipts of many patients at once: ?date=YYYY-MM-DD (everyone registered
+    that day) or ?mr_no=1001,1002 (repeatable). ?format=pdf (default) returns
+    one PDF with a receipt per page; ?format=zip streams a ZIP with one PDF
+    per patient, rendered in parallel by the PDF workers.
+    """
+    output = request.args.get('format', 'pdf')
+    day = request.args.get('date')
+    mr_nos = [part for value in request.args.getlist('mr_no') for part in value.split(',') if part.strip()]
+    try:
+        if output not in ('pdf', 'zip'):
+            raise ValueError("format must be pdf or zip")
+        if bool(day) == bool(mr_nos):
+            raise ValueError("give either date (YYYY-MM-DD) or mr_no")
+        if len(mr_nos) > BATCH_RECEIPT_LIMIT:
+            raise ValueError(f"at most {BATCH_RECEIPT_LIMIT} receipts per batch")
+        try:
+            day = as_date(day) if day else None
+            mr_nos = [int(mr_no) for mr_no in mr_nos]
+        except (TypeError, ValueError):
+            raise ValueError("date must be YYYY-MM-DD and mr_no numbers")
+    except ValueError as e:
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=[str(e)], message="Invalid batch receipt request"
+        )), 400
+    label = day.isoformat() if day else "selection"
+
+    try:
+        if day:
+            patients = []
+            for record in Patient.stream_patients(date_range=DateRange.day(day)):
+                patients.append(record.to_dict())
+                if len(patients) > BATCH_RECEIPT_LIMIT:
+                    return jsonify(ResponseFactory.create_response(
+                        "error",
+                        errors=[f"More than {BATCH_RECEIPT_LIMIT} patients on {label} - select them by mr_no"],
+                        message="Invalid batch receipt request"
+                    )), 400
+            patients.reverse()      # registration order
+        else:
+            patients = Patient.get_patients_by_mr_nos(mr_nos)
+    except Exception as e:
+        logger.error(f"Batch receipt lookup error: {str(e)}")
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=["Failed to load patients"], message="Batch receipts failed"
+        )), 500
+
+    if not patients:
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=["No patients found"], message="Batch receipts failed"
+        )), 404
+
+    if output == 'zip':
+        return Response(
+            _receipt_zip_chunks(patients),
+            mimetype='application/zip',
+            headers={"Content-Disposition": f'attachment; filename="receipts_{label}.zip"'}
+        )
+
+    try:
+        data = pdf_render_pool.render_receipts(patients)
+    except PDFRenderTimeout as e:
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=[str(e)], message="Batch receipts failed"
+        )), 503
+    except PDFRenderError as e:
+        return jsonify(ResponseFactory.create_response(
+            "error", errors=[f"PDF generation failed: {str(e)}"], message="Batch receipts failed"
+        )), 500
+    return send_file(BytesIO(data), as_attachment=False, download_name=f"receipts_{label}.pdf",
+                     mimetype='application/pdf')
+
+# ----------------------------------------
+# Listing filters and streamed responses
+# ----------------------------------------
+def _listing_filters():
+    """date_range / doctor / gender keyword arguments from ?start&end (inclusive)&doctor&gender"""
+    date_range = None
+    start, end = request.args.get('start'), request.args.get('end')
+    if start or end:
+        try:
+            start, end = as_date(start), as_date(end)
+        except (TypeError, ValueError):
+            raise ValueError("start and end go together (YYYY-MM-DD)")
+        if end < start:
+            raise ValueError("end must not be before start")
+        date_range = DateRange(start, end + timedelta(days=1))
+    
+    gender = request.args.get('gender') or None
+    if gender and gender not in ("Male", "Female", "Other"):
+        raise ValueError("gender must be Male, Female or Other")
+    return {"date_range": date_range, "doctor": request.args.get('doctor') or None, "gender": gender}
+
+def _bad_listing_request(error):
+    return jsonify(
+        ResponseFactory.create_response("error", errors=[error], message="Invalid patient listing request")
+    ), 400
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _json_array_chunks(items, batch_size=STREAM_BATCH_SIZE):
+    """A JSON array, yielded a few hundred items at a time"""
+    yield "["
+    chunk, first = [], True
+    for item in items:
+        chunk.append(("" if first else ",") + json.dumps(item, default=_json_value))
+        first = False
+        if len(chunk) >= batch_size:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk) + "]"
+
+def _csv_chunks(header, rows, batch_size=STREAM_BATCH_SIZE):
+    """CSV text (header first), yielded a few hundred rows at a time"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# ----------------------------------------
+# Paginated Patient Listing API
+# ----------------------------------------
+@patients_bp.route('/api/patients', methods=['GET'])
+def list_patients():
+    """
+    Patients newest first, one page at a time:
+    ?cursor=<next_cursor>&limit=N&start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive)&doctor=...&gender=...
+    """
+    after = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    try:
+        if limit < 1:
+            raise ValueError("limit must be a positive number")
+        filters = _listing_filters()
+    except ValueError as e:
+        return _bad_listing_request(str(e))
+    
+    try:
+        page = Patient.get_patients_page(after=after, limit=limit, **filters)
+        return jsonify(
+            ResponseFactory.create_response(
+                "success",
+                data=page,
+                message="Patients retrieved successfully",
+                metadata={"limit": min(limit, MAX_PAGE_SIZE)}
+            )
+        )
+        
+    except Exception as e:
+        logger.error(f"Patient listing error: {str(e)}")
+        return jsonify(
+            ResponseFactory.create_response(
+                "error",
+                errors=["Failed to retrieve patients"],
+                message="Patient listing failed"
+            )
+        ), 500
+
+@patients_bp.route('/api/patients/stream', methods=['GET'])
+def stream_patients():
+    """
+    Every matching patient as one streamed JSON array (?format=json, default)
+    or CSV (?format=csv); same filters as /api/patients. Rows are read with
+    fetchmany() and written out as they arrive, so memory stays flat and the
+    first bytes leave before the query has finished.
+    """
+    fmt = request.args.get('format', 'json')
+    try:
+        if fmt not in ('json', 'csv'):
+            raise ValueError("format must be json or csv")
+        filters = _listing_filters()
+    except ValueError as e:
+        return _bad_listing_request(str(e))
+    
+    patients = Patient.stream_patients(**filters)
+    if fmt == 'csv':
+        rows = (p.as_tuple() for p in patients)
+        return Response(_csv_chunks(PATIENT_FIELDS, rows), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=patients.csv'})
+    return Response(_json_array_chunks(p.to_dict() for p in patients), mimetype='application/json')
+
+EXPORT_HEADER = ("MR No", "Reg Date", "Reporting Date", "Name", "Gender", "Age", "Doctor", "Tests", "Amount")
+
+def _xlsx_file(header, rows):
+    """Rows written through an openpyxl write-only sheet into a temporary file"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Patients")
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    # Write-only mode keeps rows on disk as they are appended; the xlsx zip
+    # can only be finished once the last row is in, so spool it to a file
+    spool = tempfile.TemporaryFile()
+    workbook.save(spool)
+    spool.seek(0)
+    return spool
+
+@patients_bp.route('/export', methods=['GET'])
+def export_patients():
+    """
+    Download patients as ?format=csv (default) or xlsx, optionally limited by
+    ?start&end (inclusive), doctor and gender. Rows come from the database
+    a batch at a time, so the export size doesn't change server memory.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        if fmt not in ('csv', 'xlsx'):
+            raise ValueError("format must be csv or xlsx")
+        filters = _listing_filters()
+    except ValueError as e:
+        return _bad_listing_request(str(e))
+    
+    date_range = filters['date_range']
+    name = "patients"
+    if date_range is not None:
+        name += f"_{date_range.start.isoformat()}_{(date_range.end - timedelta(days=1)).isoformat()}"
+    rows = (p.as_tuple() for p in Patient.stream_patients(**filters))
+    
+    try:
+        if fmt == 'xlsx':
+            return send_file(
+                _xlsx_file(EXPORT_HEADER, rows),
+                as_attachment=True,
+                download_name=f"{name}.xlsx",
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            )
+        return Response(_csv_chunks(EXPORT_HEADER, rows), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={name}.csv'})
+        
+    except Exception as e:
+        logger.error(f"Patient export error: {str(e)}")
+        return jsonify(
+            ResponseFactory.create_response(
+                "error",
+                errors=["Failed to export patients"],
+                message="Patient export failed"
+            )
+        ), 500
+
+# ----------------------------------------
+# Saved Patients DataTable (server-side processing)
+# ----------------------------------------
+@patients_bp.route('/api/patients/table', methods=['GET'])
+def patients_table():
+    """
+    DataTables server-side processing: filtering, sorting and paging run in
+    SQL and only the requested page is returned. Reads draw / start / length /
+    search[value] / order[0][column|dir] / columns[i][data], plus the page's
+    own doctor and gender filters.
+    """
+    args = request.args
+    draw = args.get('draw', 0, type=int)
+    try:
+        order_index = args.get('order[0][column]', 0, type=int)
+        total, filtered, patients = Patient.search_patients(
+            offset=args.get('start', 0, type=int),
+            limit=args.get('length', PAGE_SIZE, type=int),
+            search=args.get('search[value]') or None,
+            order_by=args.get(f'columns[{order_index}][data]', 'mr_no'),
+            descending=args.get('order[0][dir]', 'desc') != 'asc',
+            doctor=args.get('doctor') or None,
+            gender=args.get('gender') or None
+        )
+        for patient in patients:
+            for key in ('reg_date', 'reporting_date'):
+                if patient[key] is not None:
+                    patient[key] = patient[key].strftime('%Y-%m-%d')
+            patient['amount'] = float(patient['amount'] or 0)
+        
+        return jsonify({
+            "draw": draw,
+            "recordsTotal": total,
+            "recordsFiltered": filtered,
+            "data": patients
+        })
+        
+    except Exception as e:
+        logger.error(f"Patients table error: {str(e)}")
+        return jsonify({"draw": draw, "error": "Failed to load patients"}), 500
+
 # ----------------------------------------
 # 5️⃣ Saved Patients Page
 # ----------------------------------------
@@ -928,17 +1269,18 @@ def generate_lab_report(mr_no):
 def saved_patients():
     """Render saved patients page"""
     try:
-        patients = Patient.get_all_patients()
-        
+        # Rows are fetched a page at a time by /patients/api/patients/table;
+        # totals come from the DailyPatientStats rollup
+        summary = Patient.get_patient_statistics()
         stats = {
-            'total_patients': len(patients),
-            'total_revenue': sum(float(p.get('amount', 0)) for p in patients),
-            'male_patients': len([p for p in patients if p.get('gender') == 'Male']),
-            'female_patients': len([p for p in patients if p.get('gender') == 'Female'])
+            'total_patients': summary['total_patients'],
+            'total_revenue': summary['total_revenue'],
+            'male_patients': summary['gender_distribution'].get('Male', 0),
+            'female_patients': summary['gender_distribution'].get('Female', 0)
         }
         
         return render_template('saved_patients.html', 
-                             patients=patients,
+                             doctors=Patient.get_doctor_names(),
                              stats=stats)
                              
     except Exception as e:
@@ -970,17 +1312,18 @@ def lab_reports():
 def get_patient_statistics():
     """Get patient statistics"""
     try:
-        patients = Patient.get_all_patients()
+        summary = Patient.get_patient_statistics()
+        genders = summary['gender_distribution']
         
         statistics = {
-            "total_patients": len(patients),
-            "total_revenue": sum(float(p.get('amount', 0)) for p in patients),
+            "total_patients": summary['total_patients'],
+            "total_revenue": summary['total_revenue'],
             "gender_distribution": {
-                "male": len([p for p in patients if p.get('gender') == 'Male']),
-                "female": len([p for p in patients if p.get('gender') == 'Female']),
-                "other": len([p for p in patients if p.get('gender') not in ['Male', 'Female']])
+                "male": genders.get('Male', 0),
+                "female": genders.get('Female', 0),
+                "other": genders.get('Other', 0)
             },
-            "recent_patients": len([p for p in patients if p.get('reg_date') == datetime.now().strftime('%Y-%m-%d')])
+            "recent_patients": summary['today_patients']
         }
         
         return jsonify(
@@ -1008,12 +1351,12 @@ def get_patient_statistics():
 def health_check():
     """Health check for patients service"""
     try:
-        patients = Patient.get_all_patients()
+        summary = Patient.get_patient_statistics()
         
         health_info = {
             "service": "patients",
             "status": "healthy",
-            "total_patients": len(patients),
+            "total_patients": summary["total_patients"],
             "database_connected": True,
             "pdf_generation_available": True
         }
@@ -1136,7 +1479,7 @@ def delete_patient(mr_no):
 def manage_tests():
     """Simple page to manage test ranges"""
     try:
-        with get_connection() as conn:
+        with unit_of_work() as conn:
             cursor = conn.cursor(dictionary=True)
             cursor.execute("""
                 SELECT TestId, TestName, Price, Category, 
@@ -1163,7 +1506,7 @@ def update_test_ranges():
         data = request.json
         test_id = data['test_id']
         
-        with get_connection() as conn:
+        with unit_of_work() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE Tests SET
@@ -1183,7 +1526,7 @@ def update_test_ranges():
                 data.get('range_text') or None,
                 test_id
             ))
-            conn.commit()
+            cursor.close()
         
         return jsonify({'success': True, 'message': 'Ranges updated successfully!'})
         
@@ -1198,7 +1541,7 @@ def update_test_ranges():
 def quick_check():
     """Quick endpoint to verify tests are loading"""
     try:
-        with get_connection() as conn:
+        with unit_of_work() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM Tests")
             count = cursor.fetchone()[0]
@@ -1,6 +1,6 @@
 # routes/receipts.py
 from flask import Blueprint, request, jsonify
-from db import get_connection
+from db import unit_of_work
 import logging
 from datetime import datetime
 
@@ -168,9 +168,10 @@ def export_receipts_excel():
 def health_check():
     """Health check for receipts service"""
     try:
-        with get_connection() as conn:
+        with unit_of_work() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1")
+            cursor.close()
             
             return jsonify({
                 "success": True,
@@ -0,0 +1,4 @@
+import os
+
+# Run the suite against the SQLite stand-in unless a real database is configured
+os.environ.setdefault("DB_BACKEND", "sqlite")
@@ -0,0 +1,394 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from flask import Flask
+import db
+from db.backends import SQLiteBackend
+from models.analytics_cube import reset_cube
+from models.doctor_index import invalidate_doctor_index
+from models.receipt_model import invalidate_test_catalog
+from routes.admin import admin_bp, dashboard_cache
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # Fresh copy of the seeded SQLite stand-in for every test
+    monkeypatch.setattr(db, "_backend", SQLiteBackend(":memory:"))
+    db.dispose_pool()
+    invalidate_doctor_index()
+    invalidate_test_catalog()
+    reset_cube()
+    dashboard_cache.clear()
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.config['TESTING'] = True
+    db.init_app(app)
+    app.register_blueprint(admin_bp)
+    yield app
+    db.dispose_pool()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["role"] = "Admin"
+    return client
+
+@pytest.fixture
+def sql_panels(monkeypatch):
+    """Compute the report panels with SQL instead of the analytics cube"""
+    import routes.admin
+    monkeypatch.setattr(routes.admin, "ANALYTICS_CUBE", False)
+
+def add_patients(*rows):
+    """rows: (reg_date, doctor, tests, amount[, gender]) - written like a registration, minus the change hooks"""
+    from models.receipt_model import create_receipt
+    with db.unit_of_work() as conn:
+        cursor = conn.cursor()
+        for row in rows:
+            reg_date, doctor, tests, amount = row[:4]
+            gender = row[4] if len(row) > 4 else "Male"
+            cursor.execute(
+                "INSERT INTO Patients (RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount) "
+                "OUTPUT INSERTED.MrNo VALUES (?, ?, 'Test Patient', ?, 30, ?, ?, ?)",
+                (reg_date, reg_date, gender, doctor, tests, amount)
+            )
+            create_receipt(cursor, cursor.fetchone()[0], tests, amount)
+
+def test_matcher_only_counts_whole_items():
+    from models.test_matcher import TestNameMatcher
+    names = ["CBC", "CBC with ESR", "IgE", "Immunoglobulins (iga,ige,igg,igm)", "Urine R/E"]
+    matcher = TestNameMatcher(names)
+    assert matcher.match("CBC with ESR, urine r/e") == {1, 4}
+    assert matcher.match("Immunoglobulins (IgA,IgE,IgG,IgM),  CBC") == {3, 0}
+    assert matcher.match("IgE") == {2}
+    assert matcher.match("") == set()
+
+def test_test_statistics_single_pass(client):
+    add_patients(
+        ("2024-02-01", "Dr. Ahmed Khan", "Blood Sugar After Dinner, Blood Sugar (1 Hrs ABF)", 700),
+        ("2024-02-02", "Dr. Ahmed Khan", "blood sugar after dinner", 300),
+    )
+    data = client.get("/admin/api/test-statistics").get_json()
+    assert data["success"] is True
+    by_name = {t["test_name"]: t for t in data["top_tests"]}
+    assert by_name["Blood Sugar After Dinner"]["patient_count"] == 2
+    assert by_name["Blood Sugar After Dinner"]["total_revenue"] == 1000.0
+    assert by_name["Blood Sugar (1 Hrs ABF)"]["patient_count"] == 1
+    assert data["summary"]["most_popular_test"] == "Blood Sugar After Dinner"
+    assert data["summary"]["total_tests_performed"] == 3
+    assert set(data) == {"success", "top_tests", "total_tests_count", "category_stats", "summary"}
+
+def test_doctor_name_normalization():
+    from models.doctor_index import normalize_doctor_name
+    assert normalize_doctor_name("  DR.  Ahmed   khan ") == "ahmed khan"
+    assert normalize_doctor_name("Dr Ahmed Khan") == normalize_doctor_name("ahmed khan")
+    assert normalize_doctor_name("Drake Smith") == "drake smith"
+
+def test_doctor_statistics_groups_name_variants(client):
+    add_patients(
+        ("2024-02-01", "dr ahmed  KHAN", "CBC", 500),
+        ("2024-02-02", "Ahmed Khan", "CBC", 250),
+        ("2024-02-03", "Dr. Unknown Person", "CBC", 900),
+    )
+    data = client.get("/admin/api/doctor-statistics").get_json()
+    assert data["success"] is True
+    ahmed = data["top_doctors"][0]
+    assert ahmed["doctor_name"] == "Dr. Ahmed Khan"
+    # Seed patient (1000) plus the two variants
+    assert ahmed["patient_count"] == 3
+    assert ahmed["total_revenue"] == 1750.0
+    assert data["summary"]["total_patients_referred"] == 3
+
+def test_adding_doctor_rebuilds_index(client):
+    add_patients(("2024-02-01", "Dr. New Doctor", "CBC", 400))
+    client.get("/admin/api/doctor-statistics")
+    assert client.post("/admin/doctors/add", json={"name": "Dr. New Doctor"}).get_json()["success"]
+    names = [d["doctor_name"] for d in client.get("/admin/api/doctor-statistics").get_json()["top_doctors"]]
+    assert "Dr. New Doctor" in names
+
+def test_time_buckets_roll_up_days():
+    from datetime import date
+    from models.time_buckets import empty_buckets, fill_buckets
+    start, end = date(2024, 2, 1), date(2024, 3, 1)
+    weeks = empty_buckets(start, end, "week")
+    assert [b["start"].day for b in weeks] == [1, 8, 15, 22, 29]
+    rows = [(date(2024, 2, 7), "Male", 2, 500, 3), (date(2024, 2, 8), "Female", 1, 100, 1),
+            (date(2024, 2, 29), "Male", 1, 50, 2)]
+    weeks = fill_buckets(weeks, rows, "week", start)
+    assert [b["patients"] for b in weeks] == [2, 1, 0, 0, 1]
+    assert weeks[0]["gender_stats"] == {"Male": 2} and weeks[2]["revenue"] == 0
+    months = empty_buckets(date(2024, 1, 15), date(2024, 4, 1), "month")
+    assert [(b["start"], b["end"]) for b in months][0] == (date(2024, 1, 15), date(2024, 2, 1))
+    assert len(months) == 3
+
+def test_period_endpoints_use_one_grouped_query(client, sql_panels):
+    from datetime import date, timedelta
+    from db import query_stats
+    today = date.today()
+    add_patients(
+        (today, "Dr. Ahmed Khan", "A, B, C", 600, "Female"),
+        (today, "Dr. Ahmed Khan", "A", 400),
+        (today - timedelta(days=1), "Dr. Ahmed Khan", "A, B", 200),
+    )
+    query_stats.reset()
+    daily = client.get("/admin/api/daily-stats").get_json()
+    assert (daily["patients"], daily["revenue"], daily["tests"]) == (2, 1000.0, 4)
+    assert daily["gender_stats"] == {"Female": 1, "Male": 1}
+    assert sum(q["count"] for q in query_stats.snapshot()["queries"]) == 1
+
+    weekly = client.get("/admin/api/weekly-stats").get_json()
+    assert len(weekly["daily_data"]) == 7
+    assert (weekly["total_patients"], weekly["total_tests"]) == (3, 6)
+    assert weekly["daily_data"][str(today)] == {"patients": 2, "revenue": 1000.0, "tests": 4}
+
+    monthly = client.get("/admin/api/monthly-stats").get_json()
+    assert monthly["weeks"] == ["Week 1", "Week 2", "Week 3", "Week 4", "Week 5"]
+    week = monthly["weeks_data"][f"Week {(today.day - 1) // 7 + 1}"]
+    assert week["patients"] >= 2
+
+    yearly = client.get("/admin/api/yearly-overview").get_json()
+    assert len(yearly["monthly_data"]) == 12
+    assert yearly["monthly_data"][str(today.month)]["patients"] >= 2
+
+def explain(sql, params):
+    """EXPLAIN QUERY PLAN detail lines for a statement on the SQLite stand-in"""
+    from db.sqlite_backend import translate_tsql
+    with db.get_connection() as conn:
+        raw = conn._raw.raw
+        return [row[3] for row in raw.execute("EXPLAIN QUERY PLAN " + translate_tsql(sql), params)]
+
+def assert_seeks_regdate_index(sql, params):
+    plan = explain(sql, params)
+    assert any("IX_Patients_RegDate" in line for line in plan), (sql, plan)
+    assert not any(line.startswith("SCAN Patients") for line in plan), (sql, plan)
+
+def test_regdate_filters_use_index_seek(app, client, sql_panels):
+    import re
+    from db import query_stats
+    from routes.admin import get_dashboard_stats
+
+    captured = []
+    def capture(sql, params, elapsed_ms):
+        if re.search(r"WHERE[\s\S]*RegDate", sql):
+            captured.append((sql, tuple(params[0]) if len(params) == 1 else tuple(params)))
+
+    query_stats.add_listener(capture)
+    try:
+        for url in ("/admin/api/daily-stats", "/admin/api/weekly-stats",
+                    "/admin/api/monthly-stats", "/admin/api/yearly-overview"):
+            assert client.get(url).get_json()["success"] is True
+        with app.test_request_context("/admin"):
+            get_dashboard_stats()
+    finally:
+        query_stats.remove_listener(capture)
+
+    # Patient.get_patient_statistics() reads DailyPatientStats, not Patients
+    assert len(captured) >= 9
+    for sql, params in captured:
+        assert_seeks_regdate_index(sql, params)
+
+def test_wrapped_regdate_filter_is_caught_as_scan(app):
+    with pytest.raises(AssertionError):
+        assert_seeks_regdate_index("SELECT COUNT(*) FROM Patients WHERE CONVERT(date, RegDate) = ?", ("2024-01-20",))
+
+def test_snapshot_cache_serves_stale_and_survives_failures(app):
+    import time
+    from models.dashboard_cache import DashboardCache
+    cache = DashboardCache(wait_timeout=0.5, retry_interval=0)
+    calls = []
+    def compute(cursor):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError("database down")
+        return {"n": len(calls)}
+    cache.register("panel", compute, ttl=0.05)
+
+    assert cache.get("panel")[:2] == ({"n": 1}, "MISS")
+    assert cache.get("panel")[:2] == ({"n": 1}, "HIT")
+    time.sleep(0.06)
+    assert cache.get("panel")[:2] == ({"n": 1}, "STALE")  # refresh runs in the background
+    time.sleep(0.1)
+    assert cache.get("panel")[0] == {"n": 2}
+    cache.invalidate("panel")
+    assert cache.get("panel")[:2] == ({"n": 2}, "STALE")  # refresh failed - last good snapshot
+
+def test_patient_writes_invalidate_only_affected_panels(client):
+    from models.patient_model import Patient
+    for url in ("/admin/api/daily-stats", "/admin/api/test-statistics"):
+        client.get(url)
+    assert client.get("/admin/api/daily-stats").headers["X-Cache"] == "HIT"
+
+    result = Patient.add_patient({
+        "reg_date": "2020-01-01", "reporting_date": "2020-01-02", "name": "Old Visit",
+        "gender": "Male", "age": "40", "doctor": "Dr. Ahmed Khan",
+        "tests": "Blood Sugar After Dinner", "amount": "250",
+    })
+    assert result["success"]
+    assert client.get("/admin/api/daily-stats").headers["X-Cache"] == "HIT"
+    response = client.get("/admin/api/test-statistics")
+    assert response.headers["X-Cache"] == "MISS"
+    by_name = {t["test_name"]: t for t in response.get_json()["top_tests"]}
+    assert by_name["Blood Sugar After Dinner"]["patient_count"] == 1
+
+def test_overview_returns_every_panel(client):
+    data = client.get("/admin/api/overview").get_json()
+    assert data["success"] and not data["partial"]
+    assert set(data["panels"]) == set(dashboard_cache.panels)
+    assert all(panel["success"] for panel in data["panels"].values())
+    assert data["panels"]["daily-stats"] == client.get("/admin/api/daily-stats").get_json()
+
+def test_overview_is_partial_when_a_panel_is_slow(app):
+    import threading
+    import time
+    from models.dashboard_cache import DashboardCache
+    cache = DashboardCache(max_workers=3)
+    release = threading.Event()
+    cache.register("fast", lambda cursor: {"success": True}, ttl=60)
+    cache.register("slow", lambda cursor: release.wait(5) and {"success": True}, ttl=60)
+    cache.register("broken", lambda cursor: 1 / 0, ttl=60)
+
+    started = time.monotonic()
+    results = cache.get_many(cache.panels, timeout=0.2)
+    assert time.monotonic() - started < 1
+    release.set()
+    assert results["fast"][:2] == ({"success": True}, "MISS")
+    assert isinstance(results["slow"], TimeoutError)
+    assert isinstance(results["broken"], ZeroDivisionError)
+
+def test_analytics_cube_answers_like_sql(app, monkeypatch):
+    from datetime import date, timedelta
+    import routes.admin as admin
+    today = date.today()
+    add_patients(
+        (today, "Dr. Ahmed Khan", "Blood Sugar After Dinner, X-Ray", 600, "Female"),
+        (today, "dr ahmed khan", "Blood Sugar After Dinner", 400),
+        (today - timedelta(days=3), "Dr. Sara Ali", "X-Ray, , X-Ray", 250, "Other"),
+        (today.replace(month=1, day=1), "", "", 0),
+    )
+    # The seed receipt lists tests that aren't in its Tests text - re-derive it like the backfill does
+    from models.receipt_backfill import backfill_receipts
+    from models.receipt_model import delete_receipts
+    with db.unit_of_work() as conn:
+        delete_receipts(conn.cursor(), 1001)
+    backfill_receipts()
+
+    panels = (admin._daily_stats, admin._weekly_stats, admin._monthly_stats, admin._yearly_overview,
+              admin._test_statistics, admin._doctor_statistics)
+    with db.unit_of_work() as conn:
+        cursor = conn.cursor()
+        from_cube = [panel(cursor) for panel in panels]
+        monkeypatch.setattr(admin, "ANALYTICS_CUBE", False)
+        from_sql = [panel(cursor) for panel in panels]
+    assert from_cube == from_sql
+
+def test_analytics_cube_follows_patient_writes(app):
+    from datetime import date
+    from db import query_stats
+    from models.analytics_cube import get_cube
+    from models.patient_model import Patient
+    with db.unit_of_work() as conn:
+        cube = get_cube(conn.cursor())
+    assert cube.summary() == (1, 1001, 1000.0)
+
+    patient = {
+        "reg_date": "2024-03-05", "reporting_date": "2024-03-06", "name": "New Visit",
+        "gender": "Female", "age": "33", "doctor": "Dr. Sara Ali",
+        "tests": "Blood Sugar After Dinner", "amount": "300",
+    }
+    mr_no = Patient.add_patient(patient)["mr_no"]
+    assert Patient.update_patient(mr_no, dict(patient, amount="450"))["success"]
+    removed = Patient.add_patient(dict(patient, reg_date="2024-03-07"))["mr_no"]
+    assert Patient.delete_patient(removed)["success"]
+
+    query_stats.reset()
+    assert cube.summary() == (2, mr_no, 1450.0)
+    march = cube.bucket_stats(date(2024, 3, 1), date(2024, 4, 1), "month")[0]
+    assert (march["patients"], march["revenue"], march["gender_stats"]) == (1, 450.0, {"Female": 1})
+    assert cube.test_totals(["Blood Sugar After Dinner"]) == ([1], [450.0])
+    assert query_stats.snapshot()["queries"] == []
+
+def test_analytics_cube_rebuilds_when_it_drifts(app, monkeypatch):
+    import models.analytics_cube as analytics_cube
+    with db.unit_of_work() as conn:
+        cube = analytics_cube.get_cube(conn.cursor())
+    add_patients(("2024-02-01", "Dr. Sara Ali", "X-Ray", 125))  # bypasses the change hooks
+
+    monkeypatch.setattr(analytics_cube, "DRIFT_CHECK_SECONDS", 0)
+    with db.unit_of_work() as conn:
+        rebuilt = analytics_cube.get_cube(conn.cursor())
+    assert rebuilt is not cube
+    assert rebuilt.summary()[0] == 2 and rebuilt.summary()[2] == 1125.0
+    with db.unit_of_work() as conn:
+        assert analytics_cube.get_cube(conn.cursor()) is rebuilt
+
+def test_lttb_keeps_ends_and_peaks():
+    import numpy as np
+    from models.downsample import lttb
+    y = np.zeros(1000)
+    y[437] = 50
+    keep = lttb(np.arange(1000), y, 20)
+    assert len(keep) == 20 and keep[0] == 0 and keep[-1] == 999
+    assert 437 in keep and list(keep) == sorted(keep)
+    assert list(lttb(range(5), range(5), 10)) == [0, 1, 2, 3, 4]
+
+@pytest.mark.parametrize("cube", [True, False])
+def test_range_stats_downsamples_long_ranges(client, monkeypatch, cube):
+    import routes.admin
+    monkeypatch.setattr(routes.admin, "ANALYTICS_CUBE", cube)
+    add_patients(
+        ("2021-03-01", "dr ahmed khan", "X-Ray", 500, "Female"),
+        ("2022-07-15", "Dr. Ahmed Khan", "X-Ray, CBC", 9000),
+        ("2023-12-31", "Walk In", "CBC", 100),
+    )
+    data = client.get("/admin/api/range-stats?start=2021-01-01&end=2023-12-31&points=50").get_json()
+    assert data["success"] and data["downsampled"]
+    assert data["bucket_count"] == 1095 and len(data["series"]) == 50
+    assert data["series"][0]["start"] == "2021-01-01" and data["series"][-1]["end"] == "2023-12-31"
+    assert any(point["revenue"] == 9000.0 for point in data["series"])
+    assert (data["total_patients"], data["total_revenue"], data["total_tests"]) == (3, 9600.0, 4)
+    assert data["gender_stats"] == {"Female": 1, "Male": 2}
+    assert data["doctor_stats"][0] == {"doctor_name": "Dr. Ahmed Khan", "patient_count": 2, "total_revenue": 9500.0}
+
+    monthly = client.get("/admin/api/range-stats?start=2024-01-01&end=2024-03-31&granularity=month").get_json()
+    assert [p["start"] for p in monthly["series"]] == ["2024-01-01", "2024-02-01", "2024-03-01"]
+    assert monthly["total_patients"] == 1 and not monthly["downsampled"]
+
+def test_range_stats_rejects_bad_ranges(client):
+    assert client.get("/admin/api/range-stats?start=2024-02-01").status_code == 400
+    assert client.get("/admin/api/range-stats?start=2024-02-01&end=2024-01-01").status_code == 400
+    assert client.get("/admin/api/range-stats?start=2024-01-01&end=2024-02-01&granularity=hour").status_code == 400
+
+def test_test_popularity_is_an_indexed_join(app, client, sql_panels):
+    add_patients(("2024-02-01", "Dr. Ahmed Khan", "Blood Sugar After Dinner, ESR", 750))
+    data = client.get("/admin/api/test-statistics").get_json()
+    by_name = {t["test_name"]: t for t in data["top_tests"]}
+    assert by_name["ESR"]["patient_count"] == 1 and by_name["ESR"]["total_revenue"] == 750.0
+
+    from db import query_stats
+    from routes.admin import _receipt_test_totals
+    captured = []
+    def capture(sql, params, elapsed_ms):
+        captured.append(sql)
+    query_stats.add_listener(capture)
+    try:
+        with db.unit_of_work() as conn:
+            _receipt_test_totals(conn.cursor(), [1])
+    finally:
+        query_stats.remove_listener(capture)
+    plan = explain(captured[0], ())
+    assert any("IX_Receipt_Tests_TestId" in line for line in plan), plan
+    assert not any(line.startswith("SCAN Patients") for line in plan), plan
+
+def test_admin_listings_map_rows_by_column(client):
+    staff = client.get("/admin/staff").get_json()
+    assert [s["Username"] for s in staff] == ["reception", "technician"]
+    assert set(staff[0]) == {"UserId", "Username", "FullName", "Role"}
+
+    doctors = client.get("/admin/doctors").get_json()
+    assert all(isinstance(d["ConsultationFee"], float) for d in doctors)
+
+    tests = client.get("/admin/tests").get_json()
+    esr = next(t for t in tests if t["TestName"] == "ESR")
+    assert esr["Price"] == 500.0 and "NormalRange" in esr and "Range_Text" not in esr
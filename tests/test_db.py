@@ -0,0 +1,361 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import gc
+import sqlite3
+import pytest
+from db.pool import ConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        min_size=1, max_size=2, checkout_timeout=0.2, ping_interval=0, reap_interval=0
+    )
+    yield pool
+    pool.dispose()
+
+def test_close_returns_connection_to_pool(pool):
+    conn = pool.acquire()
+    raw = conn._raw
+    conn.close()
+    again = pool.acquire()
+    assert again._raw is raw
+    assert pool.stats()["created"] == 1
+    again.close()
+
+def test_checkout_timeout_when_exhausted(pool):
+    first, second = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    first.close()
+    second.close()
+
+def test_context_manager_commits_and_releases(pool):
+    with pool.acquire() as conn:
+        conn.cursor().execute("CREATE TABLE t (x INTEGER)")
+        conn.cursor().execute("INSERT INTO t VALUES (1)")
+    assert pool.stats()["in_use"] == 0
+    with pool.acquire() as conn:
+        assert conn.cursor().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+
+def test_dead_connection_is_replaced_on_checkout(pool):
+    conn = pool.acquire()
+    raw = conn._raw
+    conn.close()
+    raw.close()  # simulate the server dropping the connection
+    conn = pool.acquire()
+    assert conn._raw is not raw
+    assert pool.stats()["ping_failures"] == 1
+    conn.close()
+
+def test_leaked_connection_is_reclaimed(pool):
+    conn = pool.acquire()
+    del conn
+    gc.collect()
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["leaks"] == 1
+
+def test_leaked_connection_is_reused_when_pool_exhausted(pool):
+    first, second = pool.acquire(), pool.acquire()
+    del first
+    gc.collect()
+    conn = pool.acquire(timeout=0.1)
+    assert pool.stats()["leaks"] == 1
+    conn.close()
+    second.close()
+
+@pytest.fixture
+def sqlite_db(monkeypatch, tmp_path):
+    import db
+    path = str(tmp_path / "uow.db")
+    monkeypatch.setattr(db, "_connect", lambda: sqlite3.connect(path, check_same_thread=False))
+    db.dispose_pool()
+    with db.get_connection() as conn:
+        conn.cursor().execute("CREATE TABLE t (x INTEGER)")
+    yield db
+    db.dispose_pool()
+
+def test_request_shares_one_connection(sqlite_db):
+    from flask import Flask
+    app = Flask(__name__)
+    sqlite_db.init_app(app)
+
+    @app.route("/work")
+    def work():
+        with sqlite_db.unit_of_work() as first:
+            first.cursor().execute("INSERT INTO t VALUES (1)")
+        with sqlite_db.unit_of_work() as second:
+            count = second.cursor().execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        return {"same": first._conn is second._conn is sqlite_db.get_db()._conn, "count": count}
+
+    created = sqlite_db.get_pool().stats()["created"]
+    assert app.test_client().get("/work").get_json() == {"same": True, "count": 1}
+    stats = sqlite_db.get_pool().stats()
+    assert stats["in_use"] == 0
+    assert stats["created"] == created
+
+def test_unit_of_work_rolls_back_on_error(sqlite_db):
+    committed = []
+    with pytest.raises(ValueError):
+        with sqlite_db.unit_of_work() as conn:
+            conn.cursor().execute("INSERT INTO t VALUES (1)")
+            sqlite_db.on_commit(lambda: committed.append(True))
+            raise ValueError("boom")
+    with sqlite_db.unit_of_work() as conn:
+        assert conn.cursor().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    assert committed == []
+
+def test_translate_tsql_shim():
+    from db.sqlite_backend import translate_tsql
+    assert translate_tsql("SELECT TOP 5 Name FROM Patients ORDER BY MrNo DESC") == \
+        "SELECT Name FROM Patients ORDER BY MrNo DESC LIMIT 5"
+    assert translate_tsql("INSERT INTO t (a) OUTPUT INSERTED.MrNo VALUES (?)") == \
+        "INSERT INTO t (a)  VALUES (?) RETURNING MrNo"
+    assert translate_tsql("SELECT ISNULL(SUM(Amount), 0) FROM Patients") == \
+        "SELECT IFNULL(SUM(Amount), 0) FROM Patients"
+    assert translate_tsql("SELECT 1 WHERE CONVERT(date, RegDate) = CAST(GETDATE() AS DATE)") == \
+        "SELECT 1 WHERE date(RegDate) = date(datetime('now', 'localtime'))"
+    # String literals are left alone
+    assert translate_tsql("SELECT N'BRAIN''S ISNULL(x)'") == "SELECT 'BRAIN''S ISNULL(x)'"
+
+@pytest.fixture
+def seeded(monkeypatch):
+    import db
+    from db.backends import SQLiteBackend
+    from models.receipt_model import invalidate_test_catalog
+    monkeypatch.setattr(db, "_backend", SQLiteBackend(":memory:"))
+    db.dispose_pool()
+    invalidate_test_catalog()
+    yield db
+    db.dispose_pool()
+
+def test_sqlite_backend_loads_schema_and_seed(seeded):
+    with seeded.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Username FROM Users ORDER BY UserId")
+        assert [row.Username for row in cursor.fetchall()] == ["admin", "reception", "technician"]
+        cursor.execute("SELECT COUNT(*) FROM Tests WHERE TestName = ?", ("1.7 Hydroxy Progesterone",))
+        assert cursor.fetchone()[0] == 1
+
+def test_patient_model_runs_on_sqlite(seeded):
+    from datetime import date
+    from models.patient_model import Patient
+    result = Patient.add_patient({
+        "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed", "tests": "CBC", "amount": "500",
+    })
+    assert result["success"] and result["mr_no"] > 1001
+    patient = Patient.get_patient_by_mr_no(result["mr_no"])
+    assert patient["reg_date"] == date(2024, 3, 1)
+    assert Patient.delete_patient(result["mr_no"])["success"]
+
+def receipt_tests(db, mr_no):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT t.TestName, rt.TestPrice, r.NetAmount
+            FROM Receipts r
+            JOIN Receipt_Tests rt ON rt.ReceiptId = r.ReceiptId
+            JOIN Tests t ON t.TestId = rt.TestId
+            WHERE r.PatientMrNo = ?
+            ORDER BY t.TestName
+        """, (mr_no,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+def test_registration_writes_receipt_tests(seeded):
+    from models.patient_model import Patient
+    patient = {
+        "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed",
+        "tests": "Blood Sugar After Dinner, Unknown Test, ESR", "amount": "700",
+    }
+    mr_no = Patient.add_patient(patient)["mr_no"]
+    assert receipt_tests(seeded, mr_no) == [("Blood Sugar After Dinner", 250.0, 700.0), ("ESR", 500.0, 700.0)]
+
+    assert Patient.update_patient(mr_no, dict(patient, tests="ESR", amount="500"))["success"]
+    assert receipt_tests(seeded, mr_no) == [("ESR", 500.0, 500.0)]
+    assert Patient.delete_patient(mr_no)["success"]
+    assert receipt_tests(seeded, mr_no) == []
+
+def test_receipt_rolls_back_with_the_patient(seeded, monkeypatch):
+    import models.patient_model as patient_model
+    def fail(*args):
+        raise RuntimeError("receipt failed")
+    monkeypatch.setattr(patient_model, "create_receipt", fail)
+    result = patient_model.Patient.add_patient({
+        "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed", "tests": "ESR", "amount": "500",
+    })
+    assert not result["success"]
+    with seeded.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Patients")
+        assert cursor.fetchone()[0] == 1
+
+def test_receipt_backfill_is_chunked_and_resumable(seeded):
+    from models.receipt_backfill import backfill_receipts
+    with seeded.get_connection() as conn:
+        cursor = conn.cursor()
+        for tests in ("ESR", "Calcium, ESR", "Nothing Known", "Immunoglobulins (iga,ige,igg,igm)"):
+            cursor.execute(
+                "INSERT INTO Patients (RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount) "
+                "VALUES ('2023-05-01', '2023-05-02', 'Old Patient', 'Female', 40, 'Dr. Sara Ali', ?, 900)",
+                (tests,)
+            )
+
+    # Stopped after the first chunk, then resumed
+    assert backfill_receipts(chunk=2, limit=2) == {"patients": 2, "tests": 3, "unmatched": 0}
+    assert backfill_receipts(chunk=2) == {"patients": 2, "tests": 1, "unmatched": 1}
+    assert backfill_receipts(chunk=2)["patients"] == 0
+    assert receipt_tests(seeded, 1003) == [("Calcium", 1000.0, 900.0), ("ESR", 500.0, 900.0)]
+    assert receipt_tests(seeded, 1005) == [("Immunoglobulins (iga,ige,igg,igm)", 9000.0, 900.0)]
+
+def daily_stats(db, day):
+    from models.daily_stats import get_totals
+    from db.predicates import DateRange
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        return get_totals(cursor, DateRange.day(day))
+
+def test_daily_stats_follow_patient_writes(seeded):
+    from models.patient_model import Patient
+    patient = {
+        "reg_date": "2024-01-20", "reporting_date": "2024-01-21", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed", "tests": "ESR, Calcium", "amount": "1500",
+    }
+    seed = {"Patients": 1, "Revenue": 1000.0, "MalePatients": 0, "FemalePatients": 1, "OtherPatients": 0, "Tests": 2}
+    assert daily_stats(seeded, "2024-01-20") == seed
+
+    mr_no = Patient.add_patient(patient)["mr_no"]
+    assert daily_stats(seeded, "2024-01-20") == dict(
+        seed, Patients=2, Revenue=2500.0, MalePatients=1, Tests=4)
+
+    assert Patient.update_patient(mr_no, dict(patient, gender="Other", tests="ESR", amount="500"))["success"]
+    assert daily_stats(seeded, "2024-01-20") == dict(
+        seed, Patients=2, Revenue=1500.0, OtherPatients=1, Tests=3)
+
+    assert Patient.delete_patient(mr_no)["success"]
+    assert daily_stats(seeded, "2024-01-20") == seed
+    assert Patient.get_patient_statistics() == {
+        "total_patients": 1, "total_revenue": 1000.0,
+        "gender_distribution": {"Female": 1}, "today_patients": 0,
+    }
+
+def test_daily_stats_reconcile_rewrites_drifted_days(seeded):
+    from datetime import date
+    from models.daily_stats import reconcile
+    with seeded.get_connection() as conn:
+        cursor = conn.cursor()
+        # A write that bypassed the rollup, and a corrupted counter
+        cursor.execute(
+            "INSERT INTO Patients (RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount) "
+            "VALUES ('2023-05-01', '2023-05-02', 'Old Patient', 'Female', 40, 'Dr. Sara Ali', 'ESR', 900)"
+        )
+        cursor.execute("UPDATE DailyPatientStats SET Revenue = 1 WHERE StatDate = '2024-01-20'")
+
+    with seeded.get_connection() as conn:
+        mismatches = reconcile(conn.cursor())
+    assert mismatches == {
+        date(2023, 5, 1): ((0, 0.0, 0, 0, 0, 0), (1, 900.0, 0, 1, 0, 1)),
+        date(2024, 1, 20): ((1, 1.0, 0, 1, 0, 2), (1, 1000.0, 0, 1, 0, 2)),
+    }
+
+    with seeded.get_connection() as conn:
+        assert len(reconcile(conn.cursor(), fix=True)) == 2
+    with seeded.get_connection() as conn:
+        assert reconcile(conn.cursor()) == {}
+    assert daily_stats(seeded, "2023-05-01")["Revenue"] == 900.0
+
+def test_request_rolls_back_everything_on_error(sqlite_db):
+    from flask import Flask
+    app = Flask(__name__)
+    sqlite_db.init_app(app)
+
+    @app.route("/fail")
+    def fail():
+        sqlite_db.get_db().cursor().execute("INSERT INTO t VALUES (1)")
+        with sqlite_db.unit_of_work() as conn:  # a read-only model call must not commit
+            conn.cursor().execute("SELECT COUNT(*) FROM t").fetchone()
+        raise ValueError("boom")
+
+    assert app.test_client().get("/fail").status_code == 500
+    with sqlite_db.unit_of_work() as conn:
+        assert conn.cursor().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+def test_failed_commit_reaches_the_client(sqlite_db):
+    from flask import Flask
+    app = Flask(__name__)
+    sqlite_db.init_app(app)
+    with sqlite_db.unit_of_work() as conn:
+        conn.cursor().execute("CREATE TABLE parent (id INTEGER PRIMARY KEY)")
+        conn.cursor().execute(
+            "CREATE TABLE child (pid INTEGER REFERENCES parent(id) DEFERRABLE INITIALLY DEFERRED)"
+        )
+
+    @app.route("/orphan", methods=["POST"])
+    def orphan():
+        conn = sqlite_db.get_db()
+        conn.cursor().execute("PRAGMA foreign_keys = ON")
+        with sqlite_db.unit_of_work() as conn:
+            conn.cursor().execute("INSERT INTO child VALUES (42)")  # only fails at COMMIT
+        return {"success": True}
+
+    assert app.test_client().post("/orphan").status_code == 500
+    with sqlite_db.unit_of_work() as conn:
+        assert conn.cursor().execute("SELECT COUNT(*) FROM child").fetchone()[0] == 0
+
+def test_fingerprint_normalizes_literals():
+    from db.instrumentation import fingerprint
+    assert fingerprint("SELECT *  FROM Patients\n WHERE Name = 'Ali' AND Age > 30") == \
+        "SELECT * FROM Patients WHERE Name = ? AND Age > ?"
+    assert fingerprint("SELECT 1 FROM t WHERE id IN (?, ?, ?)") == "SELECT ? FROM t WHERE id IN (?)"
+
+def test_latency_histogram_percentiles():
+    from db.instrumentation import LatencyHistogram
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.add(float(ms))
+    stats = histogram.to_dict()
+    assert stats["count"] == 100 and stats["max_ms"] == 100.0
+    assert 40 <= stats["p50_ms"] <= 65
+    assert 90 <= stats["p95_ms"] <= 100
+    assert stats["p99_ms"] <= 100
+
+def test_instrumented_cursor_records_statements_and_slow_route():
+    from flask import Flask
+    from db.instrumentation import InstrumentedCursor, QueryStats
+    stats = QueryStats(slow_query_ms=0)
+    raw = sqlite3.connect(":memory:")
+    app = Flask(__name__)
+    with app.test_request_context("/admin/api/daily-stats"):
+        cursor = InstrumentedCursor(raw.cursor(), stats)
+        for value in (1, 2):
+            assert cursor.execute("SELECT ?", (value,)).fetchone() == (value,)
+    snapshot = stats.snapshot()
+    assert snapshot["queries"][0]["fingerprint"] == "SELECT ?"
+    assert snapshot["queries"][0]["count"] == 2
+    assert snapshot["slow_queries"][0]["route"] == "GET /admin/api/daily-stats"
+
+def test_row_mapper_is_compiled_once_per_shape(seeded):
+    from decimal import Decimal
+    from db.rows import fetch_all, fetch_one, row_mapper
+    from models.patient_model import PATIENT_COLUMNS, Patient, _to_snake
+    with seeded.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM Patients")
+        mapper = row_mapper(cursor, rename=_to_snake)
+        assert fetch_one(cursor, rename=_to_snake)["reg_date"].isoformat() == "2024-01-20"
+        cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM Patients WHERE MrNo = ?", (1001,))
+        assert row_mapper(cursor, rename=_to_snake) is mapper
+
+        cursor.execute("SELECT TestId, Price FROM Tests WHERE TestName = 'ESR'")
+        assert fetch_all(cursor, convert={"Price": Decimal}) == [{"TestId": 200, "Price": Decimal(500)}]
+
+        cursor.execute(f"SELECT {PATIENT_COLUMNS} FROM Patients")
+        patient = fetch_one(cursor, record=Patient)
+    assert (patient.mr_no, patient.gender) == (1001, "Female")
+    assert patient.as_tuple()[0] == 1001 and patient.to_dict()["amount"] == 1000
+    assert not hasattr(patient, "__dict__")
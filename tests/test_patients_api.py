@@ -0,0 +1,457 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from flask import Flask
+import db
+from db.backends import SQLiteBackend
+from models.patient_cache import patient_cache
+from models.pdf_cache import pdf_cache
+from models.pdf_pool import pdf_render_pool
+from models.receipt_model import invalidate_test_catalog
+from routes.patients import patients_bp
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    # Fresh copy of the seeded SQLite stand-in for every test
+    monkeypatch.setattr(db, "_backend", SQLiteBackend(":memory:"))
+    db.dispose_pool()
+    invalidate_test_catalog()
+    patient_cache.clear()
+    monkeypatch.setattr(pdf_cache, "directory", str(tmp_path / "pdf_cache"))
+    monkeypatch.setattr(pdf_cache, "_sizes", None)
+    monkeypatch.setattr(pdf_render_pool, "workers", 0)     # render inline; the pool has its own test
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    db.init_app(app)
+    app.register_blueprint(patients_bp, url_prefix="/patients")
+    yield app
+    db.dispose_pool()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def add_patients(count, reg_date="2024-03-01", doctor="Dr. Sara Ali", gender="Male"):
+    """Insert `count` plain patients (kept in the daily rollup); returns their MrNo values in insert order"""
+    from models.daily_stats import record_added
+    mr_nos = []
+    with db.unit_of_work() as conn:
+        cursor = conn.cursor()
+        for i in range(count):
+            cursor.execute(
+                "INSERT INTO Patients (RegDate, ReportingDate, Name, Gender, Age, Doctor, Tests, Amount) "
+                "OUTPUT INSERTED.MrNo VALUES (?, ?, 'Test Patient', ?, 30, ?, 'ESR', 500)",
+                (reg_date, reg_date, gender, doctor)
+            )
+            mr_nos.append(cursor.fetchone()[0])
+            record_added(cursor, reg_date, gender, 500, "ESR")
+    return mr_nos
+
+def test_keyset_pages_cover_every_patient_once(client):
+    mr_nos = add_patients(7) + [1001]
+    seen, cursor, pages = [], None, 0
+    while True:
+        url = "/patients/api/patients?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url).get_json()["data"]
+        seen += [p["mr_no"] for p in data["patients"]]
+        pages += 1
+        if not data["has_more"]:
+            assert data["next_cursor"] is None
+            break
+        cursor = data["next_cursor"]
+    assert seen == sorted(mr_nos, reverse=True)
+    assert pages == 3
+
+def test_keyset_page_filters_and_cap(client):
+    add_patients(2, reg_date="2024-04-10", doctor="Dr. Imran", gender="Female")
+    add_patients(3, reg_date="2024-04-11")
+
+    data = client.get("/patients/api/patients?doctor=Dr.%20Imran").get_json()["data"]
+    assert [p["doctor"] for p in data["patients"]] == ["Dr. Imran"] * 2
+    data = client.get("/patients/api/patients?gender=Female&start=2024-04-01&end=2024-04-10").get_json()["data"]
+    assert len(data["patients"]) == 2
+    data = client.get("/patients/api/patients?start=2024-04-11&end=2024-04-11").get_json()["data"]
+    assert len(data["patients"]) == 3
+
+    response = client.get("/patients/api/patients?limit=100000").get_json()
+    assert response["metadata"]["limit"] == 200
+
+    assert client.get("/patients/api/patients?start=2024-04-11").status_code == 400
+    assert client.get("/patients/api/patients?gender=Robot").status_code == 400
+    assert client.get("/patients/api/patients?limit=0").status_code == 400
+
+def test_keyset_page_seeks_the_primary_key(app):
+    from db.sqlite_backend import translate_tsql
+    with db.get_connection() as conn:
+        raw = conn._raw.raw
+        plan = [row[3] for row in raw.execute("EXPLAIN QUERY PLAN " + translate_tsql(
+            "SELECT TOP 51 MrNo, Name FROM Patients WHERE MrNo < ? ORDER BY MrNo DESC"), (1000,))]
+    assert any("SEARCH Patients USING INTEGER PRIMARY KEY" in line for line in plan), plan
+    assert not any("TEMP B-TREE" in line for line in plan), plan
+
+def table_page(client, **params):
+    query = {"draw": 3, "start": 0, "length": 10, "order[0][column]": 0, "order[0][dir]": "desc",
+             "columns[0][data]": "mr_no", "columns[1][data]": "name", "columns[6][data]": "amount"}
+    query.update(params)
+    response = client.get("/patients/api/patients/table", query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_datatable_pages_in_sql(client):
+    mr_nos = add_patients(12) + add_patients(3, doctor="Dr. Imran", gender="Female")
+
+    page = table_page(client, start=10, length=5)
+    assert page["draw"] == 3
+    assert page["recordsTotal"] == page["recordsFiltered"] == 16
+    assert [p["mr_no"] for p in page["data"]] == sorted(mr_nos + [1001], reverse=True)[10:15]
+    assert page["data"][0]["reg_date"] == "2024-03-01"
+
+    page = table_page(client, doctor="Dr. Imran", **{"order[0][dir]": "asc"})
+    assert (page["recordsTotal"], page["recordsFiltered"]) == (16, 3)
+    assert [p["mr_no"] for p in page["data"]] == mr_nos[-3:]
+
+    page = table_page(client, gender="Female", **{"search[value]": "dr. im"})
+    assert page["recordsFiltered"] == 3
+    page = table_page(client, **{"search[value]": str(mr_nos[0])})
+    assert [p["mr_no"] for p in page["data"]] == [mr_nos[0]]
+    # LIKE wildcards in the search box are literal
+    assert table_page(client, **{"search[value]": "%"})["recordsFiltered"] == 0
+
+    # Sorting by an unknown column falls back to MrNo
+    page = table_page(client, **{"order[0][column]": 6, "columns[6][data]": "Amount; DROP TABLE Patients"})
+    assert page["data"][0]["mr_no"] == max(mr_nos)
+
+def test_saved_page_renders_without_patient_rows(client):
+    add_patients(3, doctor="Dr. Imran")
+    html = client.get("/patients/saved").get_data(as_text=True)
+    assert 'id="savedTable"' in html
+    assert "/patients/api/patients/table" in html
+    assert '<option value="Dr. Imran">' in html
+    assert "Test Patient" not in html
+
+def test_stream_json_matches_the_listing(client):
+    import json
+    mr_nos = add_patients(5, doctor="Dr. Imran") + add_patients(2)
+    response = client.get("/patients/api/patients/stream?doctor=Dr.%20Imran")
+    assert response.is_streamed
+    rows = json.loads(response.get_data(as_text=True))
+    assert [p["mr_no"] for p in rows] == sorted(mr_nos[:5], reverse=True)
+    assert rows[0]["reg_date"] == "2024-03-01" and rows[0]["amount"] == 500
+
+    assert json.loads(client.get("/patients/api/patients/stream?gender=Other").get_data(as_text=True)) == []
+    assert client.get("/patients/api/patients/stream?format=xml").status_code == 400
+
+def test_stream_csv(client):
+    import csv
+    add_patients(7)
+    response = client.get("/patients/api/patients/stream?format=csv&start=2024-03-01&end=2024-03-01")
+    rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+    assert rows[0] == ["mr_no", "reg_date", "reporting_date", "name", "gender", "age", "doctor", "tests", "amount"]
+    assert len(rows) == 8 and rows[1][1] == "2024-03-01"
+    assert response.headers["Content-Disposition"] == "attachment; filename=patients.csv"
+
+def test_stream_query_returns_its_connection(app):
+    from db import get_pool, stream_query
+    add_patients(7)
+    batches = stream_query("SELECT MrNo FROM Patients ORDER BY MrNo", (), 3)
+    assert get_pool().stats()["in_use"] == 0     # nothing checked out before the first batch
+    assert len(next(batches)) == 3
+    assert get_pool().stats()["in_use"] == 1
+    batches.close()                              # client went away mid-stream
+    assert get_pool().stats()["in_use"] == 0
+
+    batches = stream_query("SELECT MrNo FROM Patients ORDER BY MrNo", (), 3)
+    assert [len(batch) for batch in batches] == [3, 3, 2]
+
+def test_export_csv_and_xlsx(client):
+    import csv
+    from io import BytesIO
+    from openpyxl import load_workbook
+    add_patients(3, reg_date="2024-04-10")
+    add_patients(2, reg_date="2024-05-01")
+
+    response = client.get("/patients/export?format=csv&start=2024-04-01&end=2024-04-30")
+    assert response.headers["Content-Disposition"] == "attachment; filename=patients_2024-04-01_2024-04-30.csv"
+    rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+    assert rows[0][:2] == ["MR No", "Reg Date"]
+    assert [row[1] for row in rows[1:]] == ["2024-04-10"] * 3
+
+    response = client.get("/patients/export?format=xlsx")
+    assert response.mimetype == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    sheet = load_workbook(BytesIO(response.get_data())).active
+    values = list(sheet.values)
+    assert values[0][0] == "MR No"
+    assert len(values) == 1 + 6
+    assert values[-1][0] == 1001 and values[-1][8] == 1000
+
+    assert client.get("/patients/export?format=pdf").status_code == 400
+
+def test_patient_cache_is_bounded_and_expires():
+    import time
+    from models.patient_cache import PatientCache
+    loads = []
+    def loader(mr_no):
+        loads.append(mr_no)
+        return {"mr_no": mr_no} if mr_no < 100 else None
+    cache = PatientCache(loader, max_size=2, ttl=0.05)
+
+    assert cache.get(1) == {"mr_no": 1}
+    cache.get(2)
+    cache.get(1)                      # 1 is now the most recently used
+    cache.get(3)                      # evicts 2
+    assert len(cache) == 2
+    cache.get(1)
+    cache.get(2)
+    assert loads == [1, 2, 3, 2]
+    assert cache.get(500) is None and cache.get(500) is None
+    assert loads[-2:] == [500, 500]   # misses are not cached
+
+    time.sleep(0.06)
+    cache.get(1)
+    assert loads[-1] == 1
+
+def test_patient_cache_drops_lookups_that_raced_a_write():
+    from models.patient_cache import PatientCache
+    cache = PatientCache(lambda mr_no: (cache.invalidate(mr_no), {"mr_no": mr_no, "name": "old"})[1])
+    assert cache.get(7)["name"] == "old"
+    assert len(cache) == 0
+
+def test_pdf_reprints_hit_the_patient_cache(client):
+    from models.patient_model import Patient
+    patient = {
+        "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed", "tests": "ESR", "amount": "500",
+    }
+    mr_no = Patient.add_patient(patient)["mr_no"]
+    misses, hits = patient_cache.misses, patient_cache.hits
+    for url in ("receipt", "lab-report", "receipt"):
+        response = client.get(f"/patients/{mr_no}/{url}")
+        assert response.status_code == 200 and response.mimetype == "application/pdf"
+    assert (patient_cache.misses - misses, patient_cache.hits - hits) == (1, 2)
+
+    assert Patient.update_patient(mr_no, dict(patient, name="Ali Raza"))["success"]
+    assert len(patient_cache) == 0
+    client.get(f"/patients/{mr_no}/receipt")
+    assert patient_cache.misses - misses == 2
+
+    assert Patient.delete_patient(mr_no)["success"]
+    assert client.get(f"/patients/{mr_no}/receipt").status_code == 404
+
+def test_pdfs_are_cached_on_disk_with_etags(client, monkeypatch):
+    from models.patient_model import Patient
+    from routes.patients import PDFGenerator
+    patient = {
+        "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed", "tests": "ESR", "amount": "500",
+    }
+    mr_no = Patient.add_patient(patient)["mr_no"]
+    builds = []
+    generate_pdf = PDFGenerator.generate_pdf
+    monkeypatch.setattr(PDFGenerator, "generate_pdf", lambda self, *a: builds.append(a[1]) or generate_pdf(self, *a))
+
+    first = client.get(f"/patients/{mr_no}/receipt")
+    second = client.get(f"/patients/{mr_no}/receipt")
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data and first.headers["ETag"] == second.headers["ETag"]
+    assert builds == ["receipt"]
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    etag = first.headers["ETag"]
+    response = client.get(f"/patients/{mr_no}/receipt", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    client.get(f"/patients/{mr_no}/lab-report")
+    assert builds == ["receipt", "lab_report"]
+    assert len(os.listdir(pdf_cache.directory)) == 2
+
+    # An edit changes the content hash and removes the patient's cached files
+    assert Patient.update_patient(mr_no, dict(patient, name="Ali Raza"))["success"]
+    assert os.listdir(pdf_cache.directory) == []
+    response = client.get(f"/patients/{mr_no}/receipt", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert builds[-1] == "receipt" and len(builds) == 3
+
+    assert Patient.delete_patient(mr_no)["success"]
+    assert os.listdir(pdf_cache.directory) == []
+
+def test_pdf_cache_evicts_least_recently_used(tmp_path):
+    import time
+    from models.pdf_cache import PDFCache, PDFKey
+    cache = PDFCache(str(tmp_path), max_bytes=250)
+    keys = [PDFKey(mr_no, "receipt", f"{mr_no:032x}") for mr_no in (1, 2, 3)]
+    cache.put(keys[0], b"a" * 100)
+    time.sleep(0.01)
+    cache.put(keys[1], b"b" * 100)
+    time.sleep(0.01)
+    assert cache.get(keys[0]) is not None       # 1 is now the most recently used
+    cache.put(keys[2], b"c" * 100)              # over 250 bytes: evicts 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.size() == 200
+
+    # A new process picks the existing files up
+    assert PDFCache(str(tmp_path), max_bytes=250).get(keys[2]) is not None
+    cache.invalidate(3)
+    assert sorted(os.listdir(tmp_path)) == [keys[0].filename]
+
+def test_pdf_render_pool_renders_in_workers_with_fallback_and_timeout():
+    from models.pdf_pool import PDFRenderPool, PDFRenderTimeout
+    patient = {"mr_no": 7, "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+               "gender": "Male", "age": 30, "doctor": "Dr. Ahmed", "tests": "ESR", "amount": 500}
+    pool = PDFRenderPool(workers=1, queue_size=1, timeout=60)
+    try:
+        assert pool.render(patient, "receipt").startswith(b"%PDF")
+        assert pool.inline_renders == 0
+
+        pool._slots.acquire()             # queue full: rendered on the calling thread instead
+        try:
+            assert pool.render(patient, "lab_report").startswith(b"%PDF")
+        finally:
+            pool._slots.release()
+        assert pool.inline_renders == 1
+
+        batch = [dict(patient, mr_no=n) for n in (1, 2, 3)]
+        rendered = list(pool.render_many(batch, "receipt"))
+        assert [p["mr_no"] for p, _ in rendered] == [1, 2, 3]
+        assert all(pdf.startswith(b"%PDF") for _, pdf in rendered)
+        assert pool.inline_renders == 1
+
+        pool.timeout = 0.001
+        workers = list(pool._executor._processes.values())
+        with pytest.raises(PDFRenderTimeout):
+            pool.render(patient, "receipt")
+        assert pool._executor is None     # the stuck pool is discarded ...
+        for process in workers:
+            process.join(5)
+            assert not process.is_alive()
+        pool.timeout = 60
+        assert pool.render(patient, "receipt").startswith(b"%PDF")   # ... and replaced
+    finally:
+        pool.shutdown()
+
+def test_pdf_jobs_queue_poll_and_download(client):
+    import time
+    from models.patient_model import Patient
+    patient = {
+        "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+        "gender": "Male", "age": "30", "doctor": "Dr. Ahmed", "tests": "ESR", "amount": "500",
+    }
+    mr_no = Patient.add_patient(patient)["mr_no"]
+
+    response = client.post("/patients/pdf-jobs", json={"mr_no": mr_no, "type": "lab_report"})
+    assert response.status_code == 202
+    job = response.get_json()["data"]
+    assert response.headers["Location"] == job["status_url"] == f"/patients/pdf-jobs/{job['id']}"
+    deadline = time.time() + 30
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.02)
+        job = client.get(job["status_url"]).get_json()["data"]
+    assert job["status"] == "done" and job["error"] is None
+
+    pdf = client.get(job["download_url"])
+    assert pdf.status_code == 200 and pdf.data.startswith(b"%PDF")
+    # The rendered file is the one the direct route serves
+    assert client.get(f"/patients/{mr_no}/lab-report").headers["ETag"] == pdf.headers["ETag"]
+    again = client.post("/patients/pdf-jobs", json={"mr_no": mr_no, "type": "lab_report"}).get_json()["data"]
+    assert again["status"] == "done" and again["id"] != job["id"]
+
+    assert client.post("/patients/pdf-jobs", json={"mr_no": "x"}).status_code == 400
+    assert client.post("/patients/pdf-jobs", data={"mr_no": mr_no, "type": "invoice"}).status_code == 400
+    assert client.post("/patients/pdf-jobs", json={"mr_no": 999999}).status_code == 404
+    assert client.get("/patients/pdf-jobs/nope").status_code == 404
+
+    assert Patient.update_patient(mr_no, dict(patient, name="Ali Raza"))["success"]
+    assert client.get(job["download_url"]).status_code == 410
+
+def test_pdf_job_failures_are_reported_and_history_is_bounded():
+    from models.pdf_cache import PDFKey
+    from models.pdf_jobs import PDFJobQueue
+    stored = {}
+    class Store:
+        def get(self, key):
+            return stored.get(key.digest)
+        def put(self, key, data):
+            stored[key.digest] = data
+    def render(patient, pdf_type):
+        if patient["mr_no"] == 2:
+            raise ValueError("layout failed")
+        return b"%PDF"
+    queue = PDFJobQueue(render, Store(), threads=1, history=2)
+    jobs = [queue.submit({"mr_no": n}, PDFKey(n, "receipt", str(n))) for n in (1, 2)]
+    queue.shutdown()
+    assert [(j.status, j.error) for j in jobs] == [("done", None), ("failed", "layout failed")]
+
+    third = queue.submit({"mr_no": 3}, PDFKey(3, "receipt", "1"))   # already stored
+    assert third.status == "done"
+    assert queue.get(jobs[0].id) is None and queue.get(third.id) is third
+
+def test_batch_receipts_as_one_pdf_or_zip(client):
+    import io
+    import re
+    import zipfile
+    mr_nos = add_patients(3, reg_date="2024-05-02")
+    add_patients(1, reg_date="2024-05-03")
+
+    response = client.get("/patients/receipts/batch?date=2024-05-02")
+    assert response.status_code == 200 and response.mimetype == "application/pdf"
+    assert len(re.findall(rb"/Type /Page\b", response.data)) == 3
+    assert b"/Subtype /Form" in response.data      # one letterhead shared by every receipt
+
+    # Cached receipts are reused, the rest are rendered and cached
+    client.get(f"/patients/{mr_nos[0]}/receipt")
+    response = client.get(f"/patients/receipts/batch?format=zip&mr_no={mr_nos[2]},{mr_nos[0]}&mr_no=999999")
+    assert response.status_code == 200 and response.mimetype == "application/zip"
+    assert 'filename="receipts_selection.zip"' in response.headers["Content-Disposition"]
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == sorted(f"receipt_{n}.pdf" for n in (mr_nos[0], mr_nos[2]))
+    assert all(archive.read(name).startswith(b"%PDF") for name in archive.namelist())
+    assert len(os.listdir(pdf_cache.directory)) == 2
+
+    assert client.get("/patients/receipts/batch?date=2023-01-01").status_code == 404
+    assert client.get("/patients/receipts/batch").status_code == 400
+    assert client.get("/patients/receipts/batch?date=2024-05-02&mr_no=1").status_code == 400
+    assert client.get("/patients/receipts/batch?mr_no=abc").status_code == 400
+    assert client.get("/patients/receipts/batch?date=2024-05-02&format=tar").status_code == 400
+
+def test_batch_receipt_zip_lists_failed_receipts(monkeypatch):
+    import io
+    import zipfile
+    from models.pdf_pool import PDFRenderError
+    from routes import patients as patients_routes
+    def render_many(patients, pdf_type):
+        for patient in patients:
+            yield patient, PDFRenderError("layout failed") if patient["mr_no"] == 2 else b"%PDF-1.4"
+    monkeypatch.setattr(pdf_render_pool, "render_many", render_many)
+    monkeypatch.setattr(pdf_cache, "get", lambda key: None)
+    monkeypatch.setattr(pdf_cache, "put", lambda key, data: None)
+
+    patients = [{"mr_no": n, "name": "Ali"} for n in (1, 2)]
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(patients_routes._receipt_zip_chunks(patients))))
+    assert archive.namelist() == ["receipt_1.pdf", "ERRORS.txt"]
+    assert "2: layout failed" in archive.read("ERRORS.txt").decode()
+
+def test_letterhead_is_prepared_once_and_shared_by_pages(monkeypatch):
+    import re
+    import models.letterhead as letterhead
+    from routes.patients import PDFGenerator
+    loads = []
+    load_logo = letterhead._load_logo
+    monkeypatch.setattr(letterhead, "_logo_jpeg", None)
+    monkeypatch.setattr(letterhead, "_load_logo", lambda: loads.append(1) or load_logo())
+
+    patient = {"mr_no": 7, "reg_date": "2024-03-01", "reporting_date": "2024-03-02", "name": "Ali Khan",
+               "gender": "Male", "age": 30, "doctor": "Dr. Ahmed", "tests": "ESR, " * 3000, "amount": 500}
+    for kind in ("receipt", "lab_report", "receipt"):
+        result = PDFGenerator().generate_pdf(patient, kind)
+        assert result["success"], result
+    pdf = result["buffer"].getvalue()
+
+    assert loads == [1]
+    pages = len(re.findall(rb"/Type /Page\b", pdf))
+    assert pages > 1
+    # One logo image and one letterhead form, referenced from every page
+    assert pdf.count(b"/Subtype /Image") == 1
+    assert pdf.count(b"/Subtype /Form") == 1
+    assert len(pdf) < 100000